@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.accounts import presence
+
+
+class Command(BaseCommand):
+    help = "Keshdagi faollik (presence) vaqtlarini CustomUser.last_activity ga bitta UPDATE bilan yozadi."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep', type=float, default=None,
+                            help="Yozishlar orasidagi vaqt (soniya), standart PRESENCE['FLUSH_INTERVAL']")
+        parser.add_argument('--once', action='store_true', help="Bir marta yozib chiqish")
+
+    def handle(self, *args, **options):
+        interval = options['sleep'] or presence._config('FLUSH_INTERVAL')
+        while True:
+            written = presence.flush()
+            if written:
+                self.stdout.write(f"Flushed last_activity of {written} users")
+
+            if options['once']:
+                break
+            time.sleep(interval)
@@ -0,0 +1,149 @@
+"""
+Presence (who is online).
+
+Heartbeats go to the shared cache, one key per user holding the time of the
+last request. Each worker throttles its own cache writes per user, so a
+student polling every few seconds costs one cache SET per WRITE_INTERVAL and
+no database writes at all.
+
+Online index: a user is also put in the bucket of the current minute of
+their role - a counter key plus one slot key per entry, filled with
+cache.incr so workers never overwrite each other - at most once a minute
+per worker. The online endpoints read the buckets of the window and then the
+presence keys of those users only, so a tick costs three cache round trips
+sized by the users online, not by the whole roster.
+
+CustomUser.last_activity is still kept for history, but it is written in
+bulk by the flush_presence command (a Procfile process): every
+FLUSH_INTERVAL it reads the users seen since its last run from the same
+index and writes them with a single UPDATE. Nothing is buffered in the web
+workers, so a restart loses nothing.
+
+All of this needs a cache shared by every process (Redis). Without one
+(STORE 'db', the default when REDIS_URL is unset) the web, stream and
+flush_presence processes would each see only their own heartbeats, so the
+heartbeat writes last_activity directly (still throttled per WRITE_INTERVAL)
+and the online endpoints read it back from the database.
+"""
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Case, When, Value, DateTimeField
+
+PRESENCE_KEY = 'presence:user:{user_id}'
+BUCKET_KEY = 'presence:online:{role}:{minute}'          # number of slots
+SLOT_KEY = 'presence:online:{role}:{minute}:{slot}'     # user id
+FLUSHED_KEY = 'presence:flushed_at'
+
+DEFAULTS = {
+    'WRITE_INTERVAL': 15,   # min seconds between cache writes for one user (per process)
+    'FLUSH_INTERVAL': 60,   # seconds between bulk last_activity updates (flush_presence)
+    'TTL': 15 * 60,         # presence and index key lifetime, must exceed any "online" window
+    'STORE': 'cache',       # 'db' when the cache isn't shared between processes
+}
+
+_lock = threading.Lock()
+_last_written = {}   # user_id -> ts of the last cache write from this process
+_pruned_minute = 0
+
+
+def _config(name):
+    return getattr(settings, 'PRESENCE', {}).get(name, DEFAULTS[name])
+
+
+def _incr(key, timeout):
+    cache.add(key, 0, timeout=timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # expired between add() and incr()
+        cache.set(key, 1, timeout=timeout)
+        return 1
+
+
+def heartbeat(user_id, role='student', now=None):
+    """Record that a user is active. Cheap enough to call on every request."""
+    global _pruned_minute
+    now = now or time.time()
+    minute = int(now // 60)
+
+    with _lock:
+        previous = _last_written.get(user_id, 0)
+        if now - previous < _config('WRITE_INTERVAL'):
+            return
+        _last_written[user_id] = now
+        if minute != _pruned_minute:
+            # forget users idle for a while so the dict doesn't grow forever
+            _pruned_minute = minute
+            stale = now - _config('TTL')
+            for uid in [uid for uid, ts in _last_written.items() if ts < stale]:
+                del _last_written[uid]
+
+    if _config('STORE') == 'db':
+        get_user_model().objects.filter(pk=user_id).update(last_activity=_to_datetime(now))
+        return
+
+    ttl = _config('TTL')
+    cache.set(PRESENCE_KEY.format(user_id=user_id), now, timeout=ttl)
+    if int(previous // 60) != minute:
+        slot = _incr(BUCKET_KEY.format(role=role, minute=minute), timeout=ttl)
+        cache.set(SLOT_KEY.format(role=role, minute=minute, slot=slot), user_id, timeout=ttl)
+
+
+def _indexed_users(roles, since):
+    """Ids of users put in the index of `roles` since the minute of `since`."""
+    minutes = range(int(since // 60), int(time.time() // 60) + 1)
+    sizes = cache.get_many([BUCKET_KEY.format(role=role, minute=m) for role in roles for m in minutes])
+    slots = [f'{bucket}:{slot}' for bucket, size in sizes.items() for slot in range(1, size + 1)]
+    return set(cache.get_many(slots).values()) if slots else set()
+
+
+def _last_seen(user_ids, since):
+    """{user_id: ts} of the users whose presence key is at or after `since`."""
+    keys = {PRESENCE_KEY.format(user_id=user_id): user_id for user_id in user_ids}
+    seen = cache.get_many(keys.keys()) if keys else {}
+    return {keys[key]: ts for key, ts in seen.items() if ts >= since}
+
+
+def flush():
+    """
+    Write the heartbeats since the previous flush to CustomUser.last_activity
+    with one UPDATE. Returns the number of users written.
+    """
+    if _config('STORE') == 'db':
+        return 0  # written by the heartbeats themselves
+    now = time.time()
+    since = max(cache.get(FLUSHED_KEY) or 0, now - _config('TTL'))
+    User = get_user_model()
+    pending = _last_seen(_indexed_users([role for role, _ in User.USER_ROLES], since), since)
+    cache.set(FLUSHED_KEY, now, timeout=None)
+
+    if not pending:
+        return 0
+
+    whens = [When(pk=user_id, then=Value(_to_datetime(ts))) for user_id, ts in pending.items()]
+    return User.objects.filter(pk__in=list(pending)).update(
+        last_activity=Case(*whens, output_field=DateTimeField())
+    )
+
+
+def _to_datetime(ts):
+    return datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+
+
+def online_users(window=300, role='student'):
+    """{user_id: last_seen datetime} of users seen in the last `window` seconds."""
+    since = time.time() - window
+    if _config('STORE') == 'db':
+        rows = get_user_model().objects.filter(role=role, last_activity__gte=_to_datetime(since))
+        return dict(rows.values_list('id', 'last_activity'))
+    seen = _last_seen(_indexed_users([role], since), since)
+    return {user_id: _to_datetime(ts) for user_id, ts in seen.items()}
+
+
+def online_count(window=300, role='student'):
+    return len(online_users(window, role))
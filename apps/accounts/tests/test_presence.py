@@ -0,0 +1,73 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from apps.accounts import presence
+
+User = get_user_model()
+
+
+@override_settings(PRESENCE={'STORE': 'cache'})
+class PresenceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        presence._last_written.clear()
+        self.client = APIClient()
+        self.student = User.objects.create_user(username="student", password="password123", role="student")
+        self.admin = User.objects.create_user(username="admin", password="password123", role="admin", is_staff=True)
+
+    def test_requests_mark_user_online_without_db_writes(self):
+        self.client.force_authenticate(user=self.student)
+        self.client.get('/api/tests/')
+        self.student.refresh_from_db()
+        self.assertIsNone(self.student.last_activity)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get('/api/monitoring/stats/online/')
+        self.assertEqual([u['id'] for u in response.data], [self.student.id])
+        self.assertEqual(self.client.get('/api/monitoring/stats/').data['online_users'], 1)
+
+    def test_flush_writes_last_activity_in_bulk(self):
+        presence.heartbeat(self.student.id)
+        presence.heartbeat(self.student.id)  # throttled
+        presence.heartbeat(self.admin.id, 'admin')
+        self.assertEqual(presence.flush(), 2)
+        self.student.refresh_from_db()
+        self.assertIsNotNone(self.student.last_activity)
+        self.assertEqual(presence.flush(), 0)
+
+    def test_online_index_reads_only_recent_users(self):
+        idle = User.objects.create_user(username="idle", password="password123", role="student")
+        presence.heartbeat(idle.id, now=time.time() - 6 * 60)
+        presence.heartbeat(self.student.id)
+        presence.heartbeat(self.admin.id, 'admin')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(list(presence.online_users(window=5 * 60)), [self.student.id])
+        self.assertEqual(list(presence.online_users(window=5 * 60, role='admin')), [self.admin.id])
+        self.assertEqual(presence.online_count(window=10 * 60), 2)
+
+
+@override_settings(PRESENCE={'STORE': 'db'})
+class PresenceWithoutSharedCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        presence._last_written.clear()
+        self.client = APIClient()
+        self.student = User.objects.create_user(username="student", password="password123", role="student")
+        self.admin = User.objects.create_user(username="admin", password="password123", role="admin", is_staff=True)
+
+    def test_heartbeat_writes_last_activity_directly(self):
+        self.client.force_authenticate(user=self.student)
+        self.client.get('/api/tests/')
+        self.student.refresh_from_db()
+        self.assertIsNotNone(self.student.last_activity)
+        self.assertEqual(presence.flush(), 0)
+
+        # another process (e.g. the stream) sees the user without sharing the cache
+        cache.clear()
+        self.assertEqual(list(presence.online_users(window=5 * 60)), [self.student.id])
+        self.assertEqual(presence.online_count(window=5 * 60, role='admin'), 0)
@@ -0,0 +1,231 @@
+"""
+Request metrics in the Prometheus text format.
+
+MetricsMiddleware records, per view (DRF viewset action such as
+'tests.start_test', or the view class/function name otherwise) and HTTP
+method: request count by status class, a latency histogram, the number of
+DB queries and the time spent in them (connection.execute_wrapper).
+
+Aggregation is in-process (a dict and a lock per request, no I/O). Every
+worker writes its cumulative totals to its own file in METRICS_DIR at most
+every METRICS_FLUSH_INTERVAL seconds; /metrics merges all files, so the
+numbers are the same whichever gunicorn/uvicorn worker answers the scrape.
+Files of finished workers are kept (counters must not go backwards); the
+directory is expected to be emptied on deploy, like any temp dir.
+
+Latency is the time until the view has returned its response. For a
+streaming response (CSV/xlsx downloads, the results feed) that is the time
+to the first byte - the body is produced after the middleware has returned.
+Views in METRICS_EXCLUDE_VIEWS are not recorded at all: the SSE stream stays
+open for minutes and would only skew the histogram.
+
+The middleware is sync and async capable. Under ASGI (the `stream` process)
+queries run in sync_to_async threads the execute_wrapper can't see, so
+requests there are counted and timed with no DB figures.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_stats = {}  # "view|method" -> totals, see _empty()
+_last_flush = 0.0
+_file = {}  # pid -> file name; a forked worker (gunicorn --preload) gets its own
+
+
+def get_metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None) or os.path.join(tempfile.gettempdir(), 'web2_metrics')
+
+
+def _file_name():
+    pid = os.getpid()
+    if pid not in _file:
+        _file.clear()
+        _file[pid] = f"{pid}_{uuid.uuid4().hex[:8]}.json"
+    return _file[pid]
+
+
+def _flush_interval():
+    return getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+
+
+def _excluded_views():
+    return getattr(settings, 'METRICS_EXCLUDE_VIEWS', ('monitoring.monitoring_stream',))
+
+
+def _empty():
+    return {'statuses': {}, 'sum': 0.0, 'buckets': [0] * (len(BUCKETS) + 1), 'db_queries': 0, 'db_seconds': 0.0}
+
+
+def view_label(request):
+    """'tests.start_test' for a viewset action, 'monitoring.MassControlView' for other views."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    func = match.func
+    view = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    module = getattr(view or func, '__module__', '')
+    app = module.split('.')[1] if module.startswith('apps.') else module.split('.')[0]
+    actions = getattr(func, 'actions', None)
+    if actions:
+        return f"{app}.{actions.get(request.method.lower(), request.method.lower())}"
+    return f"{app}.{view.__name__ if view else func.__name__}"
+
+
+def record(view, method, status_code, seconds, db_queries=0, db_seconds=0.0):
+    if view in _excluded_views():
+        return
+    key = f"{view}|{method}"
+    status_class = f"{status_code // 100}xx"
+    bucket = next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))
+    with _lock:
+        stats = _stats.get(key)
+        if stats is None:
+            stats = _stats[key] = _empty()
+        stats['statuses'][status_class] = stats['statuses'].get(status_class, 0) + 1
+        stats['sum'] += seconds
+        stats['buckets'][bucket] += 1
+        stats['db_queries'] += db_queries
+        stats['db_seconds'] += db_seconds
+    if time.monotonic() - _last_flush > _flush_interval():
+        flush()
+
+
+def flush():
+    """Write this process's totals to its file (atomic replace)."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    with _lock:
+        data = json.dumps(_stats)
+    metrics_dir = get_metrics_dir()
+    try:
+        os.makedirs(metrics_dir, exist_ok=True)
+        path = os.path.join(metrics_dir, _file_name())
+        with open(path + '.tmp', 'w') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass  # metrics must never break a request
+
+
+atexit.register(flush)
+
+
+def collect():
+    """Totals of all workers (this one flushed first)."""
+    flush()
+    merged = {}
+    metrics_dir = get_metrics_dir()
+    try:
+        names = os.listdir(metrics_dir)
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(metrics_dir, name)) as f:
+                worker = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for key, stats in worker.items():
+            total = merged.setdefault(key, _empty())
+            for status_class, n in stats['statuses'].items():
+                total['statuses'][status_class] = total['statuses'].get(status_class, 0) + n
+            total['sum'] += stats['sum']
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], stats['buckets'])]
+            total['db_queries'] += stats['db_queries']
+            total['db_seconds'] += stats['db_seconds']
+    return merged
+
+
+def render(merged):
+    rows = [(*key.split('|'), stats) for key, stats in sorted(merged.items())]
+    lines = [
+        '# HELP http_requests_total Requests by view, method and status class.',
+        '# TYPE http_requests_total counter',
+    ]
+    for view, method, stats in rows:
+        for status_class, n in sorted(stats['statuses'].items()):
+            lines.append(f'http_requests_total{{view="{view}",method="{method}",status="{status_class}"}} {n}')
+
+    lines += [
+        '# HELP http_request_duration_seconds Request latency by view and method.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for view, method, stats in rows:
+        labels = f'view="{view}",method="{method}"'
+        cumulative = 0
+        for bound, n in zip(BUCKETS + ('+Inf',), stats['buckets']):
+            cumulative += n
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'http_request_duration_seconds_sum{{{labels}}} {stats["sum"]:.6f}')
+        lines.append(f'http_request_duration_seconds_count{{{labels}}} {cumulative}')
+
+    lines += [
+        '# HELP db_queries_total Database queries run by view and method.',
+        '# TYPE db_queries_total counter',
+    ]
+    for view, method, stats in rows:
+        lines.append(f'db_queries_total{{view="{view}",method="{method}"}} {stats["db_queries"]}')
+
+    lines += [
+        '# HELP db_query_duration_seconds_total Time spent in database queries by view and method.',
+        '# TYPE db_query_duration_seconds_total counter',
+    ]
+    for view, method, stats in rows:
+        lines.append(f'db_query_duration_seconds_total{{view="{view}",method="{method}"}} {stats["db_seconds"]:.6f}')
+    return '\n'.join(lines) + '\n'
+
+
+class _QueryTimer:
+    """connection.execute_wrapper hook: counts queries of one request and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        record(view_label(request), request.method, response.status_code,
+               time.perf_counter() - started, timer.count, timer.seconds)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        record(view_label(request), request.method, response.status_code, time.perf_counter() - started)
+        return response
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def copy_security_logs(apps, schema_editor):
+    # Violations used to be SystemLog rows with action "Security: <type>"
+    SystemLog = apps.get_model('logs', 'SystemLog')
+    Student = apps.get_model('students', 'Student')
+    ViolationEvent = apps.get_model('monitoring', 'ViolationEvent')
+    known = ('focus', 'fullscreen', 'camera', 'copy', 'face')
+
+    logs = SystemLog.objects.filter(action__startswith='Security:')
+    students = dict(
+        Student.objects.filter(user_id__in=logs.values('user_id')).values_list('user_id', 'id')
+    )
+    events = []
+    for log in logs.iterator():
+        label = log.action.split(':', 1)[1].lower()
+        violation_type = next((t for t in known if t in label), 'other')
+        events.append(ViolationEvent(
+            user_id=log.user_id, student_id=students.get(log.user_id), violation_type=violation_type,
+            details=log.details, ip_address=log.ip_address, created_at=log.timestamp,
+        ))
+    ViolationEvent.objects.bulk_create(events, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0008_latestsnapshot'),
+        ('students', '0004_student_camera_mode'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('results', '0004_gradingjob'),
+        ('monitoring', '0001_initial'),
+        ('logs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViolationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('violation_type', models.CharField(choices=[('focus', 'Oynadan chiqish'), ('fullscreen', "To'liq ekrandan chiqish"), ('camera', "Kamera o'chirildi"), ('copy', 'Nusxa olish'), ('face', 'Yuz aniqlanmadi'), ('other', 'Boshqa')], default='other', max_length=20)),
+                ('details', models.TextField(blank=True)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('client_timestamp', models.DateTimeField(blank=True, help_text='Brauzerdagi vaqt', null=True)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('student', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='violations', to='students.student')),
+                ('test', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='violations', to='tests.test')),
+                ('test_result', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='violations', to='results.testresult')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='violations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['test', 'created_at'], name='monitoring__test_id_74aeef_idx'), models.Index(fields=['test', 'violation_type'], name='monitoring__test_id_fc8912_idx'), models.Index(fields=['student', 'created_at'], name='monitoring__student_612108_idx')],
+            },
+        ),
+        migrations.RunPython(copy_security_logs, migrations.RunPython.noop),
+    ]
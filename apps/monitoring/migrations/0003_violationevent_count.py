@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0002_violationevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='violationevent',
+            name='count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='violationevent',
+            name='last_client_timestamp',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
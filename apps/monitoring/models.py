@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 class GlobalSetting(models.Model):
     key = models.CharField(max_length=50, unique=True)
@@ -20,3 +22,38 @@ class GlobalSetting(models.Model):
         obj, created = cls.objects.get_or_create(key=key)
         obj.value = str(value)
         obj.save()
+
+
+class ViolationEvent(models.Model):
+    """A proctoring violation reported by the exam page (focus loss, fullscreen exit, ...)."""
+    TYPE_CHOICES = (
+        ('focus', "Oynadan chiqish"),
+        ('fullscreen', "To'liq ekrandan chiqish"),
+        ('camera', "Kamera o'chirildi"),
+        ('copy', "Nusxa olish"),
+        ('face', "Yuz aniqlanmadi"),
+        ('other', "Boshqa"),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='violations')
+    student = models.ForeignKey('students.Student', on_delete=models.CASCADE, null=True, blank=True, related_name='violations')
+    test = models.ForeignKey('tests.Test', on_delete=models.CASCADE, null=True, blank=True, related_name='violations')
+    test_result = models.ForeignKey('results.TestResult', on_delete=models.SET_NULL, null=True, blank=True, related_name='violations')
+    violation_type = models.CharField(max_length=20, choices=TYPE_CHOICES, default='other')
+    details = models.TextField(blank=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    client_timestamp = models.DateTimeField(null=True, blank=True, help_text="Brauzerdagi vaqt")
+    # repeats of the same type within VIOLATION_DEDUPE_WINDOW are merged into one row
+    count = models.PositiveIntegerField(default=1)
+    last_client_timestamp = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['test', 'created_at']),
+            models.Index(fields=['test', 'violation_type']),
+            models.Index(fields=['student', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.created_at} - {self.user}: {self.violation_type}"
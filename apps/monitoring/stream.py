@@ -0,0 +1,204 @@
+"""
+Server-sent events for the monitoring dashboard.
+
+Instead of every open dashboard polling stats/online/live/alerts every 5s,
+each ASGI worker runs one ticker while at least one admin is connected. Per
+tick the monitoring state (views.build_*) is computed once - and shared
+through the cache, so several workers on the same tick compute it once too -
+then diffed against the previous tick, and the same encoded delta is pushed
+to every connected dashboard.
+
+Events:
+    snapshot  full state, sent on connect (and to a client that fell behind)
+    delta     {"stats": {...}, "alerts": [...], "live_count": n,
+               "online": {"upsert": [...], "remove": [ids]},
+               "live": {"upsert": [...], "remove": [student_ids]}}
+
+EventSource cannot send headers, and a JWT in the URL would end up in
+proxy logs, so the page first POSTs /api/monitoring/stream/ticket/ (JWT
+header) and connects with ?ticket=: a signed ticket that is only good for
+this stream, for MONITORING_STREAM_TICKET_AGE seconds and for one
+connection. The page gets a new ticket on every reconnect.
+
+Needs ASGI: the site itself runs on WSGI (Procfile `web`), this endpoint on
+the `stream` process (config.asgi under uvicorn workers), to which the proxy
+routes /api/monitoring/stream/ - or MONITORING_STREAM_URL points at it.
+Under WSGI the endpoint answers 501 and the page keeps polling.
+"""
+import asyncio
+import json
+import secrets
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+
+STATE_KEY = 'monitoring:stream:{tick}'
+TICKET_SALT = 'monitoring-stream'
+TICKET_USED_KEY = 'monitoring:stream:ticket:{nonce}'
+
+# Channels sent as keyed upsert/remove lists: channel -> key field
+KEYED_CHANNELS = {'online': 'id', 'live': 'student_id'}
+LIVE_LIMIT = 50  # first page of the live grid (LivePagination.page_size)
+QUEUE_SIZE = 20
+PING_INTERVAL = 15
+# Django 4.2 doesn't notice a client going away, so streams are recycled;
+# EventSource reconnects on its own after `retry` ms.
+MAX_STREAM_SECONDS = 5 * 60
+RETRY_MS = 3000
+
+
+def _tick_seconds():
+    return getattr(settings, 'MONITORING_STREAM_TICK', 3)
+
+
+def _ticket_age():
+    return getattr(settings, 'MONITORING_STREAM_TICKET_AGE', 30)
+
+
+def compute_state():
+    from .views import build_dashboard_stats, build_online_users, build_alerts, live_queryset, serialize_live
+    live = live_queryset()
+    state = {
+        'stats': build_dashboard_stats(),
+        'online': build_online_users(),
+        'live': serialize_live(live[:LIVE_LIMIT]),
+        'live_count': live.count(),
+        'alerts': build_alerts(),
+    }
+    # JSON round trip: what we diff is exactly what the client has
+    return json.loads(json.dumps(state, cls=DjangoJSONEncoder))
+
+
+def shared_state(tick):
+    """State of a tick, computed by the first worker that asks for it."""
+    key = STATE_KEY.format(tick=tick)
+    state = cache.get(key)
+    if state is None:
+        state = compute_state()
+        cache.set(key, state, timeout=_tick_seconds() * 3)
+    return state
+
+
+def diff_state(old, new):
+    """Delta that turns `old` into `new`; empty dict if nothing changed."""
+    delta = {}
+    for channel, value in new.items():
+        if channel in KEYED_CHANNELS:
+            field = KEYED_CHANNELS[channel]
+            before = {item[field]: item for item in old.get(channel, [])}
+            after = {item[field]: item for item in value}
+            upsert = [item for key, item in after.items() if before.get(key) != item]
+            remove = [key for key in before if key not in after]
+            if upsert or remove:
+                delta[channel] = {'upsert': upsert, 'remove': remove}
+        elif old.get(channel) != value:
+            delta[channel] = value
+    return delta
+
+
+def encode_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+class Hub:
+    """Per-process fan-out: one ticker, many subscriber queues."""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.state = None
+        self.task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.subscribers.add(queue)
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, payload):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # slow client: drop what it missed and resync it
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(encode_event('snapshot', self.state))
+
+    async def run(self):
+        tick_seconds = _tick_seconds()
+        try:
+            while self.subscribers:
+                tick = int(time.time() // tick_seconds)
+                state = await sync_to_async(shared_state)(tick)
+                if self.state is not None:
+                    delta = diff_state(self.state, state)
+                    self.state = state
+                    if delta:
+                        self.publish(encode_event('delta', delta))
+                else:
+                    self.state = state
+                await asyncio.sleep(tick_seconds - time.time() % tick_seconds)
+        finally:
+            self.state = None
+
+
+hub = Hub()
+
+
+def issue_ticket(user):
+    """Signed one-connection ticket for the stream of a staff user."""
+    return signing.dumps({'user': user.id, 'nonce': secrets.token_urlsafe(8)}, salt=TICKET_SALT)
+
+
+def _authenticate(ticket):
+    from django.contrib.auth import get_user_model
+    try:
+        payload = signing.loads(ticket, salt=TICKET_SALT, max_age=_ticket_age())
+    except signing.BadSignature:  # SignatureExpired included
+        return None
+    # a ticket opens one connection
+    if not cache.add(TICKET_USED_KEY.format(nonce=payload['nonce']), 1, timeout=_ticket_age()):
+        return None
+    user = get_user_model().objects.filter(id=payload['user']).first()
+    return user if user is not None and user.is_active and user.is_staff else None
+
+
+async def _events(queue, initial):
+    yield f"retry: {RETRY_MS}\n".encode()
+    yield encode_event('snapshot', initial)
+    deadline = time.monotonic() + MAX_STREAM_SECONDS
+    try:
+        while time.monotonic() < deadline:
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=PING_INTERVAL)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+    finally:
+        hub.unsubscribe(queue)
+
+
+async def monitoring_stream(request):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'SSE faqat ASGI rejimida ishlaydi'}, status=501)
+
+    user = await sync_to_async(_authenticate)(request.GET.get('ticket', ''))
+    if user is None:
+        return JsonResponse({'detail': 'Ruxsat yo\'q'}, status=403)
+
+    queue = hub.subscribe()
+    initial = hub.state or await sync_to_async(shared_state)(int(time.time() // _tick_seconds()))
+
+    response = StreamingHttpResponse(_events(queue, initial), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: don't buffer the stream
+    return response
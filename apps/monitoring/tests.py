@@ -0,0 +1,209 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from apps.groups.models import Group
+from apps.monitoring.stream import diff_state
+from apps.monitoring.views import build_dashboard_stats
+from apps.students.models import Student
+from apps.subjects.models import Subject
+from apps.tests.models import Test, TestAssignment
+
+User = get_user_model()
+
+
+class StreamDiffTest(SimpleTestCase):
+    def test_keyed_channels_send_upserts_and_removals(self):
+        old = {'stats': {'online_users': 2}, 'online': [{'id': 1, 'last_seen': 'a'}, {'id': 2, 'last_seen': 'a'}]}
+        new = {'stats': {'online_users': 2}, 'online': [{'id': 1, 'last_seen': 'b'}, {'id': 3, 'last_seen': 'b'}]}
+        delta = diff_state(old, new)
+        self.assertNotIn('stats', delta)
+        self.assertEqual(delta['online']['upsert'], new['online'])
+        self.assertEqual(delta['online']['remove'], [2])
+        self.assertEqual(diff_state(new, new), {})
+
+
+class StreamEndpointTest(TestCase):
+    def test_wsgi_falls_back_to_polling(self):
+        self.assertEqual(self.client.get('/api/monitoring/stream/').status_code, 501)
+
+    def test_ticket_opens_one_connection(self):
+        from django.core import signing
+        from rest_framework.test import APIClient
+        from apps.monitoring import stream
+
+        cache.clear()
+        client = APIClient()
+        student = User.objects.create_user(username="student", password="password123", role="student")
+        client.force_authenticate(user=student)
+        self.assertEqual(client.post('/api/monitoring/stream/ticket/').status_code, 403)
+
+        admin = User.objects.create_user(username="admin", password="password123", role="admin", is_staff=True)
+        client.force_authenticate(user=admin)
+        data = client.post('/api/monitoring/stream/ticket/').data
+        self.assertEqual(data['url'], '/api/monitoring/stream/')
+        self.assertEqual(stream._authenticate(data['ticket']), admin)
+        self.assertIsNone(stream._authenticate(data['ticket']))  # already used
+        # a value signed for something else isn't a ticket
+        self.assertIsNone(stream._authenticate(signing.dumps({'user': admin.id, 'nonce': 'x'})))
+
+
+@override_settings(PRESENCE={'STORE': 'cache'})
+class DashboardStatsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        subject = Subject.objects.create(name="Fizika", code="FIZ", courses="1", directions="CS")
+        now = timezone.now()
+        self.test = Test.objects.create(
+            title="Oraliq", subject=subject, duration=30, status='active',
+            start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=1)
+        )
+        for g in range(2):
+            group = Group.objects.create(name=f"G-{g}", course=1, direction="CS", education_form="kunduzgi")
+            TestAssignment.objects.create(test=self.test, group=group)
+            for i in range(3):
+                user = User.objects.create_user(username=f"s{g}{i}", password="password123", role="student")
+                Student.objects.create(
+                    user=user, student_id=f"S-{g}-{i}", full_name="Talaba", group=group,
+                    course=1, direction="CS", education_form="kunduzgi", phone="1"
+                )
+
+    def test_active_exams_in_one_query_and_cached(self):
+        with self.assertNumQueries(1):  # annotated tests (presence is read from the cache index)
+            stats = build_dashboard_stats()
+        exam = stats['active_exams'][0]
+        self.assertEqual((exam['subject'], exam['group_count'], exam['student_count']), ("Fizika", 2, 6))
+        with self.assertNumQueries(0):
+            build_dashboard_stats()
+
+
+class ViolationEventTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        cache.clear()
+        self.client = APIClient()
+        group = Group.objects.create(name="G-1", course=1, direction="CS", education_form="kunduzgi")
+        self.user = User.objects.create_user(username="student", password="password123", role="student")
+        self.student = Student.objects.create(
+            user=self.user, student_id="S-1", full_name="Talaba", group=group,
+            course=1, direction="CS", education_form="kunduzgi", phone="1"
+        )
+        subject = Subject.objects.create(name="Fizika", code="FIZ", courses="1", directions="CS")
+        now = timezone.now()
+        self.test = Test.objects.create(
+            title="Oraliq", subject=subject, duration=30, status='active',
+            start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=1)
+        )
+        from apps.results.models import TestResult
+        TestResult.objects.create(student=self.student, test=self.test, score=0, max_score=50, percentage=0,
+                                  status='in_progress', started_at=now)
+
+    def test_report_is_typed_and_summarized(self):
+        self.client.force_authenticate(user=self.user)
+        for kind in ('focus', 'focus', 'Fullscreen exit'):
+            self.client.post('/api/monitoring/report/', {'type': kind, 'test': self.test.id, 'client_ts': 1700000000000})
+
+        admin = User.objects.create_user(username="admin", password="password123", role="admin", is_staff=True)
+        self.client.force_authenticate(user=admin)
+        summary = self.client.get('/api/monitoring/violations/', {'test': self.test.id}).data
+        # the second focus report falls in the dedupe window of the first
+        self.assertEqual(summary['by_type'][0], {'violation_type': 'focus', 'count': 2, 'rows': 1})
+        self.assertEqual(summary['by_student'][0]['count'], 3)
+
+        alerts = self.client.get('/api/monitoring/alerts/').data
+        self.assertEqual(alerts[0]['type'], 'fullscreen')
+        self.assertEqual(alerts[0]['student_name'], "Talaba")
+
+    def test_batch_collapses_repeats_within_window(self):
+        from apps.monitoring.models import ViolationEvent
+        self.client.force_authenticate(user=self.user)
+        base = 1700000000000
+        events = [{'type': 'focus', 'client_ts': base + i * 1000} for i in range(10)]
+        events.append({'type': 'focus', 'client_ts': base + 120 * 1000})  # outside the window
+        events.append({'type': 'camera', 'client_ts': base})
+        with self.assertNumQueries(2):  # open attempt + one bulk insert
+            response = self.client.post('/api/monitoring/report/batch/',
+                                        {'test': self.test.id, 'events': events}, format='json')
+        self.assertEqual((response.data['created'], response.data['merged']), (3, 9))
+        self.assertEqual(
+            sorted(ViolationEvent.objects.values_list('violation_type', 'count')),
+            [('camera', 1), ('focus', 1), ('focus', 10)]
+        )
+
+        # the next batch continues the newest open focus row
+        self.client.post('/api/monitoring/report/batch/',
+                         {'test': self.test.id, 'events': [{'type': 'focus'}]}, format='json')
+        self.assertEqual(ViolationEvent.objects.count(), 3)
+        self.assertEqual(ViolationEvent.objects.filter(violation_type='focus').order_by('-id').first().count, 2)
+
+    def test_unknown_test_and_bad_filters_are_rejected(self):
+        from apps.monitoring.models import ViolationEvent
+        other = Test.objects.create(title="Boshqa", subject=self.test.subject, duration=30, status='active',
+                                    start_date=self.test.start_date, end_date=self.test.end_date)
+        self.client.force_authenticate(user=self.user)
+        for test_id in (999999, other.id):  # no such test / not one the student is taking
+            response = self.client.post('/api/monitoring/report/batch/',
+                                        {'test': test_id, 'events': [{'type': 'focus'}]}, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(ViolationEvent.objects.exists())
+
+        admin = User.objects.create_user(username="admin", password="password123", role="admin", is_staff=True)
+        self.client.force_authenticate(user=admin)
+        for url in ('/api/monitoring/violations/', '/api/monitoring/progress/', '/api/monitoring/snapshots/archives/'):
+            self.assertEqual(self.client.get(url, {'test': 'abc'}).status_code, 400, url)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        from apps.monitoring import metrics
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        overrides = override_settings(METRICS_DIR=self.dir.name, METRICS_TOKEN='secret')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        metrics._stats.clear()
+        self.auth = {'HTTP_AUTHORIZATION': 'Bearer secret'}
+
+    def test_views_are_labelled_and_workers_merged(self):
+        import json
+        import os
+        from rest_framework.test import APIClient
+        api = APIClient()
+        api.force_authenticate(User.objects.create_user(username="admin", password="password123", is_staff=True))
+        self.assertEqual(api.get('/api/tests/').status_code, 200)
+
+        # totals flushed by another worker
+        other = {'tests.list|GET': {'statuses': {'2xx': 2}, 'sum': 0.5, 'buckets': [0] * 11 + [2],
+                                    'db_queries': 4, 'db_seconds': 0.01}}
+        with open(os.path.join(self.dir.name, 'other.json'), 'w') as f:
+            json.dump(other, f)
+
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        body = self.client.get('/metrics', **self.auth).content.decode()
+        self.assertIn('http_requests_total{view="tests.list",method="GET",status="2xx"} 3', body)
+        self.assertIn('http_request_duration_seconds_count{view="tests.list",method="GET"} 3', body)
+        self.assertIn('http_request_duration_seconds_bucket{view="tests.list",method="GET",le="+Inf"} 3', body)
+        self.assertRegex(body, r'db_queries_total\{view="tests.list",method="GET"\} ([5-9]|\d\d)')
+
+    def test_async_requests_are_timed_and_stream_excluded(self):
+        from asgiref.sync import async_to_sync, iscoroutinefunction
+        from django.http import HttpResponse
+        from django.test import AsyncRequestFactory
+        from django.urls import resolve
+        from apps.monitoring import metrics
+
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = metrics.MetricsMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        for path in ('/api/tests/', '/api/monitoring/stream/'):
+            request = AsyncRequestFactory().get(path)
+            request.resolver_match = resolve(path)
+            async_to_sync(middleware)(request)
+        self.assertEqual(list(metrics._stats), ['tests.list|GET'])
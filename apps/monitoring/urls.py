@@ -2,20 +2,34 @@ from django.urls import path
 from .views import (
     DashboardStatsView,
     SecurityAlertView,
+    ViolationSummaryView,
     MassControlView,
     ReportViolationView,
+    ReportViolationBatchView,
     monitoring_page_view,
     OnlineUsersDetailView,
     GlobalSettingsView,
-    LiveProctoringView
+    LiveProctoringView,
+    ExamProgressView,
+    SnapshotArchiveView,
+    SnapshotFrameView,
+    StreamTicketView
 )
+from .stream import monitoring_stream
 
 urlpatterns = [
     path('stats/', DashboardStatsView.as_view(), name='dashboard-stats'),
     path('stats/online/', OnlineUsersDetailView.as_view(), name='online-users-detail'),
     path('alerts/', SecurityAlertView.as_view(), name='security-alerts'),
+    path('violations/', ViolationSummaryView.as_view(), name='violation-summary'),
     path('control/', MassControlView.as_view(), name='mass-control'),
     path('report/', ReportViolationView.as_view(), name='report-violation'),
+    path('report/batch/', ReportViolationBatchView.as_view(), name='report-violation-batch'),
     path('settings/', GlobalSettingsView.as_view(), name='global-settings'),
     path('live/', LiveProctoringView.as_view(), name='live-proctoring'),
+    path('progress/', ExamProgressView.as_view(), name='exam-progress'),
+    path('stream/', monitoring_stream, name='monitoring-stream'),
+    path('stream/ticket/', StreamTicketView.as_view(), name='monitoring-stream-ticket'),
+    path('snapshots/archives/', SnapshotArchiveView.as_view(), name='snapshot-archives'),
+    path('snapshots/archives/<int:pk>/frames/<int:index>/', SnapshotFrameView.as_view(), name='snapshot-frame'),
 ]
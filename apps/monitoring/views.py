@@ -1,97 +1,173 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import permissions, status
+from rest_framework import permissions, status, pagination
 from django.utils import timezone
-from django.db.models import Q
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Count
 from datetime import timedelta
 from apps.tests.models import Test
-from apps.logs.models import SystemLog
+
+STATS_CACHE_KEY = 'monitoring:dashboard_stats'
+
+def build_dashboard_stats():
+    """
+    Dashboard counters. Active exams come from one annotated query (subject
+    name, group and student counts in SQL); the whole result is cached for
+    MONITORING_STATS_TTL seconds and shared by every admin session.
+    """
+    data = cache.get(STATS_CACHE_KEY)
+    if data is not None:
+        return data
+
+    now = timezone.now()
+
+    # 1. Online Users (Active in last 5 mins), from the presence cache
+    from apps.accounts import presence
+    online_count = presence.online_count(window=5 * 60)
+
+    # 2. Active Exams
+    active_exams_data = list(
+        Test.objects.filter(status='active', start_date__lte=now, end_date__gte=now)
+        .annotate(
+            subject_name=F('subject__name'),
+            group_count=Count('groups', distinct=True),
+            student_count=Count('groups__students', distinct=True),
+        )
+        .order_by('start_date', 'id')
+        .values('id', 'title', 'subject_name', 'group_count', 'student_count', 'start_date', 'end_date')
+    )
+    for exam in active_exams_data:
+        exam['subject'] = exam.pop('subject_name')
+
+    # Start-of-exam admission queue (apps/tests/admission.py)
+    from apps.tests.admission import get_admission_stats
+    admission = get_admission_stats([t['id'] for t in active_exams_data])
+    for exam in active_exams_data:
+        exam.update(admission.get(exam['id'], {}))
+
+    data = {
+        'online_users': online_count,
+        'active_exams': active_exams_data,
+        'active_exams_count': len(active_exams_data)
+    }
+    cache.set(STATS_CACHE_KEY, data, timeout=getattr(settings, 'MONITORING_STATS_TTL', 5))
+    return data
+
+def build_online_users():
+    # Get users active in last 5 mins (presence cache), then load only those
+    from django.contrib.auth import get_user_model
+    from apps.accounts import presence
+    User = get_user_model()
+    last_seen = presence.online_users(window=5 * 60)
+    users = User.objects.filter(id__in=list(last_seen)).select_related('student_profile__group')
+    users = sorted(users, key=lambda u: last_seen[u.id], reverse=True)
+
+    online_users_data = []
+    for user in users:
+        group_name = "-"
+        # Try to get group if student
+        if hasattr(user, 'student_profile') and user.student_profile.group:
+            group_name = user.student_profile.group.name
+
+        online_users_data.append({
+            'id': user.id,
+            'full_name': f"{user.first_name} {user.last_name}",
+            'username': user.username,
+            'role': user.role,
+            'group': group_name,
+            'last_seen': last_seen[user.id],
+            'ip': None # IP tracking needs middleware or dedicated logic if strict requirement
+        })
+    return online_users_data
 
 class DashboardStatsView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def get(self, request):
-        now = timezone.now()
-        five_mins_ago = now - timedelta(minutes=5)
-
-        # 1. Online Users (Active in last 5 mins)
-        # Using the new last_activity field
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        online_count = User.objects.filter(last_activity__gte=five_mins_ago, role='student').count()
-
-        # 2. Active Exams
-        active_exams = Test.objects.filter(status='active', start_date__lte=now, end_date__gte=now)
-        active_exams_data = [{
-            'id': t.id,
-            'title': t.title,
-            'subject': t.subject.name,
-            'group_count': t.groups.count(),
-            'start_date': t.start_date,
-            'end_date': t.end_date,
-            # 'student_count': ... (Calculate if needed, heavy query)
-        } for t in active_exams]
-
-        return Response({
-            'online_users': online_count,
-            'active_exams': active_exams_data,
-            'active_exams_count': active_exams.count()
-        })
+        return Response(build_dashboard_stats())
 
 class OnlineUsersDetailView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def get(self, request):
-        now = timezone.now()
-        five_mins_ago = now - timedelta(minutes=5)
+        return Response(build_online_users())
 
-        # Get users active in last 5 mins
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        users = User.objects.filter(last_activity__gte=five_mins_ago, role='student').select_related('student_profile__group').order_by('-last_activity')
-        
-        online_users_data = []
-        for user in users:
-            group_name = "-"
-            # Try to get group if student
-            if hasattr(user, 'student_profile') and user.student_profile.group:
-                group_name = user.student_profile.group.name
-
-            online_users_data.append({
-                'id': user.id,
-                'full_name': f"{user.first_name} {user.last_name}",
-                'username': user.username,
-                'role': user.role,
-                'group': group_name,
-                'last_seen': user.last_activity,
-                'ip': None # IP tracking needs middleware or dedicated logic if strict requirement
-            })
-        
-        return Response(online_users_data)
+def id_param(request, name):
+    """Positive integer ?name= filter, None if absent. Raises ValueError otherwise."""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    if not value.isdigit():
+        raise ValueError(name)
+    return int(value)
+
+def bad_param(error):
+    return Response({'error': f"{error} parametri noto'g'ri"}, status=status.HTTP_400_BAD_REQUEST)
+
+def serialize_violation(event):
+    return {
+        'id': event.id,
+        'user': event.user.username if event.user else 'Unknown',
+        'student_name': event.student.full_name if event.student else None,
+        'test_id': event.test_id,
+        'test_title': event.test.title if event.test else None,
+        'type': event.violation_type,
+        'action': f"Security: {event.get_violation_type_display()}",
+        'details': event.details,
+        'count': event.count,
+        'ip': event.ip_address,
+        'client_timestamp': event.client_timestamp,
+        'timestamp': event.created_at
+    }
+
+def build_alerts(test_id=None):
+    # Latest proctoring violations (ViolationEvent, indexed by created_at)
+    from .violations import recent_events
+    return [serialize_violation(e) for e in recent_events(20, test_id)]
+
+class StreamTicketView(APIView):
+    """Ticket for the SSE stream (stream.py); EventSource can't send the JWT header."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        from .stream import issue_ticket
+        return Response({
+            'ticket': issue_ticket(request.user),
+            'url': getattr(settings, 'MONITORING_STREAM_URL', '/api/monitoring/stream/'),
+        })
 
 class SecurityAlertView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def get(self, request):
-        # Fetch logs related to security violations
-        # We need to define what 'action' strings constitute a violation.
-        # For now, let's assume actions starting with 'Security:' or specific keywords.
-        alerts = SystemLog.objects.filter(
-            Q(action__icontains='Security') | 
-            Q(action__icontains='IP') | 
-            Q(action__icontains='Violation')
-        ).order_by('-timestamp')[:20]
-
-        data = [{
-            'id': l.id,
-            'user': l.user.username if l.user else 'Unknown',
-            'action': l.action,
-            'details': l.details,
-            'ip': l.ip_address,
-            'timestamp': l.timestamp
-        } for l in alerts]
+        try:
+            test_id = id_param(request, 'test')
+        except ValueError as e:
+            return bad_param(e)
+        return Response(build_alerts(test_id))
 
-        return Response(data)
+class ViolationSummaryView(APIView):
+    """
+    ?test=<id>     violations of a test by type and by student
+    ?student=<id>  violation count and latest events of a student
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        from .violations import test_summary, student_violations
+
+        try:
+            test_id, student_id = id_param(request, 'test'), id_param(request, 'student')
+        except ValueError as e:
+            return bad_param(e)
+        if test_id is not None:
+            return Response(test_summary(test_id))
+        if student_id is not None:
+            data = student_violations(student_id)
+            data['events'] = [serialize_violation(e) for e in data['events']]
+            return Response(data)
+        return Response({'error': 'test yoki student parametri kerak'}, status=status.HTTP_400_BAD_REQUEST)
 
 class MassControlView(APIView):
     permission_classes = [permissions.IsAdminUser]
@@ -99,42 +175,75 @@ class MassControlView(APIView):
     def post(self, request):
         action = request.data.get('action')
         
+        # Only the runtime record changes: compiled payloads and answer keys stay valid
+        from apps.tests.runtime import refresh_runtime
+
         if action == 'pause_all':
             # Pause all ACTIVE tests
-            count = Test.objects.filter(status='active').update(status='paused')
+            tests = Test.objects.filter(status='active')
+            test_ids = list(tests.values_list('id', flat=True))
+            count = tests.update(status='paused', paused_at=timezone.now())
+            for test_id in test_ids:
+                refresh_runtime(test_id)  # students see it on their next /state poll
+            cache.delete(STATS_CACHE_KEY)
             return Response({'status': 'success', 'message': f"{count} ta test pauza qilindi."})
         
         elif action == 'resume_all':
             # Resume all PAUSED tests
-            count = Test.objects.filter(status='paused').update(status='active')
+            # the paused time is added to each test's end (as Test.save does)
+            now = timezone.now()
+            count = 0
+            for test_id, end_date, paused_at in Test.objects.filter(status='paused').values_list(
+                    'id', 'end_date', 'paused_at'):
+                if paused_at is not None:
+                    end_date += now - paused_at
+                count += Test.objects.filter(pk=test_id, status='paused').update(
+                    status='active', end_date=end_date, paused_at=None
+                )
+                refresh_runtime(test_id)  # students see it on their next /state poll
+            cache.delete(STATS_CACHE_KEY)
             return Response({'status': 'success', 'message': f"{count} ta test davom ettirildi."})
         
         elif action == 'extend_time':
             minutes = int(request.data.get('minutes', 15))
             # Extend ACTIVE tests by X minutes
             from django.db.models import F
-            count = Test.objects.filter(status='active').update(end_date=F('end_date') + timedelta(minutes=minutes))
+            tests = Test.objects.filter(status='active')
+            test_ids = list(tests.values_list('id', flat=True))
+            count = tests.update(end_date=F('end_date') + timedelta(minutes=minutes))
+            for test_id in test_ids:
+                refresh_runtime(test_id)  # students see it on their next /state poll
+            cache.delete(STATS_CACHE_KEY)
             return Response({'status': 'success', 'message': f"{count} ta test vaqti {minutes} daqiqaga uzaytirildi."})
 
 class ReportViolationView(APIView):
+    """One violation. The exam page uses the batch endpoint below."""
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_test_id(self, request):
+        test_id = request.data.get('test') or None
+        return int(test_id) if test_id else None
+
+    def ingest(self, request, events):
+        from .violations import ingest
+        try:
+            test_id = self.get_test_id(request)
+            created, merged = ingest(request.user, test_id, events, request.META.get('REMOTE_ADDR'))
+        except (TypeError, ValueError):
+            return Response({'error': "Noto'g'ri test"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'status': 'logged', 'created': created, 'merged': merged})
+
     def post(self, request):
-        details = request.data.get('details', 'Suspicious activity detected')
-        action_type = request.data.get('type', 'Security Violation')
-        
-        # Log it
-        # Assuming you have a LOGGING logic or SystemLog creation
-        # We need to import User from settings if not available, but here we have request.user
-        
-        SystemLog.objects.create(
-            user=request.user,
-            action=f"Security: {action_type}",
-            details=details,
-            ip_address=request.META.get('REMOTE_ADDR')
-        )
-        
-        return Response({'status': 'logged'})
+        return self.ingest(request, [request.data])
+
+class ReportViolationBatchView(ReportViolationView):
+    """{"test": id, "events": [{"type": "focus", "details": "...", "client_ts": ms}, ...]}"""
+
+    def post(self, request):
+        events = request.data.get('events')
+        if not isinstance(events, list):
+            return Response({'error': "events ro'yxat bo'lishi kerak"}, status=status.HTTP_400_BAD_REQUEST)
+        return self.ingest(request, events)
 
 class GlobalSettingsView(APIView):
     permission_classes = [permissions.IsAdminUser]
@@ -155,40 +264,142 @@ class GlobalSettingsView(APIView):
             
         return Response({'error': 'Invalid key'}, status=400)
 
+class ExamProgressView(APIView):
+    """
+    Live progress per test and group (not started / in progress / submitted /
+    passed / failed) from the cache counters in apps/results/progress.py.
+    ?test=<id> for one test, otherwise every running test.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        from apps.results.progress import get_progress
+
+        try:
+            test_id = id_param(request, 'test')
+        except ValueError as e:
+            return bad_param(e)
+        tests = Test.objects.filter(status__in=['active', 'paused'])
+        if test_id is not None:
+            tests = Test.objects.filter(id=test_id)
+
+        data = []
+        for test_id, title in tests.order_by('start_date', 'id').values_list('id', 'title'):
+            progress = get_progress(test_id)
+            progress['title'] = title
+            data.append(progress)
+        return Response(data)
+
+class LivePagination(pagination.PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+def live_queryset(test_id=None, group_id=None):
+    """Students who sent a frame in the last 30s, newest first (LatestSnapshot)."""
+    thirty_secs_ago = timezone.now() - timedelta(seconds=30) # Consider online if snap within 30s
+
+    from apps.tests.models import LatestSnapshot
+    latest = LatestSnapshot.objects.filter(seen_at__gte=thirty_secs_ago).select_related('student', 'test').order_by('-seen_at', 'id')
+    if test_id is not None:
+        latest = latest.filter(test_id=test_id)
+    if group_id is not None:
+        latest = latest.filter(student__group_id=group_id)
+    return latest
+
+def serialize_live(snapshots):
+    return [{
+        'student_name': snap.student.full_name,
+        'student_id': snap.student.student_id,
+        'test_title': snap.test.title,
+        'image_url': snap.image.url if snap.image else None,
+        'timestamp': snap.seen_at,
+        'status': 'online' # Logic: if here, it's recent
+    } for snap in snapshots]
+
 class LiveProctoringView(APIView):
+    """
+    Live grid: one row per student from LatestSnapshot (kept by the snapshot
+    writer), so the cost does not grow with the snapshot history.
+    Filters: ?test=<id>&group=<id>, paginated.
+    """
     permission_classes = [permissions.IsAdminUser]
 
     def get(self, request):
-        now = timezone.now()
-        thirty_secs_ago = now - timedelta(seconds=30) # Consider online if snap within 30s
-        
-        # Get latest snapshot for each student/test
-        # Efficient way: Group by student/test, take max(timestamp)
-        # OR just filter TestSnapshots in last 30s and distinct.
-        
-        from apps.tests.models import TestSnapshot
-        snapshots = TestSnapshot.objects.filter(timestamp__gte=thirty_secs_ago).select_related('student', 'test').order_by('-timestamp')
-        
-        # Deduplicate manually or via distinct (Postgres only for distinct('student'))
-        # Using manual dict for compatibility
-        latest_snaps = {}
-        for snap in snapshots:
-            if snap.student_id not in latest_snaps:
-                latest_snaps[snap.student_id] = snap
-                
+        try:
+            latest = live_queryset(id_param(request, 'test'), id_param(request, 'group'))
+        except ValueError as e:
+            return bad_param(e)
+        paginator = LivePagination()
+        page = paginator.paginate_queryset(latest, request, view=self)
+        return paginator.get_paginated_response(serialize_live(page))
+
+class SnapshotArchiveView(APIView):
+    """Frame index of packed attempts: ?test=<id>&student=<id>"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        from apps.tests.models import SnapshotArchive
+        try:
+            test_id, student_id = id_param(request, 'test'), id_param(request, 'student')
+        except ValueError as e:
+            return bad_param(e)
+        archives = SnapshotArchive.objects.select_related('student', 'test').order_by('-id')
+        if test_id is not None:
+            archives = archives.filter(test_id=test_id)
+        if student_id is not None:
+            archives = archives.filter(student_id=student_id)
+
         data = []
-        for snap in latest_snaps.values():
+        for archive in archives[:100]:
             data.append({
-                'student_name': snap.student.full_name,
-                'student_id': snap.student.student_id,
-                'test_title': snap.test.title,
-                'image_url': snap.image.url if snap.image else None,
-                'timestamp': snap.timestamp,
-                'status': 'online' # Logic: if here, it's recent
+                'id': archive.id,
+                'student_name': archive.student.full_name,
+                'test_title': archive.test.title,
+                'frame_count': archive.frame_count,
+                'frames': [
+                    {'index': i, 'timestamp': frame[0], 'face_count': frame[4] if len(frame) > 4 else None,
+                     'face_flag': frame[5] if len(frame) > 5 else '',
+                     'url': f"/api/monitoring/snapshots/archives/{archive.id}/frames/{i}/"}
+                    for i, frame in enumerate(archive.frames)
+                ],
             })
-            
         return Response(data)
 
+
+class SnapshotFrameView(APIView):
+    """One JPEG frame read from an archive by offset."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, pk, index):
+        from django.http import HttpResponse
+        from apps.tests.models import SnapshotArchive
+        from apps.tests.snapshot_archive import read_frame
+
+        archive = SnapshotArchive.objects.filter(pk=pk).first()
+        if archive is None:
+            return Response({'error': 'Arxiv topilmadi'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            data = read_frame(archive, index)
+        except IndexError:
+            return Response({'error': 'Kadr topilmadi'}, status=status.HTTP_404_NOT_FOUND)
+
+        response = HttpResponse(data, content_type='image/jpeg')
+        response['Cache-Control'] = 'private, max-age=300'
+        return response
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; needs METRICS_TOKEN as a Bearer token when it is set."""
+    from django.http import HttpResponse
+    from .metrics import collect, render
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        if request.headers.get('Authorization', '') != f'Bearer {token}':
+            return HttpResponse("Ruxsat yo'q", status=403, content_type='text/plain')
+    elif not settings.DEBUG:
+        return HttpResponse("METRICS_TOKEN sozlanmagan", status=403, content_type='text/plain')
+    return HttpResponse(render(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def monitoring_page_view(request):
     from django.shortcuts import render
     return render(request, 'monitoring/dashboard.html')
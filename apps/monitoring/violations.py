@@ -0,0 +1,183 @@
+"""
+Proctoring violation events.
+
+The exam page reports violations (focus loss, fullscreen exit, camera, ...)
+as typed ViolationEvent rows tied to the student, test and attempt, so the
+alerts feed and the per-test/per-student summaries are index range reads
+(see the Meta.indexes of ViolationEvent) instead of text searches in
+SystemLog.
+
+The page queues violations and sends them in batches (ingest). Repeats of
+the same type within VIOLATION_DEDUPE_WINDOW seconds become one row with a
+count: inside a batch by client time, across batches through a short-lived
+cache key pointing at the last open row of (user, test, type).
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum, F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.results.models import TestResult
+from apps.tests.models import Test
+from .models import ViolationEvent
+
+VIOLATION_TYPES = {choice for choice, _ in ViolationEvent.TYPE_CHOICES}
+OPEN_EVENT_KEY = 'violation:open:{user_id}:{test_id}:{type}'
+MAX_BATCH = 100
+
+
+def _dedupe_window():
+    return getattr(settings, 'VIOLATION_DEDUPE_WINDOW', 30)
+
+
+def normalize_type(value):
+    """Map the type sent by the page ('focus', 'Security Violation', ...) to a choice."""
+    value = str(value or '').lower()
+    if value in VIOLATION_TYPES:
+        return value
+    return next((t for t in VIOLATION_TYPES if t != 'other' and t in value), 'other')
+
+
+def parse_client_timestamp(value):
+    """Epoch milliseconds (Date.now()) or an ISO string; None if unusable."""
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.fromtimestamp(float(value) / 1000, tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        pass
+    try:
+        return parse_datetime(str(value))
+    except ValueError:
+        return None
+
+
+def resolve_attempt(user, test_id):
+    """
+    (student_id, test_result_id) of the user's open attempt of a test.
+    Raises ValueError for a test the student has no attempt of (or, for
+    other users, a test that doesn't exist).
+    """
+    student = getattr(user, 'student_profile', None)
+    if student is None:
+        if test_id and not Test.objects.filter(id=test_id).exists():
+            raise ValueError(test_id)
+        return None, None
+    if not test_id:
+        return student.id, None
+    attempts = dict(TestResult.objects.filter(student=student, test_id=test_id).values_list('id', 'status'))
+    if not attempts:
+        raise ValueError(test_id)
+    return student.id, next((result_id for result_id, state in attempts.items() if state == 'in_progress'), None)
+
+
+def _collapse(events, window):
+    """
+    Group raw events by type; an event within `window` seconds of the first
+    event of the current group joins it. Returns [(type, [events])] in time order.
+    """
+    now = timezone.now()
+    by_type = {}
+    for data in events:
+        if not isinstance(data, dict):
+            continue
+        client_ts = parse_client_timestamp(data.get('client_ts'))
+        by_type.setdefault(normalize_type(data.get('type')), []).append((client_ts or now, client_ts, data))
+
+    groups = []
+    for violation_type, items in by_type.items():
+        items.sort(key=lambda item: item[0])
+        current = None
+        for item in items:
+            if current and (item[0] - current[0][0]).total_seconds() <= window:
+                current.append(item)
+            else:
+                current = [item]
+                groups.append((violation_type, current))
+    groups.sort(key=lambda group: group[1][0][0])
+    return groups
+
+
+def ingest(user, test_id, events, ip_address):
+    """
+    Store a batch of violations reported by the page.
+    Returns (rows created, events merged into existing or new rows).
+    Raises ValueError if test_id isn't a test the user takes (resolve_attempt).
+    """
+    window = _dedupe_window()
+    student_id, result_id = resolve_attempt(user, test_id)
+
+    new_events = []
+    merged = 0
+    seen_types = set()
+    for violation_type, items in _collapse(events[:MAX_BATCH], window):
+        key = OPEN_EVENT_KEY.format(user_id=user.id, test_id=test_id, type=violation_type)
+        last_client_ts = items[-1][1]
+
+        # only the first group of a type can continue a row from an earlier batch
+        open_id = cache.get(key) if violation_type not in seen_types else None
+        seen_types.add(violation_type)
+        if open_id and ViolationEvent.objects.filter(id=open_id).update(
+                count=F('count') + len(items), last_client_timestamp=last_client_ts):
+            cache.touch(key, window)
+            merged += len(items)
+            continue
+
+        first = items[0]
+        new_events.append((key, ViolationEvent(
+            user=user,
+            student_id=student_id,
+            test_id=test_id,
+            test_result_id=result_id,
+            violation_type=violation_type,
+            details=str(first[2].get('details') or '')[:1000],
+            client_timestamp=first[1],
+            last_client_timestamp=last_client_ts,
+            count=len(items),
+            ip_address=ip_address,
+        )))
+        merged += len(items) - 1
+
+    if new_events:
+        ViolationEvent.objects.bulk_create([event for _, event in new_events])
+        # later groups of a type overwrite earlier ones: the newest row stays open
+        cache.set_many({key: event.id for key, event in new_events if event.id}, timeout=window)
+
+    return len(new_events), merged
+
+
+def recent_events(limit=20, test_id=None):
+    events = ViolationEvent.objects.select_related('user', 'student', 'test').order_by('-created_at')
+    if test_id is not None:
+        events = events.filter(test_id=test_id)
+    return events[:limit]
+
+
+def test_summary(test_id):
+    """Violations of a test by type and by student."""
+    events = ViolationEvent.objects.filter(test_id=test_id)
+    by_type = list(
+        events.values('violation_type').annotate(count=Sum('count'), rows=Count('id')).order_by('-count')
+    )
+    by_student = list(
+        events.exclude(student=None)
+        .values('student_id', 'student__full_name', 'student__student_id')
+        .annotate(count=Sum('count'), last_at=Max('created_at'))
+        .order_by('-count')
+    )
+    return {'test_id': test_id, 'by_type': by_type, 'by_student': by_student}
+
+
+def student_violations(student_id, limit=100):
+    """Count and latest events of one student (index on student, created_at)."""
+    events = ViolationEvent.objects.filter(student_id=student_id)
+    return {
+        'student_id': student_id,
+        'count': events.aggregate(n=Sum('count'))['n'] or 0,
+        'events': list(
+            events.select_related('user', 'student', 'test').order_by('-created_at')[:limit]
+        ),
+    }
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import TestResult, StudentAnswer
+from .models import TestResult, StudentAnswer, GradingJob, ExportJob, GradeSummary
 
 @admin.register(TestResult)
 class TestResultAdmin(admin.ModelAdmin):
@@ -9,3 +9,21 @@ class TestResultAdmin(admin.ModelAdmin):
 @admin.register(StudentAnswer)
 class StudentAnswerAdmin(admin.ModelAdmin):
     list_display = ('test_result', 'question', 'selected_answer', 'is_correct')
+
+
+@admin.register(GradingJob)
+class GradingJobAdmin(admin.ModelAdmin):
+    list_display = ('receipt', 'test_result', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status',)
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('receipt', 'kind', 'status', 'progress', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+
+
+@admin.register(GradeSummary)
+class GradeSummaryAdmin(admin.ModelAdmin):
+    list_display = ('student', 'subject', 'attempts', 'best_score', 'latest_score', 'grade', 'updated_at')
+    list_filter = ('subject', 'grade')
@@ -0,0 +1,235 @@
+"""
+Background report exports.
+
+POST /api/results/exports/ {kind, params} registers an ExportJob; the
+export_worker command builds the file into media storage and keeps
+ExportJob.progress up to date, the page polls the job and then downloads the
+file. The request worker is never tied up by the build.
+
+A job is identified by params_hash (kind + normalized params) and
+data_version, a fingerprint of the rows the report reads (count, newest id
+and newest updated_at of the results in scope; for group reports also the
+group header, the students' names and ids, the tests assigned to the group
+- they make the subject columns and Test_nomi - and for the docx the date it
+prints as Sana). A request matching a finished job - same params,
+unchanged data - gets that job's file back instead of a new build; one
+matching a queued or running job joins it.
+"""
+import hashlib
+import json
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, Max, F, Q
+from django.utils import timezone
+
+from apps.groups.models import Group
+from apps.students.models import Student
+from apps.tests.models import TestAssignment
+from .models import TestResult, ExportJob
+
+RESULT_PARAMS = ('status', 'test', 'student__group', 'search', 'start_date', 'end_date',
+                 'course', 'education_form', 'direction')
+KIND_PARAMS = {
+    'results_xlsx': RESULT_PARAMS,
+    'results_csv': RESULT_PARAMS,
+    'jamlanma_xlsx': ('group_id',),
+    'vedmost_docx': ('group_id',),
+}
+GROUP_KINDS = ('jamlanma_xlsx', 'vedmost_docx')
+EXTENSIONS = {'results_xlsx': 'xlsx', 'results_csv': 'csv', 'jamlanma_xlsx': 'xlsx', 'vedmost_docx': 'docx'}
+
+
+def normalize_params(kind, params):
+    """Known, non-empty params of a kind as strings. Raises ValueError on a bad request."""
+    if kind not in KIND_PARAMS:
+        raise ValueError("Noma'lum eksport turi")
+    params = params or {}
+    cleaned = {
+        name: str(params[name]).strip()
+        for name in KIND_PARAMS[kind]
+        if params.get(name) not in (None, '') and str(params[name]).strip()
+    }
+    if kind in GROUP_KINDS and not cleaned.get('group_id', '').isdigit():
+        raise ValueError("group_id parametri talab qilinadi")
+    return cleaned
+
+
+def params_hash(kind, params):
+    return hashlib.sha1(json.dumps([kind, params], sort_keys=True).encode()).hexdigest()
+
+
+def scope_queryset(kind, params):
+    """Results a report of this kind reads."""
+    if kind in GROUP_KINDS:
+        return TestResult.objects.filter(student__group_id=params['group_id'])
+    from .exports import filter_results
+    return filter_results(params)
+
+
+def data_version(kind, params):
+    """
+    Fingerprint of the data in scope; changes when a result is added, changed
+    or deleted, and for group reports with anything else the file shows.
+    """
+    parts = scope_queryset(kind, params).order_by().aggregate(
+        n=Count('id'), last_id=Max('id'), last_updated=Max('updated_at')
+    )
+    if kind in GROUP_KINDS:
+        group_id = params['group_id']
+        parts['group'] = list(Group.objects.filter(id=group_id).values_list('name', 'course', 'direction'))
+        parts['students'] = list(
+            Student.objects.filter(group_id=group_id).order_by('id').values_list('id', 'full_name', 'student_id')
+        )
+        parts['tests'] = list(
+            TestAssignment.objects.filter(group_id=group_id).order_by('test_id')
+            .values_list('test_id', 'test__title', 'test__subject_id', 'test__subject__name')
+        )
+    if kind == 'vedmost_docx':
+        parts['date'] = timezone.localdate()
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def request_export(user, kind, params):
+    """
+    Job for an export request: a finished or running identical job if there
+    is one, otherwise a new pending job. Returns (job, created).
+    """
+    params = normalize_params(kind, params)
+    digest = params_hash(kind, params)
+    version = data_version(kind, params)
+
+    existing = (
+        ExportJob.objects.filter(params_hash=digest, data_version=version,
+                                 status__in=('pending', 'processing', 'done'))
+        .order_by('-id')
+        .first()
+    )
+    if existing and (existing.status != 'done' or default_storage.exists(existing.file.name)):
+        return existing, False
+
+    job = ExportJob.objects.create(
+        kind=kind, params=params, params_hash=digest, data_version=version, created_by=user
+    )
+    return job, True
+
+
+def download_name(job):
+    """File name offered to the browser."""
+    if job.kind in GROUP_KINDS:
+        from apps.groups.models import Group
+        group_name = Group.objects.filter(id=job.params['group_id']).values_list('name', flat=True).first() or ''
+        prefix = 'Jamlanma' if job.kind == 'jamlanma_xlsx' else 'Vedmost'
+        return f"{prefix}_{group_name}.{EXTENSIONS[job.kind]}"
+    return f"natijalar.{EXTENSIONS[job.kind]}"
+
+
+def claim_export_jobs(limit=1, stale_after=None):
+    """
+    Claim up to `limit` jobs (SELECT .. FOR UPDATE SKIP LOCKED, as the
+    grading queue). Failed builds wait until their available_at; jobs stuck
+    in 'processing' longer than `stale_after` are claimed again.
+    """
+    now = timezone.now()
+    stale_after = stale_after or timedelta(seconds=getattr(settings, 'EXPORT_JOB_STALE_AFTER', 30 * 60))
+
+    with transaction.atomic():
+        ids = list(
+            ExportJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='pending', available_at__lte=now) |
+                    Q(status='processing', claimed_at__lt=now - stale_after))
+            .order_by('id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if ids:
+            ExportJob.objects.filter(id__in=ids).update(
+                status='processing', claimed_at=now, progress=0, attempts=F('attempts') + 1
+            )
+
+    return list(ExportJob.objects.filter(id__in=ids).order_by('id'))
+
+
+def _set_progress(job, percent):
+    ExportJob.objects.filter(id=job.id).update(progress=max(0, min(int(percent), 99)))
+
+
+def _build(job, output):
+    """Write the report of a job to a binary file object."""
+    from .exports import write_xlsx, csv_lines, jamlanma_workbook, vedmost_docx_context, VEDMOST_TEMPLATE
+
+    if job.kind in ('results_xlsx', 'results_csv'):
+        queryset = scope_queryset(job.kind, job.params)
+        total = max(queryset.count(), 1)
+        progress = lambda rows: _set_progress(job, rows * 100 / total)
+        if job.kind == 'results_xlsx':
+            write_xlsx(queryset, output, progress=progress)
+        else:
+            for line in csv_lines(queryset, progress=progress):
+                output.write(line.encode('utf-8'))
+        return
+
+    from apps.groups.models import Group
+    group = Group.objects.get(id=job.params['group_id'])
+    if job.kind == 'jamlanma_xlsx':
+        from .reports import build_report
+        data = build_report(group_id=group.id)
+        _set_progress(job, 50)
+        jamlanma_workbook(group, data['subjects'], data['rows'], data['stats']).save(output)
+    else:
+        from docxtpl import DocxTemplate
+        context = vedmost_docx_context(group)
+        _set_progress(job, 50)
+        doc = DocxTemplate(VEDMOST_TEMPLATE)
+        doc.render(context)
+        doc.save(output)
+
+
+def process_export_job(job):
+    """
+    Build one claimed job. Returns True when the file is ready. A failed
+    build is retried with exponential backoff until EXPORT_MAX_ATTEMPTS.
+    """
+    max_attempts = getattr(settings, 'EXPORT_MAX_ATTEMPTS', 3)
+    # the file reflects the data as of now, not as of the request
+    job.data_version = data_version(job.kind, job.params)
+    try:
+        with tempfile.TemporaryFile() as output:
+            _build(job, output)
+            output.seek(0)
+            name = job.file.field.generate_filename(job, f"{job.kind}_{job.receipt.hex[:12]}.{EXTENSIONS[job.kind]}")
+            job.file.name = default_storage.save(name, File(output))
+    except Exception as e:
+        job.last_error = str(e)[:2000]
+        if job.attempts >= max_attempts:
+            job.status = 'failed'
+        else:
+            job.status = 'pending'
+            delay = getattr(settings, 'EXPORT_RETRY_DELAY', 30) * 2 ** (job.attempts - 1)
+            job.available_at = timezone.now() + timedelta(seconds=delay)
+        job.save(update_fields=['status', 'last_error', 'available_at', 'data_version'])
+        return False
+
+    job.status = 'done'
+    job.progress = 100
+    job.last_error = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'progress', 'last_error', 'file', 'data_version', 'finished_at'])
+    return True
+
+
+def purge_exports(days=None):
+    """Delete jobs (and their files) finished more than `days` ago. Returns the number deleted."""
+    days = getattr(settings, 'EXPORT_RETENTION_DAYS', 7) if days is None else days
+    old = ExportJob.objects.filter(
+        Q(finished_at__lt=timezone.now() - timedelta(days=days)) |
+        Q(status='failed', created_at__lt=timezone.now() - timedelta(days=days))
+    )
+    names = [name for name in old.values_list('file', flat=True) if name]
+    deleted, _ = old.delete()
+    for name in names:
+        default_storage.delete(name)
+    return deleted
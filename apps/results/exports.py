@@ -0,0 +1,330 @@
+"""
+Report files: the results export, the Jamlanma workbook and the docx vedmost.
+Used by the views directly and by background export jobs (export_jobs.py).
+
+Result rows are read with values_list (only the exported columns, no model
+instances) through .iterator(), so memory stays flat however many results
+match. XLSX is written by xlsxwriter in constant_memory mode into a temp
+file and sent from there; CSV (?export_format=csv) is streamed to the client
+row by row while it is being produced.
+
+The site runs on WSGI (Procfile `web`). Should a response be served by the
+ASGI handler instead, stream_for() turns its body into an async iterator:
+Django 4.2 reads a sync streaming body to the end before sending anything
+under ASGI, which would hold the whole file in memory.
+"""
+import csv
+import itertools
+import os
+import tempfile
+
+import xlsxwriter
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, StreamingHttpResponse
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import TestResult
+
+HEADERS = ["ID", "Talaba", "Guruh", "Test", "Ball", "Maks. Ball", "Foiz", "Holat",
+           "Tugagan vaqti", "Sarflangan vaqt", "Sana"]
+COLUMNS = ('id', 'student__full_name', 'student__group__name', 'test__title', 'score', 'max_score',
+           'percentage', 'status', 'completed_at', 'started_at')
+CHUNK_SIZE = 2000
+ASYNC_BATCH = 500  # body items per worker-thread call under ASGI (stream_for)
+
+VEDMOST_TEMPLATE = os.path.join(
+    settings.BASE_DIR, "apps", "results", "templates", "results", "docx", "vedmost_template.docx"
+)
+
+
+def apply_result_filters(queryset, params):
+    """Date and student filters of the results list (query params or an export job's params)."""
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    if start_date:
+        queryset = queryset.filter(completed_at__date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(completed_at__date__lte=end_date)
+
+    course = params.get('course')
+    edu_form = params.get('education_form')
+    direction = params.get('direction')
+    if course:
+        queryset = queryset.filter(student__course=course)
+    if edu_form:
+        queryset = queryset.filter(student__education_form=edu_form)
+    if direction:
+        queryset = queryset.filter(student__direction__icontains=direction)
+    return queryset
+
+
+def filter_results(params):
+    """
+    TestResult queryset of an export job: the same filters the results list
+    applies (filterset fields, search, apply_result_filters), without a request.
+    """
+    queryset = TestResult.objects.order_by('-id')
+    for field in ('status', 'test', 'student__group'):
+        if params.get(field):
+            queryset = queryset.filter(**{field: params[field]})
+    for term in (params.get('search') or '').replace(',', ' ').split():
+        queryset = queryset.filter(
+            Q(student__full_name__icontains=term) | Q(test__title__icontains=term) |
+            Q(student__group__name__icontains=term)
+        )
+    return apply_result_filters(queryset, params)
+
+
+def format_duration(started_at, completed_at):
+    if not (started_at and completed_at):
+        return "-"
+    total_seconds = int((completed_at - started_at).total_seconds())
+    if total_seconds < 60:
+        return f"{total_seconds} sek"
+    return f"{total_seconds // 60} min {total_seconds % 60} sek"
+
+
+def format_time(value):
+    return timezone.localtime(value).strftime("%d.%m.%Y %H:%M") if value else "-"
+
+
+def export_rows(queryset):
+    """Formatted rows of a TestResult queryset, read in chunks."""
+    rows = queryset.values_list(*COLUMNS).iterator(chunk_size=CHUNK_SIZE)
+    for (result_id, student_name, group_name, test_title, score, max_score,
+         percentage, status, completed_at, started_at) in rows:
+        yield [
+            result_id,
+            student_name or "Noma'lum",
+            group_name or "-",
+            test_title or "-",
+            score,
+            max_score,
+            f"{percentage:.1f}%",
+            status,
+            format_time(completed_at),
+            format_duration(started_at, completed_at),
+            format_time(started_at),
+        ]
+
+
+def write_xlsx(queryset, output, progress=None):
+    """Write the export to a file object. progress(rows_written) is called every CHUNK_SIZE rows."""
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    sheet = workbook.add_worksheet("Natijalar")
+    # constant_memory: rows must be written in order, each one is flushed to disk
+    sheet.write_row(0, 0, HEADERS, workbook.add_format({'bold': True}))
+    for row_number, row in enumerate(export_rows(queryset), 1):
+        sheet.write_row(row_number, 0, row)
+        if progress and row_number % CHUNK_SIZE == 0:
+            progress(row_number)
+    workbook.close()
+
+
+class _Echo:
+    """csv.writer target that hands every line back instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(queryset, progress=None):
+    writer = csv.writer(_Echo())
+    yield '\ufeff'  # BOM: Excel opens the file as UTF-8
+    yield writer.writerow(HEADERS)
+    for row_number, row in enumerate(export_rows(queryset), 1):
+        yield writer.writerow(row)
+        if progress and row_number % CHUNK_SIZE == 0:
+            progress(row_number)
+
+
+async def _batches(iterator, size):
+    """Async iterator over a sync one, `size` items per worker-thread call, joined."""
+    # thread_sensitive: a server-side cursor is read in the thread that opened it
+    take = sync_to_async(lambda: list(itertools.islice(iterator, size)), thread_sensitive=True)
+    while True:
+        items = await take()
+        if not items:
+            return
+        yield items[0][:0].join(items)
+
+
+def stream_for(request, response, batch_size=None):
+    """The streaming response, with an async body if `request` came through the ASGI handler."""
+    request = getattr(request, '_request', request)  # DRF Request wraps the HttpRequest
+    if isinstance(request, ASGIRequest) and not response.is_async:
+        response.streaming_content = _batches(response.streaming_content, batch_size or ASYNC_BATCH)
+    return response
+
+
+def xlsx_response(queryset, filename='natijalar.xlsx', request=None):
+    output = tempfile.TemporaryFile()
+    write_xlsx(queryset, output)
+    output.seek(0)
+    response = FileResponse(
+        output, as_attachment=True, filename=filename,
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+    return stream_for(request, response, batch_size=16)  # 16 file blocks per send
+
+
+def csv_response(queryset, filename='natijalar.csv', request=None):
+    response = StreamingHttpResponse(csv_lines(queryset), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return stream_for(request, response)
+
+
+def jamlanma_workbook(group, subjects, report, stats):
+    """openpyxl workbook of the Jamlanma qaydnoma (build_report output of one group)."""
+    import openpyxl
+    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = f"{group.name} - Jamlanma"
+
+    # Styles
+    bold_font = Font(bold=True)
+    center_align = Alignment(horizontal='center', vertical='center')
+    thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+    bg_yellow = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+
+    # Header 1: Title
+    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=3 + len(subjects))
+    ws['A1'] = f"Guruh: {group.name} | Kurs: {group.course} | Yo'nalish: {group.direction}"
+    ws['A1'].font = bold_font
+    ws['A1'].alignment = center_align
+
+    # Header 2: Column Names
+    headers = ["№", "F.I.Sh", "ID"] + [s['name'] for s in subjects]
+    ws.append(headers)
+
+    for col_num, header in enumerate(headers, 1):
+        cell = ws.cell(row=2, column=col_num)
+        cell.font = bold_font
+        cell.alignment = center_align
+        cell.border = thin_border
+
+    # Data Rows
+    for row_data in report:
+        student = row_data['student']
+        scores = [s['value'] for s in row_data['scores']]
+
+        row_cells = [row_data['number'], student['full_name'], student['student_id']] + scores
+        ws.append(row_cells)
+
+        # Apply border to data cells
+        for col_num in range(1, len(row_cells) + 1):
+            cell = ws.cell(row=ws.max_row, column=col_num)
+            cell.border = thin_border
+            if col_num > 3: # Score columns
+                cell.alignment = center_align
+
+    # Statistics Section
+    ws.append([]) # Empty row
+    start_row = ws.max_row + 1
+
+    stat_labels = [
+        ("Jami talabalar", 'total'),
+        ("Qatnashdi", 'participated'),
+        ("Qatnashmadi", 'not_participated'),
+        ("5 baho (A'lo)", 'grade_5'),
+        ("4 baho (Yaxshi)", 'grade_4'),
+        ("3 baho (Qoniqarli)", 'grade_3'),
+        ("Yiqildi (Qoniqarsiz)", 'failed'),
+    ]
+
+    for label, key in stat_labels:
+        row_cells = ["", label, ""] 
+        for stat in stats:
+            row_cells.append(stat[key])
+
+        ws.append(row_cells)
+
+        # Formatting
+        current_row = ws.max_row
+        label_cell = ws.cell(row=current_row, column=2)
+        label_cell.font = bold_font
+        label_cell.border = thin_border
+
+        for i in range(len(stats)):
+            val_cell = ws.cell(row=current_row, column=4 + i)
+            val_cell.alignment = center_align
+            val_cell.border = thin_border
+
+
+    # Adjust column widths
+    ws.column_dimensions['A'].width = 5
+    ws.column_dimensions['B'].width = 30
+    ws.column_dimensions['C'].width = 15
+    for i in range(len(subjects)):
+        col_letter = openpyxl.utils.get_column_letter(4 + i)
+        ws.column_dimensions[col_letter].width = 15
+
+    return wb
+
+
+def vedmost_docx_context(group):
+    """docxtpl context of the vedmost template for a group."""
+    from apps.tests.models import Test
+    from .reports import build_report
+
+    test_nomi = (
+        Test.objects.filter(groups__id=group.id).order_by("id").values_list("title", flat=True).first() or ""
+    )
+
+    # Natijalar bitta so'rovda olinib xotirada jadvalga aylantiriladi (reports.py),
+    # baholar soni ham shu o'tishda hisoblanadi - talaba/fan soniga bog'liq so'rov yo'q
+    report = build_report(group_id=group.id, assigned_subjects=True, scale='vedmost')
+    results_list = []
+    for row in report["rows"]:
+        if report["subjects"]:
+            score_str = " | ".join(item["value"] or "-" for item in row["scores"])
+        else:
+            # Fan bo'lmasa — oxirgi natija
+            score_str = str(row["last_score"]) if row["last_score"] is not None else "-"
+
+        results_list.append({
+            "number":    str(row["number"]),
+            "full_name": row["student"]["full_name"],
+            "score":     score_str,
+            "signature": "",
+        })
+
+    # Statistika — har bir talabaning eng oxirgi natijasiga qarab (build_report)
+    overall = report["overall"]
+    total_students = overall["total"]
+    grade_5 = overall["grade_5"]
+    grade_4 = overall["grade_4"]
+    grade_3 = overall["grade_3"]
+    grade_2 = overall["failed"]
+
+    # Fakultet va kurs — model maydoniga qarab xavfsiz olish
+    fakultet = (
+        getattr(group, "faculty", None)
+        or getattr(group, "fakultet", None)
+        or "—"
+    )
+    # Agar faculty — ForeignKey bo'lsa
+    if hasattr(fakultet, "name"):
+        fakultet = fakultet.name
+
+    kurs = getattr(group, "course", None) or getattr(group, "kurs", None) or ""
+
+    context = {
+        "Guruh":          group.name,
+        "Fakultet":       str(fakultet),
+        "Kursi":          f"{kurs}-kurs" if kurs else "—",
+        "Test_nomi":      test_nomi,
+        "Sana":           timezone.now().strftime("%d.%m.%Y"),
+        "results_table":  results_list,
+        "talabalar_soni": str(total_students),
+        "besh_soni":      str(grade_5),
+        "tort_soni":      str(grade_4),
+        "uch_soni":       str(grade_3),
+        "ikki_soni":      str(grade_2),
+    }
+    return context
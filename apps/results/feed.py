@@ -0,0 +1,189 @@
+"""
+Bulk results feed for BI ingestion: GET /api/results/feed/.
+
+Flat rows (no nested serializer, no COUNT, no pagination) streamed as NDJSON
+(default) or CSV (?output=csv), read with values_list(...).iterator() - on
+PostgreSQL a server-side cursor - so a full dump is one sequential read.
+
+    ?entity=results|answers   TestResult rows (default) or their StudentAnswer rows
+    ?updated_since=<ISO time> only results changed after that time (TestResult.updated_at)
+    ?since_id=<id>            with updated_since: tie-breaker for rows with exactly that
+                              updated_at; alone: only results with a larger id
+    ?limit=<n>                at most n rows
+
+Rows come in (updated_at, id) order - id order with since_id alone - so a
+client stores updated_at and id of the last row it got (full dump included)
+and passes them back on the next pull. Answer rows follow their result: they carry
+result_updated_at, and all answers of a changed result are sent again (upsert
+by id); a limited answers pull may stop inside a result, so resume it from
+the watermark of the result before the last one. Deleted results are not
+reported.
+
+Safety lag: updated_at is set when a row is saved, not when its transaction
+commits, so a slow transaction can commit a row whose updated_at is already
+behind a watermark a client has passed. A page therefore only holds rows
+with updated_at up to now - FEED_SAFETY_LAG seconds (longer than any
+transaction that writes results); newer ones come in a later pull. That cap
+is sent as the X-Feed-Until header: after a page with fewer than `limit`
+rows the client may resume from updated_since=<X-Feed-Until> (no since_id)
+instead of the last row, so a quiet period doesn't leave it behind. The id
+order of since_id alone has no such guarantee (ids are taken before commit
+too); use updated_since for exact incremental pulls.
+"""
+import csv
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .exports import _Echo, stream_for
+from .models import TestResult, StudentAnswer
+
+CHUNK_SIZE = 2000
+
+
+def _safety_lag():
+    return getattr(settings, 'FEED_SAFETY_LAG', 60)
+
+# output column -> ORM path
+RESULT_COLUMNS = (
+    ('id', 'id'),
+    ('student_id', 'student_id'),
+    ('student_code', 'student__student_id'),
+    ('student_name', 'student__full_name'),
+    ('group_id', 'student__group_id'),
+    ('group_name', 'student__group__name'),
+    ('test_id', 'test_id'),
+    ('test_title', 'test__title'),
+    ('subject_id', 'test__subject_id'),
+    ('subject_name', 'test__subject__name'),
+    ('score', 'score'),
+    ('max_score', 'max_score'),
+    ('percentage', 'percentage'),
+    ('status', 'status'),
+    ('can_retake', 'can_retake'),
+    ('started_at', 'started_at'),
+    ('completed_at', 'completed_at'),
+    ('updated_at', 'updated_at'),
+)
+ANSWER_COLUMNS = (
+    ('id', 'id'),
+    ('test_result_id', 'test_result_id'),
+    ('question_id', 'question_id'),
+    ('selected_answer', 'selected_answer'),
+    ('is_correct', 'is_correct'),
+    ('answered_at', 'answered_at'),
+    ('result_updated_at', 'test_result__updated_at'),
+)
+
+
+def _positive_int(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    if not str(value).isdigit():
+        raise ValueError(f"{name} musbat butun son bo'lishi kerak")
+    return int(value)
+
+
+def parse_feed_params(params):
+    """Validated feed params. Raises ValueError on a bad request."""
+    entity = params.get('entity') or 'results'
+    if entity not in ('results', 'answers'):
+        raise ValueError("entity: results yoki answers")
+    output = params.get('output') or 'ndjson'
+    if output not in ('ndjson', 'csv'):
+        raise ValueError("output: ndjson yoki csv")
+
+    updated_since = params.get('updated_since')
+    if updated_since:
+        parsed = parse_datetime(updated_since.replace(' ', '+'))  # unencoded '+' of the offset
+        if parsed is None:
+            raise ValueError("updated_since ISO 8601 vaqt bo'lishi kerak")
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        updated_since = parsed
+
+    return {
+        'entity': entity,
+        'output': output,
+        'updated_since': updated_since or None,
+        'since_id': _positive_int(params, 'since_id'),
+        'limit': _positive_int(params, 'limit'),
+    }
+
+
+def past_watermark(queryset, updated_since=None, since_id=None, prefix='', until=None):
+    """
+    Rows of `queryset` past the watermark (and with updated_at up to `until`),
+    in watermark order. `prefix` is the path to the TestResult
+    ('test_result__' for answers).
+    """
+    if until is not None:
+        queryset = queryset.filter(**{f'{prefix}updated_at__lte': until})
+    if since_id is not None and not updated_since:
+        return queryset.filter(**{f'{prefix}id__gt': since_id}).order_by(f'{prefix}id', 'id')
+    if updated_since:
+        after = Q(**{f'{prefix}updated_at__gt': updated_since})
+        if since_id is not None:
+            after |= Q(**{f'{prefix}updated_at': updated_since, f'{prefix}id__gt': since_id})
+        queryset = queryset.filter(after)
+    return queryset.order_by(f'{prefix}updated_at', f'{prefix}id', 'id')
+
+
+def feed_rows(entity='results', updated_since=None, since_id=None, limit=None, until=None):
+    """(column names, row iterator) of the feed."""
+    if entity == 'answers':
+        columns = ANSWER_COLUMNS
+        queryset = past_watermark(StudentAnswer.objects.all(), updated_since, since_id, 'test_result__', until)
+    else:
+        columns = RESULT_COLUMNS
+        queryset = past_watermark(TestResult.objects.all(), updated_since, since_id, until=until)
+    if limit:
+        queryset = queryset[:limit]
+    names = [name for name, _ in columns]
+    return names, queryset.values_list(*[path for _, path in columns]).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _iso(value):
+    # full microseconds (DjangoJSONEncoder cuts to ms) - the watermark is compared exactly
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def ndjson_lines(names, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), ensure_ascii=False, default=_iso) + '\n'
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def feed_csv_lines(names, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(names)
+    for row in rows:
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+def feed_response(params, request=None):
+    """StreamingHttpResponse of the feed for validated params (parse_feed_params)."""
+    until = timezone.now() - timedelta(seconds=_safety_lag())
+    names, rows = feed_rows(params['entity'], params['updated_since'], params['since_id'], params['limit'], until)
+    if params['output'] == 'csv':
+        response = StreamingHttpResponse(feed_csv_lines(names, rows), content_type='text/csv; charset=utf-8')
+    else:
+        response = StreamingHttpResponse(ndjson_lines(names, rows), content_type='application/x-ndjson; charset=utf-8')
+    response['Cache-Control'] = 'no-store'
+    response['X-Feed-Until'] = until.isoformat()
+    return stream_for(request, response)
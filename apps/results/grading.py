@@ -0,0 +1,275 @@
+"""
+Grading of test attempts.
+
+Scoring runs in memory against the cached answer key (apps.tests.exam_cache),
+so grading an attempt costs a fixed number of queries however many answers
+were submitted. Answers are autosaved during the exam (save_answers), which
+leaves only grading and the status change for the final submit.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from apps.tests.exam_cache import get_answer_key
+from .models import TestResult, StudentAnswer, GradingJob
+from .progress import record_transition
+from .summary import refresh_summaries
+
+VALID_ANSWERS = ('A', 'B', 'C', 'D')
+
+# Attempt states that still have to be graded. 'submitted' means the
+# answers are accepted and waiting in the grading queue.
+GRADABLE_STATUSES = ('in_progress', 'submitted')
+
+
+def normalize_answers(answers_data, allowed_ids=None):
+    """
+    Clean the {question_id: letter} dict sent by the browser.
+    Keys arrive as strings; anything that is not a known letter is dropped.
+    """
+    allowed = set(allowed_ids) if allowed_ids else None
+    cleaned = {}
+    for q_id, selected_key in (answers_data or {}).items():
+        try:
+            q_id = int(q_id)
+        except (TypeError, ValueError):
+            continue
+        if allowed is not None and q_id not in allowed:
+            continue
+        selected_key = str(selected_key or '').upper()
+        if selected_key in VALID_ANSWERS:
+            cleaned[q_id] = selected_key
+    return cleaned
+
+
+def grade_answers(answer_key, answers):
+    """Score {question_id: letter} answers. Returns (score, {question_id: is_correct})."""
+    score = 0
+    correctness = {}
+    for q_id, selected_key in answers.items():
+        key = answer_key.get(q_id)
+        if key is None:
+            continue
+        correct_answer, points = key
+        is_correct = selected_key == correct_answer
+        if is_correct:
+            score += points
+        correctness[q_id] = is_correct
+    return score, correctness
+
+
+def max_score_of(answer_key, question_ids, default):
+    """
+    Highest score an attempt can get: the points of the questions it was
+    served. Attempts without a recorded selection fall back to `default`
+    (Test.max_score).
+    """
+    if not question_ids:
+        return default
+    return sum(answer_key[q_id][1] for q_id in question_ids if q_id in answer_key) or default
+
+
+def is_passed(score, max_score, passing_score, test_max_score):
+    """passing_score is set against Test.max_score; it is scaled to the attempt's max."""
+    if test_max_score and max_score != test_max_score:
+        return score * test_max_score >= passing_score * max_score
+    return score >= passing_score
+
+
+def _upsert_answers(result_id, answers, stored, answer_key):
+    """
+    Write the answers that differ from `stored` ({question_id: selected}) with
+    one INSERT .. ON CONFLICT UPDATE. Returns the changed answers.
+    """
+    changed = {q_id: key for q_id, key in answers.items()
+               if q_id in answer_key and stored.get(q_id) != key}
+    if changed:
+        _, correctness = grade_answers(answer_key, changed)
+        StudentAnswer.objects.bulk_create(
+            [
+                StudentAnswer(
+                    test_result_id=result_id,
+                    question_id=q_id,
+                    selected_answer=key,
+                    is_correct=correctness.get(q_id, False)
+                )
+                for q_id, key in changed.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['test_result', 'question'],
+            update_fields=['selected_answer', 'is_correct', 'answered_at'],
+        )
+    return changed
+
+
+def save_answers(result, answers_data):
+    """
+    Autosave: upsert the answers that changed since the last save.
+    Idempotent, so the browser can safely resend a batch after a network error.
+    Returns the number of rows written.
+    """
+    answers = normalize_answers(answers_data, allowed_ids=result.question_ids)
+    if not answers:
+        return 0
+    answer_key = get_answer_key(result.test_id)
+    stored = dict(
+        StudentAnswer.objects.filter(test_result_id=result.id, question_id__in=list(answers))
+        .values_list('question_id', 'selected_answer')
+    )
+    return len(_upsert_answers(result.id, answers, stored, answer_key))
+
+
+def finalize_attempt(result, answers_data, passing_score):
+    """
+    Grade an in-progress attempt and close it.
+
+    Most answers are already stored by autosave; the final request only
+    carries what was not saved yet. Everything happens in one transaction:
+    the attempt row is locked (so a double submit is graded once), pending
+    answers are upserted, the stored answers are scored in memory, the
+    result is updated with a single UPDATE and the student's GradeSummary
+    row of the subject is refreshed.
+    Returns the updated TestResult.
+    """
+    answer_key = get_answer_key(result.test_id)
+
+    with transaction.atomic():
+        result = TestResult.objects.select_for_update(of=('self',)).select_related('student', 'test').get(pk=result.pk)
+        if result.status not in GRADABLE_STATUSES:
+            return result
+        previous_status = result.status
+
+        stored_rows = StudentAnswer.objects.filter(test_result_id=result.id).values_list(
+            'question_id', 'selected_answer', 'is_correct'
+        )
+        stored = {}
+        stored_correct = {}
+        for q_id, selected_key, is_correct in stored_rows:
+            stored[q_id] = selected_key
+            stored_correct[q_id] = is_correct
+
+        answers = normalize_answers(answers_data, allowed_ids=result.question_ids)
+        changed = _upsert_answers(result.id, answers, stored, answer_key)
+        stored.update(changed)
+
+        score, correctness = grade_answers(answer_key, stored)
+
+        # The key may have been corrected during the exam; fix autosaved flags
+        stale = [q_id for q_id, is_correct in correctness.items()
+                 if q_id not in changed and stored_correct.get(q_id) != is_correct]
+        for is_correct in (True, False):
+            ids = [q_id for q_id in stale if correctness[q_id] is is_correct]
+            if ids:
+                StudentAnswer.objects.filter(test_result_id=result.id, question_id__in=ids).update(is_correct=is_correct)
+
+        max_score = max_score_of(answer_key, result.question_ids, result.test.max_score)
+        if score > max_score:
+            score = max_score
+
+        result.score = score
+        result.max_score = max_score
+        result.percentage = (score / max_score) * 100 if max_score else 0
+        result.status = 'passed' if is_passed(score, max_score, passing_score, result.test.max_score) else 'failed'
+        result.completed_at = timezone.now()
+        result.save(update_fields=['score', 'max_score', 'percentage', 'status', 'completed_at', 'updated_at'])
+        refresh_summaries({(result.student_id, result.test.subject_id)})
+        record_transition(result.test_id, result.student.group_id, previous_status, result.status)
+
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Asynchronous grading queue
+# ---------------------------------------------------------------------------
+
+def enqueue_grading(result, answers_data):
+    """
+    Accept a submission durably without grading it.
+
+    The attempt is flipped to 'submitted' (so no more autosaves or submits
+    are accepted) and the raw answers are stored in a GradingJob that the
+    grading_worker command picks up. Returns the job; a repeated submit
+    returns the job of the first one.
+    """
+    with transaction.atomic():
+        result = TestResult.objects.select_for_update(of=('self',)).select_related('student').get(pk=result.pk)
+        if result.status != 'in_progress':
+            return GradingJob.objects.filter(test_result_id=result.id).first()
+
+        result.status = 'submitted'
+        result.completed_at = timezone.now()
+        result.save(update_fields=['status', 'completed_at', 'updated_at'])
+        record_transition(result.test_id, result.student.group_id, 'in_progress', 'submitted')
+
+        answers = normalize_answers(answers_data, allowed_ids=result.question_ids)
+        return GradingJob.objects.create(
+            test_result=result,
+            answers={str(q_id): key for q_id, key in answers.items()},
+        )
+
+
+def claim_grading_jobs(limit, stale_after=None):
+    """
+    Claim up to `limit` jobs for this worker.
+
+    Rows are locked with SELECT .. FOR UPDATE SKIP LOCKED so several workers
+    never claim the same job. Jobs stuck in 'processing' longer than
+    `stale_after` (a worker died mid-batch) are claimed again.
+    """
+    now = timezone.now()
+    stale_after = stale_after or timedelta(seconds=getattr(settings, 'GRADING_JOB_STALE_AFTER', 300))
+
+    with transaction.atomic():
+        ids = list(
+            GradingJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status='pending', available_at__lte=now) |
+                Q(status='processing', claimed_at__lt=now - stale_after)
+            )
+            .order_by('id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if ids:
+            GradingJob.objects.filter(id__in=ids).update(
+                status='processing', claimed_at=now, attempts=F('attempts') + 1
+            )
+
+    return list(
+        GradingJob.objects.filter(id__in=ids)
+        .select_related('test_result__test')
+        .order_by('id')
+    )
+
+
+def process_grading_jobs(jobs):
+    """
+    Grade a batch of claimed jobs. Failed jobs are retried with exponential
+    backoff until GRADING_MAX_ATTEMPTS, then marked 'failed'.
+    Returns (done, failed) counts.
+    """
+    max_attempts = getattr(settings, 'GRADING_MAX_ATTEMPTS', 5)
+    done_ids = []
+    failed = 0
+
+    for job in jobs:
+        try:
+            finalize_attempt(job.test_result, job.answers, job.test_result.test.passing_score)
+            done_ids.append(job.id)
+        except Exception as e:
+            failed += 1
+            job.last_error = str(e)
+            if job.attempts >= max_attempts:
+                job.status = 'failed'
+                job.finished_at = timezone.now()
+            else:
+                job.status = 'pending'
+                job.available_at = timezone.now() + timedelta(seconds=2 ** job.attempts)
+            job.save(update_fields=['status', 'last_error', 'available_at', 'finished_at'])
+
+    if done_ids:
+        GradingJob.objects.filter(id__in=done_ids).update(status='done', finished_at=timezone.now(), last_error='')
+
+    return len(done_ids), failed
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.results.export_jobs import claim_export_jobs, process_export_job, purge_exports
+
+PURGE_INTERVAL = 60 * 60
+
+
+class Command(BaseCommand):
+    help = "Hisobot fayllarini (Excel, CSV, Docx) fonda tayyorlaydi (ExportJob navbati)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1, help="Bir marta olinadigan ishlar soni")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Navbat bo'sh bo'lganda kutish (soniya)")
+        parser.add_argument('--once', action='store_true', help="Navbatni bir marta bo'shatib chiqish")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        self.stdout.write(f"Export worker started (batch={batch_size})")
+        last_purge = 0
+
+        while True:
+            if time.monotonic() - last_purge > PURGE_INTERVAL:
+                purged = purge_exports()
+                if purged:
+                    self.stdout.write(f"Purged {purged} old exports")
+                last_purge = time.monotonic()
+
+            jobs = claim_export_jobs(batch_size)
+            if jobs:
+                for job in jobs:
+                    ok = process_export_job(job)
+                    self.stdout.write(f"{job.kind} {job.receipt}: {'done' if ok else 'failed'}")
+                continue
+
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.results.grading import claim_grading_jobs, process_grading_jobs
+
+
+class Command(BaseCommand):
+    help = "Asinxron topshirilgan testlarni tekshiradi (GradingJob navbati)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Bir marta olinadigan ishlar soni")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Navbat bo'sh bo'lganda kutish (soniya)")
+        parser.add_argument('--once', action='store_true', help="Navbatni bir marta bo'shatib chiqish")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        self.stdout.write(f"Grading worker started (batch={batch_size})")
+
+        while True:
+            jobs = claim_grading_jobs(batch_size)
+            if jobs:
+                done, failed = process_grading_jobs(jobs)
+                self.stdout.write(f"Graded: {done}, failed: {failed}")
+                continue
+
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.results.summary import rebuild
+from apps.students.models import Student
+
+
+class Command(BaseCommand):
+    help = "Talaba/fan baholari jadvalini (GradeSummary) TestResult asosida qayta quradi."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, help="Faqat shu guruh talabalari")
+        parser.add_argument('--batch-size', type=int, default=500, help="Bir tranzaksiyadagi talabalar soni")
+
+    def handle(self, *args, **options):
+        students = Student.objects.order_by('id')
+        if options['group']:
+            students = students.filter(group_id=options['group'])
+        student_ids = list(students.values_list('id', flat=True))
+
+        written = rebuild(student_ids, batch_size=options['batch_size'])
+        self.stdout.write(f"Rebuilt {written} summaries for {len(student_ids)} students")
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.results.progress import reconcile
+from apps.tests.models import Test
+
+
+class Command(BaseCommand):
+    help = "Jonli progress hisoblagichlarini TestResult bilan solishtirib tiklaydi (cron yoki --interval)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test', type=int, help="Faqat shu test")
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Har N soniyada takrorlash (0 = bir marta)")
+
+    def handle(self, *args, **options):
+        while True:
+            if options['test']:
+                test_ids = [options['test']]
+            else:
+                test_ids = list(Test.objects.filter(status__in=['active', 'paused']).values_list('id', flat=True))
+
+            for test_id in test_ids:
+                reconcile(test_id)
+            self.stdout.write(f"Reconciled {len(test_ids)} tests")
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
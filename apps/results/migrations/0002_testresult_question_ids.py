@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testresult',
+            name='question_ids',
+            field=models.JSONField(blank=True, default=list, help_text='Urinishga tanlangan savollar (tartib bilan)'),
+        ),
+    ]
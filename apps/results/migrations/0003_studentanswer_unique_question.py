@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:30
+
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def remove_duplicate_answers(apps, schema_editor):
+    # A double submit could store the same question twice; keep the latest row
+    StudentAnswer = apps.get_model('results', 'StudentAnswer')
+    duplicates = (
+        StudentAnswer.objects.values('test_result_id', 'question_id')
+        .annotate(rows=Count('id'), last_id=Max('id'))
+        .filter(rows__gt=1)
+    )
+    for dup in duplicates:
+        StudentAnswer.objects.filter(
+            test_result_id=dup['test_result_id'],
+            question_id=dup['question_id'],
+        ).exclude(id=dup['last_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0002_testresult_question_ids'),
+        ('tests', '0005_test_is_archived'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_answers, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='studentanswer',
+            unique_together={('test_result', 'question')},
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('results', '0004_gradingjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receipt', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('kind', models.CharField(choices=[('results_xlsx', 'Natijalar (Excel)'), ('results_csv', 'Natijalar (CSV)'), ('jamlanma_xlsx', 'Jamlanma qaydnoma (Excel)'), ('vedmost_docx', 'Vedmost (Docx)')], max_length=20)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('params_hash', models.CharField(help_text='sha1 of kind + params', max_length=40)),
+                ('data_version', models.CharField(blank=True, default='', max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Navbatda'), ('processing', 'Tayyorlanmoqda'), ('done', 'Tayyor'), ('failed', 'Xatolik')], default='pending', max_length=20)),
+                ('progress', models.PositiveSmallIntegerField(default=0, help_text='Foizda')),
+                ('file', models.FileField(blank=True, upload_to='exports/%Y/%m/')),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='export_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['params_hash', 'data_version'], name='results_exp_params__db3783_idx'), models.Index(fields=['status', 'id'], name='results_exp_status_ba03a2_idx')],
+            },
+        ),
+    ]
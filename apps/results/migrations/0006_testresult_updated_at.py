@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:53
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.utils.timezone
+
+
+def backfill_updated_at(apps, schema_editor):
+    # existing rows: last known change is completion (or the start of an unfinished attempt)
+    TestResult = apps.get_model('results', 'TestResult')
+    TestResult.objects.update(updated_at=Coalesce('completed_at', 'started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0005_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testresult',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# The table starts empty. It is filled by the rebuild_grade_summary command,
+# run once after this migration on deploy, which uses the grade scales of
+# apps.results.reports instead of a copy frozen here.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subjects', '0001_initial'),
+        ('students', '0004_student_camera_mode'),
+        ('results', '0006_testresult_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradeSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('scores', models.JSONField(blank=True, default=list, help_text='Urinishlar ballari (vaqt tartibida)')),
+                ('best_score', models.IntegerField(default=0)),
+                ('best_percentage', models.FloatField(default=0)),
+                ('latest_score', models.IntegerField(default=0)),
+                ('latest_percentage', models.FloatField(default=0)),
+                ('latest_started_at', models.DateTimeField(blank=True, null=True)),
+                ('grade', models.PositiveSmallIntegerField(default=2, help_text="Oxirgi urinish bo'yicha baho")),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('latest_result', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='results.testresult')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grade_summaries', to='students.student')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grade_summaries', to='subjects.subject')),
+            ],
+            options={
+                'unique_together': {('student', 'subject')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:41
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0007_gradesummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='available_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='A failed build is retried after this'),
+        ),
+    ]
@@ -1,5 +1,7 @@
+import uuid
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from apps.students.models import Student
 from apps.tests.models import Test, Question
 
@@ -14,6 +16,9 @@ class TestResult(models.Model):
     completed_at = models.DateTimeField(null=True, blank=True)
     can_retake = models.BooleanField(default=False)
     retake_granted_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='granted_retakes')
+    question_ids = models.JSONField(default=list, blank=True, help_text="Urinishga tanlangan savollar (tartib bilan)")
+    # watermark of the bulk results feed; bulk .update() calls must set it themselves
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.student.full_name} - {self.test.title}: {self.score}"
@@ -25,5 +30,105 @@ class StudentAnswer(models.Model):
     is_correct = models.BooleanField(default=False)
     answered_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        unique_together = ('test_result', 'question')
+
     def __str__(self):
         return f"{self.test_result.student.full_name} - Q{self.question.id}"
+
+class GradeSummary(models.Model):
+    """
+    A student's graded attempts in one subject, kept up to date by summary.py
+    (rebuild_grade_summary command rebuilds it). Reports read this table
+    instead of aggregating TestResult.
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='grade_summaries')
+    subject = models.ForeignKey('subjects.Subject', on_delete=models.CASCADE, related_name='grade_summaries')
+    attempts = models.PositiveIntegerField(default=0)
+    scores = models.JSONField(default=list, blank=True, help_text="Urinishlar ballari (vaqt tartibida)")
+    best_score = models.IntegerField(default=0)
+    best_percentage = models.FloatField(default=0)
+    latest_result = models.ForeignKey(TestResult, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    latest_score = models.IntegerField(default=0)
+    latest_percentage = models.FloatField(default=0)
+    latest_started_at = models.DateTimeField(null=True, blank=True)
+    grade = models.PositiveSmallIntegerField(default=2, help_text="Oxirgi urinish bo'yicha baho")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('student', 'subject')
+
+    def __str__(self):
+        return f"{self.student_id} / {self.subject_id}: {self.grade}"
+
+class GradingJob(models.Model):
+    """A submission accepted for asynchronous grading (see grading_worker command)."""
+    STATUS_CHOICES = (
+        ('pending', 'Navbatda'),
+        ('processing', 'Tekshirilmoqda'),
+        ('done', 'Tayyor'),
+        ('failed', 'Xatolik'),
+    )
+
+    receipt = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    test_result = models.OneToOneField(TestResult, on_delete=models.CASCADE, related_name='grading_job')
+    answers = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    available_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.receipt} ({self.status})"
+
+
+class ExportJob(models.Model):
+    """
+    A report file built in the background (see export_worker command).
+    Jobs with the same kind, params and data version share one artifact.
+    """
+    KIND_CHOICES = (
+        ('results_xlsx', 'Natijalar (Excel)'),
+        ('results_csv', 'Natijalar (CSV)'),
+        ('jamlanma_xlsx', 'Jamlanma qaydnoma (Excel)'),
+        ('vedmost_docx', 'Vedmost (Docx)'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Navbatda'),
+        ('processing', 'Tayyorlanmoqda'),
+        ('done', 'Tayyor'),
+        ('failed', 'Xatolik'),
+    )
+
+    receipt = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    params = models.JSONField(default=dict, blank=True)
+    params_hash = models.CharField(max_length=40, help_text="sha1 of kind + params")
+    data_version = models.CharField(max_length=64, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Foizda")
+    file = models.FileField(upload_to='exports/%Y/%m/', blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='export_jobs')
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    available_at = models.DateTimeField(default=timezone.now, help_text="A failed build is retried after this")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['params_hash', 'data_version']),
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.receipt} ({self.status})"
@@ -0,0 +1,125 @@
+"""
+Live exam progress per test and group.
+
+Counters of attempts by status (in_progress, submitted, passed, failed) are
+kept in the cache, one integer key per test/group/status. They are moved by
+the attempt transitions themselves (start_test, enqueue_grading,
+finalize_attempt) after commit, so reading progress mid-exam is a couple of
+cache reads instead of a GROUP BY over TestResult.
+
+Only current attempts count: a result with can_retake=True has been given
+back to the student, who is "not started" again until the next attempt.
+not_started = enrolled students of the group - current attempts.
+
+Counters are rebuilt from TestResult (reconcile) when a test is first read,
+after admin actions that change results in bulk (invalidate_progress), and
+at least every RECONCILE_INTERVAL seconds, which bounds any drift (evicted
+keys, crashed workers). The reconcile_progress command does the same for all
+running tests.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from apps.students.models import Student
+from .models import TestResult
+
+COUNTER_KEY = 'progress:{test_id}:{group_id}:{status}'
+SYNCED_KEY = 'progress:synced:{test_id}'
+ENROLLED_KEY = 'progress:enrolled:{test_id}'
+
+STATUSES = ('in_progress', 'submitted', 'passed', 'failed')
+COUNTER_TTL = 24 * 60 * 60
+ENROLLED_TTL = 5 * 60
+
+
+def _reconcile_interval():
+    return getattr(settings, 'PROGRESS_RECONCILE_INTERVAL', 10 * 60)
+
+
+def _incr(key, delta):
+    cache.add(key, 0, timeout=COUNTER_TTL)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # evicted between add() and incr(); the next reconcile fixes it
+        pass
+
+
+def _apply(test_id, group_id, old_status, new_status):
+    if old_status in STATUSES:
+        _incr(COUNTER_KEY.format(test_id=test_id, group_id=group_id, status=old_status), -1)
+    if new_status in STATUSES:
+        _incr(COUNTER_KEY.format(test_id=test_id, group_id=group_id, status=new_status), 1)
+
+
+def record_transition(test_id, group_id, old_status, new_status):
+    """Move one attempt between statuses (old_status None = new attempt), after commit."""
+    if old_status == new_status:
+        return
+    transaction.on_commit(lambda: _apply(test_id, group_id, old_status, new_status))
+
+
+def invalidate_progress(test_id):
+    """Counters of a test are rebuilt on the next read."""
+    transaction.on_commit(lambda: cache.delete(SYNCED_KEY.format(test_id=test_id)))
+
+
+def get_enrolled(test_id):
+    """{group_id: {'name': ..., 'students': n}} of the groups assigned to a test."""
+    key = ENROLLED_KEY.format(test_id=test_id)
+    enrolled = cache.get(key)
+    if enrolled is None:
+        rows = (
+            Student.objects.filter(group__tests__id=test_id)
+            .values('group_id', 'group__name')
+            .annotate(n=Count('id'))
+        )
+        enrolled = {row['group_id']: {'name': row['group__name'], 'students': row['n']} for row in rows}
+        cache.set(key, enrolled, timeout=ENROLLED_TTL)
+    return enrolled
+
+
+def reconcile(test_id):
+    """Rebuild the counters of a test from TestResult (one GROUP BY)."""
+    counts = {
+        (row['student__group_id'], row['status']): row['n']
+        for row in (
+            TestResult.objects.filter(test_id=test_id, can_retake=False, status__in=STATUSES)
+            .values('student__group_id', 'status')
+            .annotate(n=Count('id'))
+        )
+    }
+    group_ids = set(get_enrolled(test_id)) | {group_id for group_id, _ in counts}
+    cache.set_many({
+        COUNTER_KEY.format(test_id=test_id, group_id=group_id, status=status): counts.get((group_id, status), 0)
+        for group_id in group_ids for status in STATUSES
+    }, timeout=COUNTER_TTL)
+    cache.set(SYNCED_KEY.format(test_id=test_id), 1, timeout=_reconcile_interval())
+
+
+def get_progress(test_id):
+    """Per-group counters of a test plus totals."""
+    if not cache.get(SYNCED_KEY.format(test_id=test_id)):
+        reconcile(test_id)
+
+    enrolled = get_enrolled(test_id)
+    keys = {
+        (group_id, status): COUNTER_KEY.format(test_id=test_id, group_id=group_id, status=status)
+        for group_id in enrolled for status in STATUSES
+    }
+    values = cache.get_many(keys.values())
+
+    groups = []
+    totals = dict.fromkeys(('students', 'not_started') + STATUSES, 0)
+    for group_id, info in sorted(enrolled.items(), key=lambda item: item[1]['name'] or ''):
+        row = {'group_id': group_id, 'group_name': info['name'], 'students': info['students']}
+        for status in STATUSES:
+            row[status] = max(values.get(keys[(group_id, status)], 0), 0)
+        row['not_started'] = max(info['students'] - sum(row[status] for status in STATUSES), 0)
+        for name in totals:
+            totals[name] += row[name]
+        groups.append(row)
+
+    return {'test_id': test_id, 'groups': groups, 'totals': totals}
@@ -0,0 +1,168 @@
+"""
+Student x subject reports: Vedmost, Jamlanma qaydnoma and the docx vedmost.
+
+build_report reads the students of a group, direction or course and their
+GradeSummary rows (summary.py keeps one per student and subject up to date
+as results change), so a report is a read of O(students x subjects) rows,
+not of the results history. It returns the pivot - every attempt's score
+per student and subject - with the grade statistics. A student's grade in a
+subject comes from the latest attempt, on the grade scale of the report
+(GRADE_SCALES); bucketing and the per-subject counts are done with NumPy
+over the whole student x subject table at once.
+"""
+import numpy as np
+from django.conf import settings
+
+from apps.students.models import Student
+from apps.subjects.models import Subject
+from .models import GradeSummary
+
+# Grade scale of each report: rules tried in order, the first one whose
+# max_score matches (a rule without max_score matches any) grades the attempt
+# by 'score' or 'percentage' against (grade, minimum) pairs, highest first;
+# below the last one the grade is 2. GradeSummary.grade uses 'jamlanma'.
+GRADE_SCALES = {
+    # Jamlanma qaydnoma: 50-ball tests by score, others by percentage
+    'jamlanma': (
+        {'max_score': 50, 'by': 'score', 'thresholds': ((5, 40), (4, 35), (3, 30))},
+        {'by': 'percentage', 'thresholds': ((5, 90), (4, 70), (3, 60))},
+    ),
+    # docx vedmost statistics: by score
+    'vedmost': (
+        {'by': 'score', 'thresholds': ((5, 86), (4, 71), (3, 56))},
+    ),
+}
+GRADED_STATUSES = ('passed', 'failed')
+
+
+def get_grade_scale(report):
+    return getattr(settings, 'GRADE_SCALES', {}).get(report) or GRADE_SCALES[report]
+
+
+def grade_of(score, max_score, percentage, report='jamlanma'):
+    """Grade of one attempt on the scale of a report."""
+    for rule in get_grade_scale(report):
+        if rule.get('max_score', max_score) != max_score:
+            continue
+        value = score if rule['by'] == 'score' else percentage
+        return next((grade for grade, minimum in rule['thresholds'] if value >= minimum), 2)
+    return 2
+
+
+def grade_array(scores, max_scores, percentages, report='jamlanma'):
+    """Grades of arrays of attempts (NaN = no attempt, graded 2 but not counted)."""
+    grades = np.full(scores.shape, 2, dtype=np.int8)
+    graded = np.zeros(scores.shape, dtype=bool)
+    for rule in get_grade_scale(report):
+        applies = ~graded
+        if 'max_score' in rule:
+            applies &= max_scores == rule['max_score']
+        values = scores if rule['by'] == 'score' else percentages
+        for grade, minimum in reversed(rule['thresholds']):
+            grades[applies & (values >= minimum)] = grade
+        graded |= applies
+    return grades
+
+
+def _grade_counts(grades, taken, axis=None):
+    counts = {'participated': taken.sum(axis=axis)}
+    for grade in (5, 4, 3):
+        counts[f'grade_{grade}'] = ((grades == grade) & taken).sum(axis=axis)
+    counts['failed'] = ((grades == 2) & taken).sum(axis=axis)
+    return counts
+
+
+def build_report(group_id=None, direction=None, course=None, assigned_subjects=False, scale='jamlanma'):
+    """
+    Pivot and statistics of the students in scope (any of group_id,
+    direction name, course). Subjects are the ones with results; with
+    assigned_subjects=True only those of tests assigned to the scope's groups
+    (results in other subjects are left out, the overall figures too).
+    Grades are on the GRADE_SCALES entry `scale`.
+
+    Returns {'students', 'subjects', 'rows', 'stats', 'overall'}:
+        rows     [{'number', 'student', 'scores': [{'subject_id', 'value'}], 'last_score'}]
+        stats    per subject: total, participated, not_participated, grade_5/4/3, failed
+        overall  the same over each student's latest result in any subject
+    """
+    scope, assigned = {}, {}
+    if group_id:
+        scope['group_id'] = assigned['tests__groups__id'] = group_id
+    if direction:
+        scope['group__direction'] = assigned['tests__groups__direction'] = direction
+    if course:
+        scope['group__course'] = assigned['tests__groups__course'] = course
+    students_qs = Student.objects.filter(**scope)
+
+    students = list(students_qs.order_by('full_name', 'id').values('id', 'full_name', 'student_id', 'group_id'))
+
+    subject_names = {}
+    summaries = GradeSummary.objects.filter(student__in=students_qs)
+    if assigned_subjects:
+        subject_names.update(Subject.objects.filter(**assigned).values_list('id', 'name'))
+        summaries = summaries.filter(subject_id__in=list(subject_names))
+
+    scores = {}  # (student_id, subject_id) -> ["42", "47"]
+    latest = {}  # (student_id, subject_id) -> (score, max_score, percentage) of the latest attempt
+    last_overall = {}  # student_id -> (started_at, result id, score, max_score, percentage) of the latest attempt
+    rows = (
+        summaries
+        .values_list('student_id', 'subject_id', 'subject__name', 'scores', 'latest_score',
+                     'latest_result__max_score', 'latest_percentage', 'latest_started_at', 'latest_result_id')
+        .iterator(chunk_size=2000)
+    )
+    for (student_id, subject_id, subject_name, attempt_scores, score, max_score, percentage,
+         started_at, result_id) in rows:
+        subject_names.setdefault(subject_id, subject_name)
+        scores[(student_id, subject_id)] = [str(value) for value in attempt_scores]
+        latest[(student_id, subject_id)] = (score, max_score, percentage)
+        attempt = (started_at, result_id or 0, score, max_score, percentage)
+        if student_id not in last_overall or attempt[:2] > last_overall[student_id][:2]:
+            last_overall[student_id] = attempt
+
+    subjects = [
+        {'id': subject_id, 'name': name}
+        for subject_id, name in sorted(subject_names.items(), key=lambda item: (item[1], item[0]))
+    ]
+    student_index = {student['id']: i for i, student in enumerate(students)}
+    subject_index = {subject['id']: j for j, subject in enumerate(subjects)}
+
+    # score, max_score, percentage of the latest attempt per student x subject
+    table = np.full((3, len(students), len(subjects)), np.nan)
+    for (student_id, subject_id), attempt in latest.items():
+        table[:, student_index[student_id], subject_index[subject_id]] = [
+            np.nan if value is None else value for value in attempt
+        ]
+    taken = ~np.isnan(table[0])
+    per_subject = _grade_counts(grade_array(*table, report=scale), taken, axis=0)
+
+    stats = []
+    for j, subject in enumerate(subjects):
+        subject_stats = {'subject': subject, 'total': len(students)}
+        subject_stats.update({name: int(values[j]) for name, values in per_subject.items()})
+        subject_stats['not_participated'] = len(students) - subject_stats['participated']
+        stats.append(subject_stats)
+
+    last = np.array([
+        [np.nan if value is None else value for value in last_overall[s['id']][2:]]
+        if s['id'] in last_overall else [np.nan] * 3
+        for s in students
+    ]).reshape(len(students), 3).T
+    overall = {'total': len(students)}
+    overall.update({
+        name: int(value) for name, value in _grade_counts(grade_array(*last, report=scale), ~np.isnan(last[0])).items()
+    })
+
+    report_rows = []
+    for number, student in enumerate(students, 1):
+        report_rows.append({
+            'number': number,
+            'student': student,
+            'scores': [
+                {'subject_id': subject['id'], 'value': ", ".join(scores.get((student['id'], subject['id']), []))}
+                for subject in subjects
+            ],
+            'last_score': last_overall[student['id']][2] if student['id'] in last_overall else None,
+        })
+
+    return {'students': students, 'subjects': subjects, 'rows': report_rows, 'stats': stats, 'overall': overall}
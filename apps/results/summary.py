@@ -0,0 +1,94 @@
+"""
+Per-student, per-subject grade summary (GradeSummary).
+
+A row holds a student's graded attempts in one subject: every score in
+started_at order, the best and the latest one, and the grade of the latest
+attempt. It is refreshed inside the transaction that changes the results -
+finalize_attempt, a retake grant, an edit or a deletion - from that
+student's results in that subject only. Reports (reports.build_report) read
+one row per student and subject instead of the whole results history.
+
+The rebuild_grade_summary command recomputes the table from TestResult, for
+changes that bypass these paths (admin site, a deleted test, new grade
+scales). It also fills the table the first time: migration 0007 only
+creates it, so run the command once after migrating on deploy.
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from .models import TestResult, GradeSummary
+from .reports import GRADED_STATUSES, grade_of
+
+SUMMARY_FIELDS = ('attempts', 'scores', 'best_score', 'best_percentage', 'latest_result', 'latest_score',
+                  'latest_percentage', 'latest_started_at', 'grade', 'updated_at')
+
+
+def _graded_rows(queryset):
+    return (
+        queryset.filter(status__in=GRADED_STATUSES)
+        .order_by('student_id', 'test__subject_id', 'started_at', 'id')
+        .values_list('student_id', 'test__subject_id', 'id', 'score', 'max_score', 'percentage', 'started_at')
+        .iterator(chunk_size=2000)
+    )
+
+
+def build_summaries(rows):
+    """GradeSummary objects (unsaved) of graded result rows in (student, subject, started_at, id) order."""
+    summary = None
+    for student_id, subject_id, result_id, score, max_score, percentage, started_at in rows:
+        if summary is None or (summary.student_id, summary.subject_id) != (student_id, subject_id):
+            if summary is not None:
+                yield summary
+            summary = GradeSummary(student_id=student_id, subject_id=subject_id, scores=[])
+        summary.attempts += 1
+        summary.scores.append(score)
+        if summary.attempts == 1 or score > summary.best_score:
+            summary.best_score, summary.best_percentage = score, percentage
+        summary.latest_result_id = result_id
+        summary.latest_score, summary.latest_percentage = score, percentage
+        summary.latest_started_at = started_at
+        summary.grade = grade_of(score, max_score, percentage)
+    if summary is not None:
+        yield summary
+
+
+def result_pairs(result_ids):
+    """(student_id, subject_id) of results - read before they are deleted."""
+    return set(TestResult.objects.filter(id__in=result_ids).values_list('student_id', 'test__subject_id'))
+
+
+def refresh_summaries(pairs):
+    """Recompute the summaries of (student_id, subject_id) pairs; drops those with no graded attempt left."""
+    pairs = set(pairs)
+    if not pairs:
+        return
+    results = Q()
+    for student_id, subject_id in pairs:
+        results |= Q(student_id=student_id, test__subject_id=subject_id)
+
+    with transaction.atomic(savepoint=False):
+        fresh = list(build_summaries(_graded_rows(TestResult.objects.filter(results))))
+        gone = pairs - {(summary.student_id, summary.subject_id) for summary in fresh}
+        if fresh:
+            GradeSummary.objects.bulk_create(
+                fresh, update_conflicts=True, unique_fields=['student', 'subject'], update_fields=SUMMARY_FIELDS
+            )
+        if gone:
+            stale = Q()
+            for student_id, subject_id in gone:
+                stale |= Q(student_id=student_id, subject_id=subject_id)
+            GradeSummary.objects.filter(stale).delete()
+
+
+def rebuild(student_ids, batch_size=500):
+    """Rebuild the summaries of the given students from TestResult, batch by batch. Returns rows written."""
+    student_ids = list(student_ids)
+    written = 0
+    for start in range(0, len(student_ids), batch_size):
+        batch = student_ids[start:start + batch_size]
+        summaries = list(build_summaries(_graded_rows(TestResult.objects.filter(student_id__in=batch))))
+        with transaction.atomic():
+            GradeSummary.objects.filter(student_id__in=batch).delete()
+            GradeSummary.objects.bulk_create(summaries, batch_size=1000)
+        written += len(summaries)
+    return written
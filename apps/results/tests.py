@@ -1,3 +1,378 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from apps.groups.models import Group
+from apps.students.models import Student
+from apps.subjects.models import Subject
+from apps.tests.models import Test, TestAssignment
+from .models import TestResult
+from .reports import build_report
+from .summary import refresh_summaries
+
+User = get_user_model()
+
+
+class ResultsTestCase(TestCase):
+    """Common fixture: a group of three students with two assigned tests."""
+
+    def setUp(self):
+        self.group = Group.objects.create(name="G-1", course=1, direction="CS", education_form="kunduzgi")
+        self.students = [
+            Student.objects.create(
+                user=User.objects.create_user(username=f"s{i}", password="password123", role="student"),
+                student_id=f"S-{i}", full_name=name, group=self.group,
+                course=1, direction="CS", education_form="kunduzgi", phone="123"
+            )
+            for i, name in enumerate(["Aliyev", "Botirov", "Karimov"])
+        ]
+        now = timezone.now()
+        self.tests = []
+        for name in ("Fizika", "Algebra"):
+            subject = Subject.objects.create(name=name, code=name[:3], courses="1", directions="CS")
+            test = Test.objects.create(title=name, subject=subject, duration=30,
+                                       start_date=now, end_date=now + timedelta(hours=1))
+            TestAssignment.objects.create(test=test, group=self.group)
+            self.tests.append(test)
+
+    def result(self, student, test, score, minutes, status='passed'):
+        result = TestResult.objects.create(
+            student=student, test=test, score=score, max_score=50, percentage=score * 2,
+            status=status, started_at=timezone.now() + timedelta(minutes=minutes)
+        )
+        refresh_summaries({(student.id, test.subject_id)})  # as finalize_attempt does
+        return result
+
+
+class ReportEngineTest(ResultsTestCase):
+    def test_pivot_and_grades_in_one_pass(self):
+        physics, algebra = self.tests
+        aliyev, botirov, _ = self.students
+        self.result(aliyev, physics, 20, 1, status='failed')
+        self.result(aliyev, physics, 45, 2)  # retake: the latest attempt is graded
+        self.result(botirov, physics, 36, 1)
+        self.result(botirov, algebra, 30, 3)
+        self.result(botirov, algebra, 0, 4, status='in_progress')  # not graded yet
+
+        with self.assertNumQueries(2):
+            report = build_report(group_id=self.group.id)
+
+        self.assertEqual([s['name'] for s in report['subjects']], ["Algebra", "Fizika"])
+        self.assertEqual([item['value'] for item in report['rows'][0]['scores']], ["", "20, 45"])
+        self.assertEqual([item['value'] for item in report['rows'][1]['scores']], ["30", "36"])
+
+        algebra_stats, physics_stats = report['stats']
+        self.assertEqual((physics_stats['participated'], physics_stats['not_participated']), (2, 1))
+        self.assertEqual((physics_stats['grade_5'], physics_stats['grade_4']), (1, 1))
+        self.assertEqual((algebra_stats['grade_3'], algebra_stats['failed']), (1, 0))
+        # latest result of each student: Aliyev 90% (5), Botirov 60% (3)
+        self.assertEqual(report['overall'], {'total': 3, 'participated': 2, 'grade_5': 1, 'grade_4': 0,
+                                             'grade_3': 1, 'failed': 0})
+
+    def test_assigned_subjects_limit_the_columns(self):
+        physics, algebra = self.tests
+        chemistry = Subject.objects.create(name="Kimyo", code="KIM", courses="1", directions="CS")
+        other = Test.objects.create(title="Kimyo", subject=chemistry, duration=30,
+                                    start_date=timezone.now(), end_date=timezone.now() + timedelta(hours=1))
+        self.result(self.students[0], other, 45, 2)  # not assigned to the group (e.g. taken before a transfer)
+        self.result(self.students[0], physics, 30, 1)
+
+        report = build_report(group_id=self.group.id, assigned_subjects=True)
+        self.assertEqual([s['name'] for s in report['subjects']], ["Algebra", "Fizika"])
+        self.assertEqual(report['rows'][0]['last_score'], 30)
+        self.assertEqual([s['name'] for s in build_report(group_id=self.group.id)['subjects']], ["Fizika", "Kimyo"])
+
+    def test_each_report_keeps_its_grade_scale(self):
+        from .reports import GRADE_SCALES, grade_of
+        self.result(self.students[0], self.tests[0], 45, 1)  # 45 of 50
+
+        self.assertEqual(build_report(group_id=self.group.id)['overall']['grade_5'], 1)  # Jamlanma: >= 40
+        vedmost = build_report(group_id=self.group.id, scale='vedmost')['overall']
+        self.assertEqual((vedmost['grade_5'], vedmost['failed']), (0, 1))  # docx: raw score, 86 for a 5
+        with self.settings(GRADE_SCALES={'vedmost': GRADE_SCALES['jamlanma']}):
+            self.assertEqual(build_report(group_id=self.group.id, scale='vedmost')['overall']['grade_5'], 1)
+
+        # not a 50-ball test: Jamlanma grades by percentage (90/70/60)
+        self.assertEqual((grade_of(80, 100, 80.0), grade_of(95, 100, 95.0)), (4, 5))
+        self.assertEqual(grade_of(80, 100, 80.0, 'vedmost'), 4)
+
+    def test_jamlanma_page_renders_report(self):
+        self.result(self.students[0], self.tests[0], 45, 1)
+        admin = User.objects.create_user(username="admin", password="password123", role="admin")
+        self.client.force_login(admin)
+        from apps.directions.models import Direction
+        direction = Direction.objects.create(name="CS", code="CS")
+        response = self.client.get('/jamlanma-qaytnoma/', {
+            'direction_id': direction.id, 'course': 1, 'group_id': self.group.id,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['stats'][0]['grade_5'], 1)
+
+    def test_docx_queries_do_not_grow_with_group(self):
+        admin = User.objects.create_user(username="admin", password="password123", role="admin")
+        self.client.force_login(admin)
+        for minutes, student in enumerate(self.students):
+            for test in self.tests:
+                self.result(student, test, 30 + minutes, minutes)
+
+        # session, user, group, test title, assigned subjects, students, grade summaries
+        with self.assertNumQueries(7):
+            response = self.client.get('/api/results/export_docx/', {'group_id': self.group.id})
+        self.assertEqual(response.status_code, 200)
+
+
+
+
+class GradeSummaryTest(ResultsTestCase):
+    def test_summary_follows_results_and_rebuild_matches(self):
+        import io
+        from django.core.management import call_command
+        from rest_framework.test import APIClient
+        from .models import GradeSummary
+
+        physics = self.tests[0]
+        aliyev = self.students[0]
+        self.result(aliyev, physics, 20, 1, status='failed')
+        latest = self.result(aliyev, physics, 45, 2)
+
+        summary = GradeSummary.objects.get(student=aliyev, subject=physics.subject)
+        self.assertEqual((summary.attempts, summary.scores, summary.best_score, summary.latest_score, summary.grade),
+                         (2, [20, 45], 45, 45, 5))
+
+        api = APIClient()
+        api.force_authenticate(User.objects.create_user(username="admin", password="password123", role="admin"))
+        api.delete(f'/api/results/{latest.id}/')
+        summary.refresh_from_db()
+        self.assertEqual((summary.attempts, summary.latest_score, summary.grade), (1, 20, 2))
+
+        api.post('/api/results/bulk_action/', {'action': 'delete', 'ids': [summary.latest_result_id]}, format='json')
+        self.assertFalse(GradeSummary.objects.exists())
+
+        self.result(self.students[1], physics, 40, 3)
+        maintained = list(GradeSummary.objects.values_list('student_id', 'subject_id', 'scores', 'grade'))
+        GradeSummary.objects.all().delete()
+        call_command('rebuild_grade_summary', stdout=io.StringIO())
+        self.assertEqual(list(GradeSummary.objects.values_list('student_id', 'subject_id', 'scores', 'grade')),
+                         maintained)
+
+class ResultExportTest(ResultsTestCase):
+    def setUp(self):
+        super().setUp()
+        from rest_framework.test import APIClient
+        self.api = APIClient()
+        self.api.force_authenticate(User.objects.create_user(username="admin", password="password123", role="admin"))
+        for minutes, student in enumerate(self.students):
+            self.result(student, self.tests[0], 40, minutes)
+
+    def test_xlsx_export(self):
+        import io
+        import openpyxl
+        response = self.api.get('/api/results/export_excel/', {'test': self.tests[0].id})
+        self.assertEqual(response.status_code, 200)
+        sheet = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][1:5], ("Karimov", "G-1", "Fizika", 40))
+
+    def test_csv_export_is_streamed(self):
+        response = self.api.get('/api/results/export_excel/', {'export_format': 'csv'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[1].split(',')[1:10], ["Karimov", "G-1", "Fizika", "40", "50", "80.0%", "passed", "-", "-"])
+
+    def test_feed_holds_back_rows_inside_safety_lag(self):
+        from django.utils.dateparse import parse_datetime
+        response = self.api.get('/api/results/feed/')
+        self.assertEqual(b''.join(response.streaming_content), b'')  # all saved just now
+        until = parse_datetime(response['X-Feed-Until'])
+        self.assertLess(until, TestResult.objects.order_by('updated_at').first().updated_at)
+
+        TestResult.objects.filter(id=self.students[0].results.get().id).update(
+            updated_at=timezone.now() - timedelta(minutes=5))
+        response = self.api.get('/api/results/feed/', {'output': 'csv'})
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 2)
+
+    @override_settings(FEED_SAFETY_LAG=0)
+    def test_feed_streams_flat_rows_past_watermark(self):
+        import json
+        response = self.api.get('/api/results/feed/')
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['student_name'] for row in rows], ["Aliyev", "Botirov", "Karimov"])
+        self.assertEqual((rows[0]['group_name'], rows[0]['subject_name'], rows[0]['score']), ("G-1", "Fizika", 40))
+
+        # incremental pull: only the result changed after the last row seen
+        last = rows[-1]
+        changed = TestResult.objects.get(id=rows[0]['id'])
+        self.api.post('/api/results/bulk_action/', {'action': 'retake', 'ids': [changed.id]}, format='json')
+        response = self.api.get('/api/results/feed/', {
+            'updated_since': last['updated_at'], 'since_id': last['id'], 'output': 'csv',
+        })
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:4], ['id', 'student_id', 'student_code', 'student_name'])
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], [str(changed.id)])
+
+        self.assertEqual(self.api.get('/api/results/feed/', {'updated_since': 'kecha'}).status_code, 400)
+
+    def test_background_job_builds_and_reuses_artifact(self):
+        import io
+        import tempfile
+        import openpyxl
+        from django.core.management import call_command
+        from django.test import override_settings
+
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        with override_settings(MEDIA_ROOT=media.name):
+            request = {'kind': 'results_xlsx', 'params': {'test': self.tests[0].id, 'search': ''}}
+            job = self.api.post('/api/results/exports/', request, format='json')
+            self.assertEqual(job.status_code, 202)
+            self.assertEqual(job.data['status'], 'pending')
+
+            call_command('export_worker', once=True, stdout=io.StringIO())
+            done = self.api.get(f"/api/results/exports/{job.data['receipt']}/").data
+            self.assertEqual((done['status'], done['progress']), ('done', 100))
+
+            response = self.api.get(done['download_url'])
+            sheet = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+            self.assertEqual(sheet.max_row, 4)
+
+            # same filters, same data: the finished file is handed out again
+            again = self.api.post('/api/results/exports/', request, format='json')
+            self.assertEqual((again.status_code, again.data['receipt'], again.data['reused']),
+                             (200, job.data['receipt'], True))
+
+            # new data: a new build
+            self.result(self.students[0], self.tests[0], 45, 10)
+            fresh = self.api.post('/api/results/exports/', request, format='json')
+            self.assertEqual(fresh.status_code, 202)
+            self.assertNotEqual(fresh.data['receipt'], job.data['receipt'])
+
+    def test_failed_job_is_retried_after_a_backoff(self):
+        from unittest import mock
+        from . import export_jobs
+        job, _ = export_jobs.request_export(None, 'results_csv', {})
+
+        [claimed] = export_jobs.claim_export_jobs()
+        with mock.patch.object(export_jobs, '_build', side_effect=OSError("disk full")):
+            self.assertFalse(export_jobs.process_export_job(claimed))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), ('pending', "disk full"))
+        self.assertGreater(job.available_at, timezone.now() + timedelta(seconds=20))
+        self.assertEqual(export_jobs.claim_export_jobs(), [])  # not straight back into the loop
+
+        with mock.patch('django.utils.timezone.now', return_value=job.available_at):
+            self.assertEqual([j.id for j in export_jobs.claim_export_jobs()], [job.id])
+
+    def test_group_report_is_rebuilt_after_reassignment(self):
+        from unittest import mock
+        from .export_jobs import data_version
+        params = {'group_id': str(self.group.id)}
+        before = {kind: data_version(kind, params) for kind in ('jamlanma_xlsx', 'vedmost_docx')}
+
+        # a new subject column, no result changed
+        subject = Subject.objects.create(name="Kimyo", code="KIM", courses="1", directions="CS")
+        now = timezone.now()
+        test = Test.objects.create(title="Kimyo", subject=subject, duration=30,
+                                   start_date=now, end_date=now + timedelta(hours=1))
+        TestAssignment.objects.create(test=test, group=self.group)
+        after = {kind: data_version(kind, params) for kind in before}
+        self.assertTrue(all(before[kind] != after[kind] for kind in before))
+
+        # the same test moved to another subject
+        test.subject = self.tests[0].subject
+        test.save()
+        self.assertNotEqual(data_version('jamlanma_xlsx', params), after['jamlanma_xlsx'])
+
+        # a renamed student
+        renamed = data_version('jamlanma_xlsx', params)
+        Student.objects.filter(id=self.students[0].id).update(full_name="Aliyeva")
+        self.assertNotEqual(data_version('jamlanma_xlsx', params), renamed)
+
+        # the docx prints today's date
+        dated = data_version('vedmost_docx', params)
+        with mock.patch('django.utils.timezone.localdate', return_value=timezone.localdate() + timedelta(days=1)):
+            self.assertNotEqual(data_version('vedmost_docx', params), dated)
+
+
+class ASGIStreamingTest(TransactionTestCase):
+    """Downloads through the ASGI handler: the body must be sent in parts, not read whole first."""
+
+    def setUp(self):
+        group = Group.objects.create(name="G-1", course=1, direction="CS", education_form="kunduzgi")
+        subject = Subject.objects.create(name="Fizika", code="FIZ", courses="1", directions="CS")
+        now = timezone.now()
+        test = Test.objects.create(title="Fizika", subject=subject, duration=30,
+                                   start_date=now, end_date=now + timedelta(hours=1))
+        for i, name in enumerate(["Aliyev", "Botirov", "Karimov"]):
+            student = Student.objects.create(
+                user=User.objects.create_user(username=f"s{i}", password="password123", role="student"),
+                student_id=f"S-{i}", full_name=name, group=group,
+                course=1, direction="CS", education_form="kunduzgi", phone="123"
+            )
+            TestResult.objects.create(student=student, test=test, score=40, max_score=50, percentage=80,
+                                      status='passed', started_at=now)
+        self.admin = User.objects.create_user(username="admin", password="password123", role="admin")
+
+    def asgi_get(self, path, query='', probe=None):
+        """(headers, body parts) of a GET through ASGIHandler; probe() is noted with every part sent."""
+        from asgiref.sync import async_to_sync
+        from django.core.handlers.asgi import ASGIHandler
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        token = str(AccessToken.for_user(self.admin))
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'client': ('127.0.0.1', 1), 'server': ('testserver', 80),
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {token}'.encode())],
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(dict(message, probe=probe() if probe else None))
+
+        async_to_sync(ASGIHandler())(scope, receive, send)
+        self.assertEqual(messages[0]['status'], 200)
+        headers = {name.lower(): value for name, value in messages[0]['headers']}
+        return headers, [(m['body'], m['probe']) for m in messages[1:] if m.get('body')]
+
+    def test_csv_is_sent_in_parts(self):
+        from unittest import mock
+        from apps.results import exports
+
+        produced = []
+        export_rows = exports.export_rows
+
+        def counting_rows(queryset):
+            for row in export_rows(queryset):
+                produced.append(row)
+                yield row
+
+        with mock.patch('apps.results.exports.ASYNC_BATCH', 2), \
+                mock.patch('apps.results.exports.export_rows', counting_rows):
+            _, parts = self.asgi_get('/api/results/export_excel/', 'export_format=csv', probe=lambda: len(produced))
+        # BOM + header go out before any row is read, then 2 rows, then 1
+        self.assertEqual([rows for _, rows in parts], [0, 2, 3])
+        self.assertEqual(len(b''.join(body for body, _ in parts).decode('utf-8-sig').splitlines()), 4)
+
+    @override_settings(FEED_SAFETY_LAG=0)
+    def test_feed_is_sent_in_parts(self):
+        from unittest import mock
+        with mock.patch('apps.results.exports.ASYNC_BATCH', 2):
+            _, parts = self.asgi_get('/api/results/feed/')
+        self.assertEqual([len(body.splitlines()) for body, _ in parts], [2, 1])
+
+    def test_xlsx_is_sent_from_the_file(self):
+        import io
+        import openpyxl
+        headers, parts = self.asgi_get('/api/results/export_excel/')
+        self.assertIn(b'attachment', headers[b'content-disposition'])
+        sheet = openpyxl.load_workbook(io.BytesIO(b''.join(body for body, _ in parts))).active
+        self.assertEqual(len(list(sheet.iter_rows(values_only=True))), 4)
@@ -1,12 +1,16 @@
 from rest_framework import viewsets, permissions, filters, status, decorators, pagination
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from django.http import HttpResponse
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import TestResult
 from .serializers import TestResultSerializer
+from .progress import invalidate_progress
+from .summary import refresh_summaries, result_pairs
 from docxtpl import DocxTemplate
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from django.utils.encoding import escape_uri_path
 import os
@@ -36,27 +40,9 @@ class TestResultViewSet(viewsets.ModelViewSet):
         
         queryset = TestResult.objects.all().select_related('student', 'test', 'student__group').order_by('-id')
 
-        # Date Filtering
-        start_date = self.request.query_params.get('start_date')
-        end_date = self.request.query_params.get('end_date')
-        if start_date:
-            queryset = queryset.filter(completed_at__date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(completed_at__date__lte=end_date)
-            
-        # Student Filters
-        course = self.request.query_params.get('course')
-        edu_form = self.request.query_params.get('education_form')
-        direction = self.request.query_params.get('direction')
-        
-        if course:
-            queryset = queryset.filter(student__course=course)
-        if edu_form:
-            queryset = queryset.filter(student__education_form=edu_form)
-        if direction:
-            queryset = queryset.filter(student__direction__icontains=direction)
-            
-        return queryset
+        # Date and student filters (shared with background exports)
+        from .exports import apply_result_filters
+        return apply_result_filters(queryset, self.request.query_params)
 
     def perform_destroy(self, instance):
         user = self.request.user
@@ -64,7 +50,17 @@ class TestResultViewSet(viewsets.ModelViewSet):
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied("Natijani o'chirish uchun faqat Admin huquqi talab qilinadi.")
         self._log_action('delete', instance)
-        instance.delete()
+        invalidate_progress(instance.test_id)
+        pairs = result_pairs([instance.id])
+        with transaction.atomic():
+            instance.delete()
+            refresh_summaries(pairs)
+
+    def perform_update(self, serializer):
+        pairs = result_pairs([serializer.instance.id])
+        with transaction.atomic():
+            result = serializer.save()
+            refresh_summaries(pairs | result_pairs([result.id]))
 
     @action(detail=True, methods=['post'])
     def allow_retake(self, request, pk=None):
@@ -75,7 +71,10 @@ class TestResultViewSet(viewsets.ModelViewSet):
         result = self.get_object()
         result.can_retake = True
         result.retake_granted_by = user
-        result.save()
+        with transaction.atomic():
+            result.save()
+            refresh_summaries(result_pairs([result.id]))
+        invalidate_progress(result.test_id)
         
         self._log_action('retake', result)
         
@@ -94,15 +93,22 @@ class TestResultViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Hech narsa tanlanmadi'}, status=status.HTTP_400_BAD_REQUEST)
             
         queryset = TestResult.objects.filter(id__in=ids)
+        for test_id in set(queryset.values_list('test_id', flat=True)):
+            invalidate_progress(test_id)
         
         if action == 'delete':
             # Check delete permission if needed, but admin/dean is already checked
-            queryset.delete()
+            pairs = result_pairs(ids)
+            with transaction.atomic():
+                queryset.delete()
+                refresh_summaries(pairs)
             self._log_action('bulk_action', extra_details=f"{len(ids)} ta natija o'chirildi")
             return Response({'status': 'deleted', 'count': len(ids)})
             
         elif action == 'retake':
-            queryset.update(can_retake=True, retake_granted_by=user)
+            with transaction.atomic():
+                queryset.update(can_retake=True, retake_granted_by=user, updated_at=timezone.now())
+                refresh_summaries(result_pairs(ids))
             self._log_action('bulk_action', extra_details=f"{len(ids)} ta natijaga qayta topshirish ruxsati berildi")
             return Response({'status': 'retake_granted', 'count': len(ids)})
             
@@ -137,70 +143,17 @@ class TestResultViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def export_excel(self, request):
-        import openpyxl
-        from django.http import HttpResponse
+        from .exports import csv_response, xlsx_response
 
         user = request.user
         if user.role not in ['admin', 'dean']:
              return Response({'error': 'Huquq yo\'q'}, status=status.HTTP_403_FORBIDDEN)
 
-        # Apply filters
+        # Apply filters; rows are streamed in chunks (exports.py)
         queryset = self.filter_queryset(self.get_queryset())
-
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Natijalar"
-
-        # Headers
-        headers = ["ID", "Talaba", "Guruh", "Test", "Ball", "Maks. Ball", "Foiz", "Holat", "Tugagan vaqti", "Sarflangan vaqt", "Sana"]
-        ws.append(headers)
-
-        from django.utils import timezone
-        
-        for result in queryset:
-            student_name = result.student.full_name if result.student else "Noma'lum"
-            group_name = result.student.group.name if (result.student and result.student.group) else "-"
-            test_title = result.test.title if result.test else "-"
-            
-            # Calculate duration
-            duration_str = "-"
-            if result.completed_at and result.started_at:
-                diff = result.completed_at - result.started_at
-                total_seconds = int(diff.total_seconds())
-                if total_seconds < 60:
-                    duration_str = f"{total_seconds} sek"
-                else:
-                    minutes = total_seconds // 60
-                    seconds = total_seconds % 60
-                    duration_str = f"{minutes} min {seconds} sek"
-
-            # Localize times
-            completed_str = "-"
-            if result.completed_at:
-                completed_str = timezone.localtime(result.completed_at).strftime("%d.%m.%Y %H:%M")
-
-            started_str = "-"
-            if result.started_at:
-                started_str = timezone.localtime(result.started_at).strftime("%d.%m.%Y %H:%M")
-
-            ws.append([
-                result.id,
-                student_name,
-                group_name,
-                test_title,
-                result.score,
-                result.max_score,
-                f"{result.percentage:.1f}%",
-                result.status,
-                completed_str,
-                duration_str,
-                started_str
-            ])
-
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename=natijalar.xlsx'
-        wb.save(response)
-        return response
+        if request.query_params.get('export_format') == 'csv':
+            return csv_response(queryset, request=request)
+        return xlsx_response(queryset, request=request)
 
 
 # MOVED OUTSIDE THE CLASS - This is the fix!
@@ -238,10 +191,8 @@ def export_docx_view(request):
     if not group_id:
         return HttpResponse("group_id parametri talab qilinadi", status=400)
 
-    template_path = os.path.join(
-        settings.BASE_DIR,
-        "apps", "results", "templates", "results", "docx", "vedmost_template.docx"
-    )
+    from .exports import VEDMOST_TEMPLATE
+    template_path = VEDMOST_TEMPLATE
 
     if not os.path.exists(template_path):
         return HttpResponse(
@@ -253,87 +204,11 @@ def export_docx_view(request):
     # ===== 1) MA'LUMOT YIG'ISH =====
     try:
         from apps.groups.models import Group
-        from apps.subjects.models import Subject
-        from apps.students.models import Student
-        from apps.tests.models import Test
+        from .exports import vedmost_docx_context
 
         group = Group.objects.get(id=group_id)
 
-        students = Student.objects.filter(group=group).order_by("full_name")
-
-        subjects = (
-            Subject.objects
-            .filter(tests__groups__id=group_id)
-            .distinct()
-            .order_by("name")
-        )
-
-        test_obj = Test.objects.filter(groups__id=group_id).first()
-        test_nomi = test_obj.title if test_obj else ""
-
-        # Har bir talaba uchun natija
-        results_list = []
-        for index, student in enumerate(students, start=1):
-            if subjects.exists():
-                all_scores = []
-                for subject in subjects:
-                    qs = TestResult.objects.filter(
-                        student=student,
-                        test__subject=subject,
-                    ).order_by("id")
-
-                    if qs.exists():
-                        subject_scores = ", ".join(str(r.score) for r in qs)
-                    else:
-                        subject_scores = "-"
-                    all_scores.append(subject_scores)
-                score_str = " | ".join(all_scores)
-            else:
-                # Fan bo'lmasa — oxirgi natijani olish
-                last = TestResult.objects.filter(student=student).order_by("id").last()
-                score_str = str(last.score) if last else "-"
-
-            results_list.append({
-                "number":    str(index),
-                "full_name": student.full_name,
-                "score":     score_str,
-                "signature": "",
-            })
-
-        # Statistika — har bir talaba bo'yicha eng oxirgi natijaga qarab
-        all_results = TestResult.objects.filter(student__group=group)
-        total_students = students.count()
-
-        grade_5 = all_results.filter(score__gte=86).values("student").distinct().count()
-        grade_4 = all_results.filter(score__gte=71, score__lt=86).values("student").distinct().count()
-        grade_3 = all_results.filter(score__gte=56, score__lt=71).values("student").distinct().count()
-        grade_2 = all_results.filter(score__lt=56).values("student").distinct().count()
-
-        # Fakultet va kurs — model maydoniga qarab xavfsiz olish
-        fakultet = (
-            getattr(group, "faculty", None)
-            or getattr(group, "fakultet", None)
-            or "—"
-        )
-        # Agar faculty — ForeignKey bo'lsa
-        if hasattr(fakultet, "name"):
-            fakultet = fakultet.name
-
-        kurs = getattr(group, "course", None) or getattr(group, "kurs", None) or ""
-
-        context = {
-            "Guruh":          group.name,
-            "Fakultet":       str(fakultet),
-            "Kursi":          f"{kurs}-kurs" if kurs else "—",
-            "Test_nomi":      test_nomi,
-            "Sana":           timezone.now().strftime("%d.%m.%Y"),
-            "results_table":  results_list,
-            "talabalar_soni": str(total_students),
-            "besh_soni":      str(grade_5),
-            "tort_soni":      str(grade_4),
-            "uch_soni":       str(grade_3),
-            "ikki_soni":      str(grade_2),
-        }
+        context = vedmost_docx_context(group)
 
     except Group.DoesNotExist:
         return HttpResponse(f"Guruh topilmadi: id={group_id}", status=404)
@@ -374,6 +249,7 @@ from apps.subjects.models import Subject
 from apps.students.models import Student
 from django.db.models import Sum, Prefetch
 from django.views import View
+from .reports import build_report
 from django.contrib.auth.mixins import LoginRequiredMixin
 
 from apps.directions.models import Direction
@@ -424,42 +300,9 @@ class VedmostView(LoginRequiredMixin, View):
                         context['selected_group'] = groups.filter(id=group_id).first()
                         
                         if context['selected_group']:
-                             # LOGIC TO GENERATE REPORT (Copied/Adapted from original)
-                            students = Student.objects.filter(group_id=group_id).order_by('full_name')
-                            subjects = Subject.objects.filter(tests__groups__id=group_id).distinct().order_by('name')
-                            
-                            report = []
-                            all_results = TestResult.objects.filter(
-                                student__group_id=group_id,
-                                test__subject__in=subjects
-                            ).select_related('test', 'test__subject', 'student').order_by('started_at')
-                            
-                            results_map = {} 
-                            for res in all_results:
-                                s_id = res.student.id
-                                sub_id = res.test.subject.id
-                                
-                                if s_id not in results_map:
-                                    results_map[s_id] = {}
-                                if sub_id not in results_map[s_id]:
-                                    results_map[s_id][sub_id] = []
-                                    
-                                results_map[s_id][sub_id].append(str(res.score))
-                            
-                            
-                            for student in students:
-                                student_row = {'student': student, 'scores': []}
-                                s_map = results_map.get(student.id, {})
-                                
-                                for subject in subjects:
-                                    scores_list = s_map.get(subject.id, [])
-                                    scores_str = ", ".join(scores_list) if scores_list else ""
-                                    student_row['scores'].append({'subject_id': subject.id, 'value': scores_str})
-                                
-                                report.append(student_row)
-
-                            context['subjects'] = subjects
-                            context['report'] = report
+                            report = build_report(group_id=group_id, assigned_subjects=True)
+                            context['subjects'] = report['subjects']
+                            context['report'] = report['rows']
 
             except Direction.DoesNotExist:
                 pass
@@ -525,111 +368,15 @@ class JamlanmaQaytnomaView(View):
                                 selected_group = Group.objects.get(id=group_id)
                                 context['selected_group'] = selected_group
                                 
-                                # 4. Generate Report
-                                students = Student.objects.filter(group=selected_group).order_by('full_name')
-                                
-                                subjects = Subject.objects.filter(
-                                    tests__results__student__group=selected_group
-                                ).distinct().order_by('name')
-                                
-                                # Pre-fetch results
-                                all_results = TestResult.objects.filter(
-                                    student__group=selected_group,
-                                    test__subject__in=subjects
-                                ).select_related('test', 'test__subject', 'student')
-                                
-                                results_map = {}
-                                for res in all_results:
-                                    s_id = res.student.id
-                                    sub_id = res.test.subject.id
-                                    
-                                    if s_id not in results_map: results_map[s_id] = {}
-                                    if sub_id not in results_map[s_id]: results_map[s_id][sub_id] = []
-                                    
-                                    results_map[s_id][sub_id].append(str(res.score))
-
-                                report = []
-                                for index, student in enumerate(students, 1):
-                                    row = {
-                                        'number': index,
-                                        'student': student,
-                                        'scores': []
-                                    }
-                                    s_map = results_map.get(student.id, {})
-                                    
-                                    for subject in subjects:
-                                        scores_list = s_map.get(subject.id, [])
-                                        scores_str = ", ".join(scores_list) if scores_list else ""
-                                        row['scores'].append({'subject_id': subject.id, 'value': scores_str})
-                                    
-                                    report.append(row)
-                                    
-                                context['subjects'] = subjects
-                                context['report'] = report
-                                
-                                # Calculate Statistics
-                                stats = []
-                                total_students_count = students.count()
-                                
-                                for subject in subjects:
-                                    subject_stats = {
-                                        'subject': subject,
-                                        'total': total_students_count,
-                                        'participated': 0,
-                                        'not_participated': 0,
-                                        'grade_5': 0,
-                                        'grade_4': 0,
-                                        'grade_3': 0,
-                                        'failed': 0
-                                    }
-                                    
-                                    # Get all results for this subject/group
-                                    subject_results = [r for r in all_results if r.test.subject.id == subject.id]
-                                    
-                                    unique_student_ids = set()
-                                    for res in subject_results:
-                                        unique_student_ids.add(res.student.id)
-                                        
-                                        grade = 0
-                                        if res.max_score == 50:
-                                            if res.score >= 40:
-                                                grade = 5
-                                            elif res.score >= 35:
-                                                grade = 4
-                                            elif res.score >= 30:
-                                                grade = 3
-                                            else:
-                                                grade = 2
-                                        else:
-                                            p = res.percentage
-                                            if p >= 90:
-                                                grade = 5
-                                            elif p >= 70:
-                                                grade = 4
-                                            elif p >= 60:
-                                                grade = 3
-                                            else:
-                                                grade = 2
-
-                                        if grade == 5:
-                                            subject_stats['grade_5'] += 1
-                                        elif grade == 4:
-                                            subject_stats['grade_4'] += 1
-                                        elif grade == 3:
-                                            subject_stats['grade_3'] += 1
-                                        else:
-                                            subject_stats['failed'] += 1
-                                    
-                                    subject_stats['participated'] = len(unique_student_ids) 
-                                    subject_stats['not_participated'] = total_students_count - subject_stats['participated']
-                                    
-                                    stats.append(subject_stats)
-                                    
-                                context['stats'] = stats
+                                # 4. Generate Report (pivot + statistics in one pass)
+                                data = build_report(group_id=selected_group.id)
+                                context['subjects'] = data['subjects']
+                                context['report'] = data['rows']
+                                context['stats'] = data['stats']
                                 
                                 # 5. Export Logic
                                 if export_excel == 'true':
-                                    return self.export_to_excel(selected_group, subjects, report, stats)
+                                    return self.export_to_excel(selected_group, data['subjects'], data['rows'], data['stats'])
 
                             except Group.DoesNotExist:
                                 pass
@@ -649,99 +396,104 @@ class JamlanmaQaytnomaView(View):
             )
 
     def export_to_excel(self, group, subjects, report, stats):
-        import openpyxl
-        from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-        from django.http import HttpResponse
-
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = f"{group.name} - Jamlanma"
-        
-        # Styles
-        bold_font = Font(bold=True)
-        center_align = Alignment(horizontal='center', vertical='center')
-        thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-        bg_yellow = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-
-        # Header 1: Title
-        ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=3 + len(subjects))
-        ws['A1'] = f"Guruh: {group.name} | Kurs: {group.course} | Yo'nalish: {group.direction}"
-        ws['A1'].font = bold_font
-        ws['A1'].alignment = center_align
-
-        # Header 2: Column Names
-        headers = ["№", "F.I.Sh", "ID"] + [s.name for s in subjects]
-        ws.append(headers)
-        
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=2, column=col_num)
-            cell.font = bold_font
-            cell.alignment = center_align
-            cell.border = thin_border
-
-        # Data Rows
-        for row_data in report:
-            student = row_data['student']
-            scores = [s['value'] for s in row_data['scores']]
-            
-            row_cells = [row_data['number'], student.full_name, student.student_id] + scores
-            ws.append(row_cells)
-            
-            # Apply border to data cells
-            for col_num in range(1, len(row_cells) + 1):
-                cell = ws.cell(row=ws.max_row, column=col_num)
-                cell.border = thin_border
-                if col_num > 3: # Score columns
-                    cell.alignment = center_align
-        
-        # Statistics Section
-        ws.append([]) # Empty row
-        start_row = ws.max_row + 1
-        
-        stat_labels = [
-            ("Jami talabalar", 'total'),
-            ("Qatnashdi", 'participated'),
-            ("Qatnashmadi", 'not_participated'),
-            ("5 baho (A'lo)", 'grade_5'),
-            ("4 baho (Yaxshi)", 'grade_4'),
-            ("3 baho (Qoniqarli)", 'grade_3'),
-            ("Yiqildi (Qoniqarsiz)", 'failed'),
-        ]
-
-        for label, key in stat_labels:
-            row_cells = ["", label, ""] 
-            for stat in stats:
-                row_cells.append(stat[key])
-            
-            ws.append(row_cells)
-            
-            # Formatting
-            current_row = ws.max_row
-            label_cell = ws.cell(row=current_row, column=2)
-            label_cell.font = bold_font
-            label_cell.border = thin_border
-            
-            for i in range(len(stats)):
-                val_cell = ws.cell(row=current_row, column=4 + i)
-                val_cell.alignment = center_align
-                val_cell.border = thin_border
-
-
-        # Adjust column widths
-        ws.column_dimensions['A'].width = 5
-        ws.column_dimensions['B'].width = 30
-        ws.column_dimensions['C'].width = 15
-        for i in range(len(subjects)):
-            col_letter = openpyxl.utils.get_column_letter(4 + i)
-            ws.column_dimensions[col_letter].width = 15
+        from .exports import jamlanma_workbook
 
         response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
         timestamp = timezone.now().strftime('%d_%m_%Y_%H_%M_%S')
         filename = f"Jamlanma_{group.name}_{timestamp}.xlsx"
         safe_filename = escape_uri_path(filename)
         response['Content-Disposition'] = f"attachment; filename*=UTF-8''{safe_filename}"
-        wb.save(response)
+        jamlanma_workbook(group, subjects, report, stats).save(response)
         return response
 
+def can_export(user, kind):
+    """admin/dean export everything; the Jamlanma also whoever may view the vedmost module."""
+    role = getattr(user, 'role', None)
+    if role in ('admin', 'dean'):
+        return True
+    if kind == 'jamlanma_xlsx' and role != 'student':
+        from apps.accounts.models import ModuleAccess
+        return ModuleAccess.objects.filter(user=user, module='vedmost', can_view=True).exists()
+    return False
+
+
+def serialize_export_job(job, reused=False):
+    data = {
+        'receipt': str(job.receipt),
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'attempts': job.attempts,
+        'reused': reused,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    }
+    if job.status == 'done':
+        data['download_url'] = f"/api/results/exports/{job.receipt}/download/"
+    if job.status == 'failed':
+        data['error'] = job.last_error
+    return data
+
+
+class ResultFeedView(APIView):
+    """Bulk NDJSON/CSV results feed for BI (see feed.py)."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        from .feed import parse_feed_params, feed_response
+        if request.user.role not in ['admin', 'dean']:
+            return Response({'error': "Huquq yo'q"}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            params = parse_feed_params(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return feed_response(params, request)
+
+
+class ExportJobView(APIView):
+    """POST {kind, params}: queue a report export, or reuse an identical one."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        from .export_jobs import request_export
+        kind = request.data.get('kind')
+        if not can_export(request.user, kind):
+            return Response({'error': "Huquq yo'q"}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            job, created = request_export(request.user, kind, request.data.get('params'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            serialize_export_job(job, reused=not created),
+            status=status.HTTP_200_OK if job.status == 'done' else status.HTTP_202_ACCEPTED,
+        )
+
+
+class ExportJobStatusView(APIView):
+    """Polled by the page until the job is done."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_job(self, request, receipt):
+        from django.http import Http404
+        from .models import ExportJob
+        job = ExportJob.objects.filter(receipt=receipt).first()
+        if job is None or not can_export(request.user, job.kind):
+            raise Http404
+        return job
+
+    def get(self, request, receipt):
+        return Response(serialize_export_job(self.get_job(request, receipt)))
+
+
+class ExportJobDownloadView(ExportJobStatusView):
+    def get(self, request, receipt):
+        from django.http import FileResponse
+        from .export_jobs import download_name
+        job = self.get_job(request, receipt)
+        if job.status != 'done' or not job.file:
+            return Response({'error': "Fayl hali tayyor emas"}, status=status.HTTP_409_CONFLICT)
+        return FileResponse(job.file.open('rb'), as_attachment=True, filename=download_name(job))
+
+
 def result_list_view(request):
     return render(request, 'crud_list.html', {'page': 'results'})
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""
+Admission control for the start of an exam.
+
+At Test.start_date every student of every assigned group calls start_test at
+once. Instead of letting those requests queue inside gunicorn, each start
+takes a token from a per-test and a global bucket. Buckets refill once per
+second (capacity = rate per second) and live in the shared cache, so the
+limit holds across workers. A student who gets no token receives a wait
+ticket (Retry-After seconds, proportional to the queue in front of them)
+and the take-test page retries with jitter.
+
+Students already admitted to a test (resumes, reloads) skip the buckets.
+start_test asks for admission only after a start has passed its checks, and
+the global token is taken only once the per-test bucket has let it through.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+ADMITTED_KEY = 'admission:admitted:{test_id}:{user_id}'
+WAITING_KEY = 'admission:waiting:{test_id}:{user_id}'
+BUCKET_KEY = 'admission:bucket:{scope}:{second}'
+STATS_KEY = 'admission:stats:{test_id}:{name}'
+
+# Gauges expire once an exam rush is over, which also clears drift from
+# students who gave up while waiting.
+STATS_TTL = 10 * 60
+
+DEFAULTS = {
+    'GLOBAL_RATE': 100,     # starts per second, all tests together (0 = unlimited)
+    'PER_TEST_RATE': 50,    # starts per second for one test (0 = unlimited)
+    'MAX_WAIT': 60,         # upper bound of a single Retry-After, seconds
+    'ADMITTED_TTL': 4 * 60 * 60,
+}
+
+
+def _config(name):
+    return getattr(settings, 'EXAM_ADMISSION', {}).get(name, DEFAULTS[name])
+
+
+def _incr(key, timeout, delta=1):
+    cache.add(key, 0, timeout=timeout)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # expired between add() and incr()
+        cache.set(key, max(delta, 0), timeout=timeout)
+        return max(delta, 0)
+
+
+def _take_token(scope, rate, second):
+    """Returns 0 if a token was taken, otherwise the seconds to wait."""
+    if not rate:
+        return 0
+    position = _incr(BUCKET_KEY.format(scope=scope, second=second), timeout=5)
+    if position <= rate:
+        return 0
+    return math.ceil((position - rate) / rate)
+
+
+def _return_token(scope, rate, second):
+    if rate:
+        _incr(BUCKET_KEY.format(scope=scope, second=second), timeout=5, delta=-1)
+
+
+def admit(test_id, user_id):
+    """
+    Try to admit a student to start a test. Call it only once the start has
+    been validated, so rejected requests don't use up tokens.
+    Returns None when admitted, otherwise the Retry-After in seconds.
+    """
+    admitted_key = ADMITTED_KEY.format(test_id=test_id, user_id=user_id)
+    if cache.get(admitted_key):
+        return None
+
+    second = int(time.time())
+    # per-test first: a start refused by its own test must not eat global capacity
+    test_scope, test_rate = f'test:{test_id}', _config('PER_TEST_RATE')
+    wait = _take_token(test_scope, test_rate, second)
+    if not wait:
+        wait = _take_token('global', _config('GLOBAL_RATE'), second)
+        if wait:
+            _return_token(test_scope, test_rate, second)
+
+    waiting_key = WAITING_KEY.format(test_id=test_id, user_id=user_id)
+    if wait:
+        wait = min(wait, _config('MAX_WAIT'))
+        # count each waiting student once, however often they retry
+        if cache.add(waiting_key, 1, timeout=_config('MAX_WAIT') * 2):
+            _incr(STATS_KEY.format(test_id=test_id, name='waiting'), STATS_TTL)
+        else:
+            cache.touch(waiting_key, _config('MAX_WAIT') * 2)
+        return wait
+
+    cache.set(admitted_key, 1, timeout=_config('ADMITTED_TTL'))
+    _incr(STATS_KEY.format(test_id=test_id, name='admitted'), STATS_TTL)
+    if cache.get(waiting_key):
+        cache.delete(waiting_key)
+        _incr(STATS_KEY.format(test_id=test_id, name='waiting'), STATS_TTL, delta=-1)
+    return None
+
+
+def get_admission_stats(test_ids):
+    """{test_id: {'admitted': n, 'waiting': n}} for the monitoring dashboard."""
+    keys = {
+        (test_id, name): STATS_KEY.format(test_id=test_id, name=name)
+        for test_id in test_ids for name in ('admitted', 'waiting')
+    }
+    values = cache.get_many(keys.values())
+    stats = {}
+    for (test_id, name), key in keys.items():
+        stats.setdefault(test_id, {})[name] = max(values.get(key, 0), 0)
+    return stats
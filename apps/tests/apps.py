@@ -3,3 +3,6 @@ from django.apps import AppConfig
 class TestsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.tests'
+
+    def ready(self):
+        import apps.tests.signals
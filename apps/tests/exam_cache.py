@@ -0,0 +1,223 @@
+"""
+Compiled exam payloads.
+
+start_test used to load the whole question pool and run the full TestSerializer
+(questions, assignments, groups, curators) for every student. Instead we build
+one client-ready payload per test, keep it in the cache under the test's
+content version and slice it per attempt.
+
+The payload only holds test metadata and the ordered list of question ids, so
+a pool of 10k+ questions costs a list of ints. Question bodies are cached one
+key per question and fetched with get_many for the questions of an attempt.
+
+The content version is bumped (see signals.py) whenever a Test, Question or
+TestAssignment changes, so a stale payload is never served: the old entries are
+simply no longer looked up and expire on their own.
+
+The rendered start response of an attempt gets a strong ETag built from the
+content version and the attempt's selection. Reloads answer If-None-Match
+from the cache alone, and the gzip/zstd encodings of a body are compressed
+once and cached under its ETag.
+"""
+import gzip
+import hashlib
+import random
+import time
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is always available
+    zstandard = None
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Test, Question
+
+VERSION_KEY = 'exam:version:{test_id}'
+PAYLOAD_KEY = 'exam:payload:{test_id}:{version}'
+QUESTION_KEY = 'exam:question:{test_id}:{version}:{question_id}'
+ANSWER_KEY = 'exam:answers:{test_id}:{version}'
+ATTEMPT_KEY = 'exam:attempt:{test_id}:{user_id}'
+BODY_KEY = 'exam:body:{etag}:{encoding}'
+
+# Bodies smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 1024
+
+# Fields sent to the student. correct_answer must never be here.
+QUESTION_FIELDS = ('id', 'question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'score', 'order')
+
+
+def _payload_ttl():
+    return getattr(settings, 'EXAM_PAYLOAD_TTL', 6 * 60 * 60)
+
+
+def get_content_version(test_id):
+    """Current content version of a test (created lazily)."""
+    key = VERSION_KEY.format(test_id=test_id)
+    version = cache.get(key)
+    if version is None:
+        # time based so a version lost from the cache never collides with an old payload
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_content_version(test_id):
+    """Invalidate every cached artifact of a test (payload, questions, answer key, ...)."""
+    def _bump():
+        cache.set(VERSION_KEY.format(test_id=test_id), time.time_ns(), timeout=None)
+
+    # Bump after commit, otherwise a concurrent request could rebuild the
+    # payload from the old rows under the new version.
+    transaction.on_commit(_bump)
+
+
+def build_exam_payload(test):
+    """Compile test metadata and the ordered question id pool."""
+    from .serializers import ExamTestSerializer
+
+    question_ids = list(
+        Question.objects.filter(test_id=test.id).order_by('order', 'id').values_list('id', flat=True)
+    )
+    return {
+        'test': ExamTestSerializer(test).data,
+        'question_ids': question_ids,
+    }
+
+
+def get_exam_payload(test_id, test=None):
+    """
+    Return the compiled payload for a test, building it on a cache miss.
+    `test` may be passed to avoid re-reading the row when the caller has it.
+    """
+    version = get_content_version(test_id)
+    key = PAYLOAD_KEY.format(test_id=test_id, version=version)
+    payload = cache.get(key)
+    if payload is None:
+        if test is None:
+            test = Test.objects.select_related('subject').get(pk=test_id)
+        payload = build_exam_payload(test)
+        payload['version'] = version
+        cache.set(key, payload, timeout=_payload_ttl())
+    return payload
+
+
+def slice_questions(payload, question_ids):
+    """
+    Client-ready questions of one attempt, in the attempt's order.
+    Only questions missing from the cache are read from the database.
+    Ids that are no longer in the pool are skipped.
+    """
+    test_id = payload['test']['id']
+    version = payload['version']
+    keys = {qid: QUESTION_KEY.format(test_id=test_id, version=version, question_id=qid) for qid in question_ids}
+    cached = cache.get_many(keys.values())
+    found = {qid: cached[key] for qid, key in keys.items() if key in cached}
+
+    missing = [qid for qid in question_ids if qid not in found]
+    if missing:
+        rows = Question.objects.filter(test_id=test_id, id__in=missing).values(*QUESTION_FIELDS)
+        fresh = {row['id']: row for row in rows}
+        cache.set_many({keys[qid]: row for qid, row in fresh.items()}, timeout=_payload_ttl())
+        found.update(fresh)
+
+    return [found[qid] for qid in question_ids if qid in found]
+
+
+def get_answer_key(test_id):
+    """
+    Answer key of a test: {question_id: (correct_answer, score)}.
+    Loaded with one query per content version; never sent to clients.
+    """
+    version = get_content_version(test_id)
+    key = ANSWER_KEY.format(test_id=test_id, version=version)
+    answer_key = cache.get(key)
+    if answer_key is None:
+        rows = Question.objects.filter(test_id=test_id).values_list('id', 'correct_answer', 'score')
+        answer_key = {qid: (correct, score) for qid, correct, score in rows}
+        cache.set(key, answer_key, timeout=_payload_ttl())
+    return answer_key
+
+
+def select_question_ids(pool_ids, count, rng=None):
+    """
+    Pick `count` question ids for one attempt.
+
+    Stratified sampling: the ordered pool is split into `count` equal strata and
+    one question is drawn from each, so every part of the pool (questions are
+    usually imported topic by topic) is represented. Works on the id list only
+    and costs O(count) regardless of the pool size.
+    """
+    rng = rng or random.Random()
+    size = len(pool_ids)
+    if count <= 0 or count >= size:
+        selected = list(pool_ids)
+    else:
+        selected = []
+        for i in range(count):
+            start = (i * size) // count
+            end = ((i + 1) * size) // count
+            selected.append(pool_ids[start + rng.randrange(end - start)])
+    rng.shuffle(selected)
+    return selected
+
+
+def attempt_etag(version, question_ids, extra=''):
+    """Strong ETag of an attempt's start payload."""
+    digest = hashlib.sha1(f"{question_ids}|{extra}".encode()).hexdigest()[:16]
+    return f'"{version}-{digest}"'
+
+
+def remember_attempt(test_id, user_id, version, etag, student_id=None, group_id=None):
+    cache.set(ATTEMPT_KEY.format(test_id=test_id, user_id=user_id),
+              {'version': version, 'etag': etag, 'student_id': student_id, 'group_id': group_id},
+              timeout=_payload_ttl())
+
+
+def get_attempt(test_id, user_id):
+    """Cached info of the student's open attempt (any version), or None."""
+    return cache.get(ATTEMPT_KEY.format(test_id=test_id, user_id=user_id))
+
+
+def forget_attempt(test_id, user_id):
+    """Called when an attempt is closed so reloads no longer get a 304."""
+    cache.delete(ATTEMPT_KEY.format(test_id=test_id, user_id=user_id))
+
+
+def get_attempt_etag(test_id, user_id):
+    """ETag of the student's open attempt, or None if unknown or outdated."""
+    attempt = cache.get(ATTEMPT_KEY.format(test_id=test_id, user_id=user_id))
+    if attempt and attempt['version'] == get_content_version(test_id):
+        return attempt['etag']
+    return None
+
+
+def choose_encoding(accept_encoding):
+    accepted = {part.split(';')[0].strip().lower() for part in (accept_encoding or '').split(',')}
+    if zstandard is not None and 'zstd' in accepted:
+        return 'zstd'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def encode_body(etag, body, accept_encoding):
+    """
+    Return (body, content_encoding) for the client. Compressed variants are
+    cached per ETag, so each body is compressed once per encoding.
+    """
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None or len(body) < COMPRESS_MIN_SIZE:
+        return body, None
+
+    key = BODY_KEY.format(etag=etag.strip('"'), encoding=encoding)
+    compressed = cache.get(key)
+    if compressed is None:
+        if encoding == 'zstd':
+            compressed = zstandard.ZstdCompressor(level=10).compress(body)
+        else:
+            compressed = gzip.compress(body, compresslevel=6)
+        cache.set(key, compressed, timeout=_payload_ttl())
+    return compressed, encoding
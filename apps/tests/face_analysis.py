@@ -0,0 +1,238 @@
+"""
+Offline face-presence analysis of proctoring snapshots.
+
+The analyze_snapshots command walks TestSnapshot rows in id order, batch by
+batch, and runs an OpenCV Haar cascade on every frame in a process pool
+(CPU only, one OpenCV thread per process). Each frame gets face_count and a
+face_flag:
+
+    covered         the picture is (almost) black or flat - camera taped over
+    no_face         no face found
+    multiple_faces  more than one face
+
+Consecutive flagged frames of a student become one ViolationEvent ('face',
+or 'camera' for a covered camera) with a count, so they show up in the
+monitoring alerts and violation summaries next to the page-reported ones.
+
+Progress is checkpointed in GlobalSetting (the last analysed snapshot id)
+after every batch, so a restarted worker resumes where it stopped. Ids are
+handed out before the writer's transaction commits, so a frame can become
+visible after the checkpoint has passed its id; every batch therefore also
+picks up unanalysed frames (face_count NULL) up to RESCAN_WINDOW ids behind
+the checkpoint. Frames that can't be read or decoded get face_count 0 and
+face_flag 'unreadable' so they aren't picked up again. Compaction packs an
+attempt once all its frames are analysed and the newest one is older than
+SETTLE_AFTER seconds (settled_before()), so it doesn't depend on later
+uploads pushing the checkpoint forward. The page
+sends one ~300x200 frame per student every 10s: a 1,500-student exam is
+~150 frames/s before duplicate dropping, a few ms of CPU per frame here.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+try:
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from apps.monitoring.models import GlobalSetting, ViolationEvent
+from apps.results.models import TestResult
+from .models import TestSnapshot
+
+CHECKPOINT_KEY = 'face_analysis_last_id'
+MAX_WIDTH = 320  # larger frames are scaled down before detection
+
+# face_flag -> (ViolationEvent type, details)
+FLAG_VIOLATIONS = {
+    'no_face': ('face', "Kamerada yuz aniqlanmadi"),
+    'multiple_faces': ('face', "Kamerada bir nechta yuz"),
+    'covered': ('camera', "Kamera yopilgan yoki qorong'i"),
+}
+
+_cascade = None
+
+
+def get_config():
+    config = {'ENABLED': True, 'WORKERS': None, 'MIN_FACE': 40, 'DARK_LEVEL': 25, 'FLAT_LEVEL': 10,
+              'RESCAN_WINDOW': 2000, 'SETTLE_AFTER': 600}
+    config.update(getattr(settings, 'FACE_ANALYSIS', {}))
+    return config
+
+
+def _detector():
+    """Haar cascade of this process, loaded on first use."""
+    global _cascade
+    if _cascade is None:
+        cv2.setNumThreads(1)  # the pool is the parallelism
+        _cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return _cascade
+
+
+def analyse_frame(data, min_face=40):
+    """(faces, brightness, contrast) of a JPEG, or None if it can't be decoded. Runs in the pool."""
+    gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None
+    height, width = gray.shape
+    if width > MAX_WIDTH:
+        gray = cv2.resize(gray, (MAX_WIDTH, int(height * MAX_WIDTH / width)), interpolation=cv2.INTER_AREA)
+
+    mean, std = cv2.meanStdDev(gray)
+    brightness, contrast = float(mean[0][0]), float(std[0][0])
+    faces = _detector().detectMultiScale(
+        cv2.equalizeHist(gray), scaleFactor=1.15, minNeighbors=5, minSize=(min_face, min_face)
+    )
+    return len(faces), brightness, contrast
+
+
+def settled_before():
+    """
+    Attempts whose frames are all analysed and older than this are done with;
+    None when the analysis is switched off (FACE_ANALYSIS['ENABLED']).
+    """
+    config = get_config()
+    if not config['ENABLED']:
+        return None
+    return timezone.now() - timedelta(seconds=config['SETTLE_AFTER'])
+
+
+def classify(faces, brightness, contrast, dark_level=25, flat_level=10):
+    if brightness < dark_level or contrast < flat_level:
+        return 'covered'
+    if faces == 0:
+        return 'no_face'
+    if faces > 1:
+        return 'multiple_faces'
+    return ''
+
+
+class FaceAnalyzer:
+    """
+    Analyses snapshots after the checkpoint. Keeps the open ViolationEvent of
+    each (test, student, flag) in memory so a run of bad frames across
+    batches stays one row.
+    """
+
+    def __init__(self, workers=None):
+        self.config = get_config()
+        self.workers = self.config['WORKERS'] if workers is None else workers
+        self.window = getattr(settings, 'VIOLATION_DEDUPE_WINDOW', 30)
+        self.open_events = {}  # (test_id, student_id, flag) -> (event id, last frame time)
+        self.pool = None
+        if self.workers != 0:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
+
+    def get_checkpoint(self):
+        return int(GlobalSetting.get_value(CHECKPOINT_KEY, 0))
+
+    def set_checkpoint(self, snapshot_id):
+        GlobalSetting.set_value(CHECKPOINT_KEY, snapshot_id)
+
+    def _read(self, snapshot):
+        try:
+            with default_storage.open(snapshot.image.name, 'rb') as f:
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def _analyse(self, blobs):
+        analyse = partial(analyse_frame, min_face=self.config['MIN_FACE'])
+        if self.pool is None:
+            return [analyse(data) for data in blobs]
+        return list(self.pool.map(analyse, blobs, chunksize=16))
+
+    def process_batch(self, limit=500):
+        """Analyse up to `limit` snapshots past the checkpoint (or left behind it). Returns (scanned, flagged)."""
+        start = self.get_checkpoint()
+        snapshots = list(
+            TestSnapshot.objects.filter(id__gt=start - self.config['RESCAN_WINDOW'])
+            .filter(Q(id__gt=start) | Q(face_count__isnull=True))
+            .select_related('student').order_by('id')[:limit]
+        )
+        if not snapshots:
+            return 0, 0
+
+        blobs = {snap.id: self._read(snap) for snap in snapshots}
+        readable = [snap for snap in snapshots if blobs[snap.id]]
+        results = dict(zip((snap.id for snap in readable), self._analyse([blobs[snap.id] for snap in readable])))
+
+        flagged = []
+        for snap in snapshots:
+            result = results.get(snap.id)
+            if result is None:
+                # missing file or not a decodable image
+                snap.face_count, snap.face_flag = 0, 'unreadable'
+                continue
+            faces, brightness, contrast = result
+            snap.face_count = faces
+            snap.face_flag = classify(faces, brightness, contrast,
+                                      self.config['DARK_LEVEL'], self.config['FLAT_LEVEL'])
+            if snap.face_flag:
+                flagged.append(snap)
+
+        TestSnapshot.objects.bulk_update(snapshots, ['face_count', 'face_flag'])
+        self._record_violations(flagged)
+        self.set_checkpoint(max(start, snapshots[-1].id))
+        return len(snapshots), len(flagged)
+
+    def _record_violations(self, flagged):
+        if not flagged:
+            return
+        attempts = {
+            (row['test_id'], row['student_id']): row['last_id']
+            for row in TestResult.objects.filter(
+                test_id__in={snap.test_id for snap in flagged},
+                student_id__in={snap.student_id for snap in flagged},
+            ).values('test_id', 'student_id').annotate(last_id=Max('id'))
+        }
+
+        runs = []  # [key, [snapshots]] in frame order
+        current = {}
+        for snap in flagged:
+            key = (snap.test_id, snap.student_id, snap.face_flag)
+            run = current.get(key)
+            if run and (snap.timestamp - run[1][-1].timestamp).total_seconds() <= self.window:
+                run[1].append(snap)
+            else:
+                run = current[key] = [key, [snap]]
+                runs.append(run)
+
+        new_events = []
+        for key, snaps in runs:
+            event_id, last_seen = self.open_events.get(key, (None, None))
+            if event_id and (snaps[0].timestamp - last_seen).total_seconds() <= self.window and \
+                    ViolationEvent.objects.filter(id=event_id).update(
+                        count=F('count') + len(snaps), last_client_timestamp=snaps[-1].timestamp):
+                self.open_events[key] = (event_id, snaps[-1].timestamp)
+                continue
+
+            test_id, student_id, flag = key
+            violation_type, details = FLAG_VIOLATIONS[flag]
+            new_events.append((key, snaps[-1].timestamp, ViolationEvent(
+                user_id=snaps[0].student.user_id,
+                student_id=student_id,
+                test_id=test_id,
+                test_result_id=attempts.get((test_id, student_id)),
+                violation_type=violation_type,
+                details=details,
+                client_timestamp=snaps[0].timestamp,
+                last_client_timestamp=snaps[-1].timestamp,
+                count=len(snaps),
+            )))
+
+        if new_events:
+            ViolationEvent.objects.bulk_create([event for _, _, event in new_events])
+            for key, last_seen, event in new_events:
+                if event.id:
+                    self.open_events[key] = (event.id, last_seen)
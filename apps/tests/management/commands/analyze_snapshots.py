@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.tests import face_analysis
+
+
+class Command(BaseCommand):
+    help = "Kamera rasmlarida yuzni tekshiradi (yuz yo'q, bir nechta yuz, kamera yopilgan) va qoidabuzarlik yozadi."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Bir marta olinadigan rasmlar soni")
+        parser.add_argument('--workers', type=int, help="Jarayonlar soni (standart: CPU soni, 0 = bitta jarayonda)")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Yangi rasm bo'lmaganda kutish (soniya)")
+        parser.add_argument('--once', action='store_true', help="Mavjud rasmlarni bir marta tekshirib chiqish")
+        parser.add_argument('--from-id', type=int, help="Nazorat nuqtasini shu rasm id sidan qayta boshlash")
+
+    def handle(self, *args, **options):
+        if face_analysis.cv2 is None:
+            raise CommandError("opencv-contrib-python paketi o'rnatilmagan")
+
+        analyzer = face_analysis.FaceAnalyzer(workers=options['workers'])
+        if options['from_id'] is not None:
+            analyzer.set_checkpoint(options['from_id'])
+        self.stdout.write(
+            f"Face analysis started (batch={options['batch_size']}, from id {analyzer.get_checkpoint()})"
+        )
+
+        try:
+            while True:
+                started = time.monotonic()
+                scanned, flagged = analyzer.process_batch(options['batch_size'])
+                if scanned:
+                    rate = scanned / max(time.monotonic() - started, 0.001)
+                    self.stdout.write(f"Scanned: {scanned}, flagged: {flagged} ({rate:.0f} frames/s)")
+                    continue
+
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        finally:
+            analyzer.close()
@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from apps.tests.models import Test, TestSnapshot
+from apps.tests import face_analysis, snapshot_archive
+
+
+class Command(BaseCommand):
+    help = "Yakunlangan testlarning kamera rasmlarini har bir urinish uchun bitta arxivga yig'adi."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test', type=int, help="Faqat shu test (holatidan qat'i nazar)")
+        parser.add_argument('--grace-hours', type=float, default=1.0,
+                            help="Test tugaganidan keyin necha soat kutish")
+        parser.add_argument('--dry-run', action='store_true', help="Faqat nima qilinishini ko'rsatish")
+
+    def handle(self, *args, **options):
+        if snapshot_archive.zstandard is None:
+            raise CommandError("zstandard paketi o'rnatilmagan")
+
+        if options['test']:
+            tests = Test.objects.filter(id=options['test'])
+        else:
+            cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+            tests = Test.objects.filter(Q(status='completed') | Q(end_date__lt=cutoff))
+
+        # attempts whose frames the face analysis hasn't finished wait for a later run
+        settled = face_analysis.settled_before()
+        pairs = (
+            TestSnapshot.objects.filter(test__in=tests)
+            .values_list('test_id', 'student_id')
+            .annotate(last_id=Max('id'), last_at=Max('timestamp'),
+                      pending=Count('id', filter=Q(face_count__isnull=True)))
+            .order_by('test_id', 'student_id')
+        )
+
+        attempts = frames = waiting = 0
+        for test_id, student_id, last_id, last_at, pending in pairs:
+            if settled is not None and (pending or last_at > settled):
+                waiting += 1
+                continue
+            if options['dry_run']:
+                self.stdout.write(f"test={test_id} student={student_id}")
+                continue
+            frames += snapshot_archive.pack_attempt(test_id, student_id, max_id=last_id,
+                                                    analysed_only=settled is not None)
+            attempts += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Packed {frames} frames into {attempts} archives"))
+        if waiting:
+            self.stdout.write(f"{waiting} attempts wait for face analysis")
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.tests.snapshot_ingest import SnapshotWriter
+
+
+class Command(BaseCommand):
+    help = "Kamera rasmlarini navbatdan (spool) saqlaydi, takroriy kadrlarni tashlab yuboradi."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help="Bir marta olinadigan rasmlar soni")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Navbat bo'sh bo'lganda kutish (soniya)")
+        parser.add_argument('--once', action='store_true', help="Navbatni bir marta bo'shatib chiqish")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        writer = SnapshotWriter()
+        self.stdout.write(f"Snapshot writer started (batch={batch_size})")
+
+        while True:
+            stored, dropped = writer.process_batch(batch_size)
+            if stored or dropped:
+                self.stdout.write(f"Stored: {stored}, dropped: {dropped}")
+                continue
+
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:27
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0005_test_is_archived'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testsnapshot',
+            name='phash',
+            field=models.CharField(blank=True, default='', help_text='Perceptual hash (dHash) of the frame', max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='testsnapshot',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0004_student_camera_mode'),
+        ('tests', '0006_testsnapshot_phash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archive', models.FileField(upload_to='snapshot_archives/%Y/%m/')),
+                ('frames', models.JSONField(default=list, help_text='[[timestamp, offset, length, phash], ...]')),
+                ('frame_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot_archives', to='students.student')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot_archives', to='tests.test')),
+            ],
+            options={
+                'unique_together': {('test', 'student')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0004_student_camera_mode'),
+        ('tests', '0007_snapshotarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(blank=True, upload_to='snapshots/%Y/%m/%d/')),
+                ('phash', models.CharField(blank=True, default='', max_length=16)),
+                ('captured_at', models.DateTimeField(blank=True, null=True)),
+                ('seen_at', models.DateTimeField(db_index=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='latest_snapshots', to='students.student')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='latest_snapshots', to='tests.test')),
+            ],
+            options={
+                'unique_together': {('student', 'test')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0008_latestsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testsnapshot',
+            name='face_count',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='testsnapshot',
+            name='face_flag',
+            field=models.CharField(blank=True, choices=[('', 'Normal'), ('no_face', "Yuz yo'q"), ('multiple_faces', 'Bir nechta yuz'), ('covered', 'Kamera yopilgan')], default='', max_length=20),
+        ),
+    ]
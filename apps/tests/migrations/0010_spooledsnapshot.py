@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0004_student_camera_mode'),
+        ('tests', '0009_testsnapshot_face_flag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpooledSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField()),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='students.student')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tests.test')),
+            ],
+        ),
+    ]
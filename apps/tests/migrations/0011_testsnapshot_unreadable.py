@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0010_spooledsnapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='testsnapshot',
+            name='face_flag',
+            field=models.CharField(blank=True, choices=[('', 'Normal'), ('no_face', "Yuz yo'q"), ('multiple_faces', 'Bir nechta yuz'), ('covered', 'Kamera yopilgan'), ('unreadable', "Rasmni o'qib bo'lmadi")], default='', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0011_testsnapshot_unreadable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='paused_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from apps.subjects.models import Subject
 from apps.groups.models import Group
 
@@ -21,6 +22,8 @@ class Test(models.Model):
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
+    # start of the current pause; resuming moves end_date by the paused time
+    paused_at = models.DateTimeField(null=True, blank=True)
     is_archived = models.BooleanField(default=False)
     allow_mobile_access = models.BooleanField(default=True, help_text="Telefondan kirishga ruxsat berish")
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='created_tests')
@@ -29,6 +32,17 @@ class Test(models.Model):
     def __str__(self):
         return f"{self.title} ({self.subject.name})"
 
+    def save(self, *args, **kwargs):
+        if self.status == 'paused' and self.paused_at is None:
+            self.paused_at = timezone.now()
+        elif self.status != 'paused' and self.paused_at is not None:
+            if self.status == 'active':
+                self.end_date += timezone.now() - self.paused_at
+            self.paused_at = None
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'paused_at', 'end_date'}
+        super().save(*args, **kwargs)
+
 class Question(models.Model):
     test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='questions')
     question_text = models.TextField()
@@ -56,7 +70,70 @@ class TestSnapshot(models.Model):
     test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='snapshots')
     student = models.ForeignKey('students.Student', on_delete=models.CASCADE, related_name='snapshots')
     image = models.ImageField(upload_to='snapshots/%Y/%m/%d/')
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # capture time; set by the snapshot writer from the spool, hence not auto_now_add
+    timestamp = models.DateTimeField(default=timezone.now)
+    phash = models.CharField(max_length=16, blank=True, default='', help_text="Perceptual hash (dHash) of the frame")
+    # set by the analyze_snapshots command (face_analysis.py); None = not analysed yet
+    FACE_FLAG_CHOICES = (
+        ('', "Normal"),
+        ('no_face', "Yuz yo'q"),
+        ('multiple_faces', "Bir nechta yuz"),
+        ('covered', "Kamera yopilgan"),
+        ('unreadable', "Rasmni o'qib bo'lmadi"),
+    )
+    face_count = models.PositiveSmallIntegerField(null=True, blank=True)
+    face_flag = models.CharField(max_length=20, choices=FACE_FLAG_CHOICES, blank=True, default='')
 
     def __str__(self):
         return f"{self.student.full_name} - {self.timestamp}"
+
+
+class SpooledSnapshot(models.Model):
+    """
+    A raw upload waiting for the snapshot writer (snapshot_ingest.py). Kept
+    in the database so web and writer processes need no shared disk.
+    """
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='+')
+    student = models.ForeignKey('students.Student', on_delete=models.CASCADE, related_name='+')
+    data = models.BinaryField()
+    received_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.student_id} - {self.received_at}"
+
+
+class LatestSnapshot(models.Model):
+    """
+    Newest frame per student and test, upserted by the snapshot writer.
+    seen_at moves on every received frame (duplicates included), image only
+    when a changed frame is stored. The live proctoring grid reads this table.
+    """
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='latest_snapshots')
+    student = models.ForeignKey('students.Student', on_delete=models.CASCADE, related_name='latest_snapshots')
+    image = models.ImageField(upload_to='snapshots/%Y/%m/%d/', blank=True)
+    phash = models.CharField(max_length=16, blank=True, default='')
+    captured_at = models.DateTimeField(null=True, blank=True)
+    seen_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('student', 'test')
+
+    def __str__(self):
+        return f"{self.student.full_name} - {self.seen_at}"
+
+
+class SnapshotArchive(models.Model):
+    """All snapshots of one attempt packed into a single file (see snapshot_archive.py)."""
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='snapshot_archives')
+    student = models.ForeignKey('students.Student', on_delete=models.CASCADE, related_name='snapshot_archives')
+    archive = models.FileField(upload_to='snapshot_archives/%Y/%m/')
+    frames = models.JSONField(default=list, help_text="[[timestamp, offset, length, phash], ...]")
+    frame_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('test', 'student')
+
+    def __str__(self):
+        return f"{self.student.full_name} - {self.test.title} ({self.frame_count})"
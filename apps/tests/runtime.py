@@ -0,0 +1,108 @@
+"""
+Runtime state of a running exam.
+
+Status, dates, passing score and assigned groups of a test are kept in the
+cache as one record with its own version. start_test and submit_test check
+a student against this record instead of re-reading the Test row through
+the student queryset join, and the exam page polls /state (cache only) to
+learn about pauses and extensions within seconds.
+
+The record is rebuilt from the database whenever the test or its
+assignments change (signals.py) and by MassControlView after its bulk
+updates, which don't send signals. It also expires after EXAM_RUNTIME_TTL
+seconds, so a process that didn't see the change (a per-process cache in
+development) catches up within that time. Everything in it comes from the
+database: a pause is Test.paused_at, and resuming moves Test.end_date by
+the length of the pause, so paused time never counts against the exam.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Test, TestAssignment
+
+RUNTIME_KEY = 'exam:runtime:{test_id}'
+
+# A deleted/unknown test is cached briefly so probing ids stays cheap
+MISSING_TTL = 60
+
+
+def _ttl():
+    return getattr(settings, 'EXAM_RUNTIME_TTL', 15)
+
+
+def build_runtime(test_id):
+    """Record of a test from the database; None if it doesn't exist."""
+    row = (
+        Test.objects.filter(pk=test_id)
+        .values('status', 'start_date', 'end_date', 'paused_at', 'passing_score')
+        .first()
+    )
+    if row is None:
+        return None
+
+    return {
+        'test_id': int(test_id),
+        'version': time.time_ns(),
+        'status': row['status'],
+        'start_date': row['start_date'],
+        'end_date': row['end_date'],
+        'passing_score': row['passing_score'],
+        'group_ids': list(TestAssignment.objects.filter(test_id=test_id).values_list('group_id', flat=True)),
+        'paused_at': row['paused_at'] if row['status'] == 'paused' else None,
+    }
+
+
+def get_runtime(test_id):
+    """Cached runtime record of a test, or None if the test doesn't exist."""
+    key = RUNTIME_KEY.format(test_id=test_id)
+    state = cache.get(key)
+    if state is None:
+        state = build_runtime(test_id) or {'missing': True}
+        cache.add(key, state, timeout=MISSING_TTL if state.get('missing') else _ttl())
+        state = cache.get(key, state)
+    return None if state.get('missing') else state
+
+
+def refresh_runtime(test_id):
+    """Rebuild the record after commit (status/date/assignment changes)."""
+    def _refresh():
+        key = RUNTIME_KEY.format(test_id=test_id)
+        state = build_runtime(test_id)
+        if state is None:
+            cache.set(key, {'missing': True}, timeout=MISSING_TTL)
+        else:
+            cache.set(key, state, timeout=_ttl())
+
+    transaction.on_commit(_refresh)
+
+
+def is_running(state, now=None):
+    """Active and within its dates: answers may be written."""
+    now = now or timezone.now()
+    return state['status'] == 'active' and state['start_date'] <= now <= state['end_date']
+
+
+def effective_end(state, now=None):
+    """End of the exam; during a pause it moves on with the clock (resume makes it final)."""
+    if state['paused_at'] is None:
+        return state['end_date']
+    now = now or timezone.now()
+    return state['end_date'] + max(now - state['paused_at'], timedelta(0))
+
+
+def client_state(state):
+    """What the exam page gets from /state."""
+    now = timezone.now()
+    return {
+        'version': state['version'],
+        'status': state['status'],
+        'end_date': effective_end(state, now),
+        'paused': state['status'] == 'paused',
+        'paused_at': state['paused_at'],
+        'server_time': now,
+    }
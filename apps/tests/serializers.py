@@ -23,3 +23,13 @@ class TestSerializer(serializers.ModelSerializer):
     class Meta:
         model = Test
         fields = '__all__'
+        read_only_fields = ['paused_at']
+
+class ExamTestSerializer(serializers.ModelSerializer):
+    """Lightweight test metadata sent to students when an exam starts."""
+    subject_name = serializers.CharField(source='subject.name', read_only=True)
+
+    class Meta:
+        model = Test
+        fields = ['id', 'title', 'subject', 'subject_name', 'questions_count', 'duration',
+                  'max_score', 'passing_score', 'start_date', 'end_date', 'status', 'allow_mobile_access']
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Test, Question, TestAssignment
+from .exam_cache import bump_content_version
+from .runtime import refresh_runtime
+
+@receiver([post_save, post_delete], sender=Test)
+def test_changed(sender, instance, **kwargs):
+    bump_content_version(instance.id)
+    refresh_runtime(instance.id)
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    bump_content_version(instance.test_id)
+
+@receiver([post_save, post_delete], sender=TestAssignment)
+def assignment_changed(sender, instance, **kwargs):
+    bump_content_version(instance.test_id)
+    refresh_runtime(instance.test_id)
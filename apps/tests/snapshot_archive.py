@@ -0,0 +1,130 @@
+"""
+Post-exam compaction of proctoring snapshots.
+
+Once a test is over, all frames of one attempt (test + student) are packed
+into a single archive file and the TestSnapshot rows and JPEG files are
+removed. Every frame is zstd-compressed on its own, so any single frame can
+be read back with one seek + read, without unpacking the archive.
+
+Archive layout:
+    frame 0 | frame 1 | ... | index (JSON) | index offset (8 bytes, big endian) | MAGIC
+
+The same index is stored in SnapshotArchive.frames as
+[[timestamp, offset, length, phash, face_count, face_flag], ...], so the UI
+never has to read the trailer; it is kept in the file so an archive stays
+readable on its own (e.g. from a backup). Archives written before the face
+fields existed have 4-item entries.
+
+Frames are packed only once the face analysis is done with them
+(face_analysis.settled_before), so its results are archived with the frame;
+with analysed_only a frame that is still unanalysed stays a TestSnapshot and
+is merged in by a later run.
+"""
+import json
+import struct
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import TestSnapshot, LatestSnapshot, SnapshotArchive
+
+MAGIC = b'SNAPARC1'
+COMPRESSION_LEVEL = 3
+
+
+def _existing_frames(archive):
+    """(timestamp, phash, face_count, face_flag, compressed bytes) of the frames already in an archive."""
+    frames = []
+    with default_storage.open(archive.archive.name, 'rb') as f:
+        for entry in archive.frames:
+            timestamp, offset, length, phash = entry[:4]
+            face_count, face_flag = (entry[4:6] + [None, ''])[:2]
+            f.seek(offset)
+            frames.append((parse_datetime(timestamp), phash, face_count, face_flag, f.read(length)))
+    return frames
+
+
+def pack_attempt(test_id, student_id, max_id=None, analysed_only=False):
+    """
+    Pack the TestSnapshots of one attempt (with max_id: only those up to that
+    id; with analysed_only: only those with a face_count) into its
+    SnapshotArchive. Frames packed earlier are kept (late frames are merged
+    in). Returns the number of frames added.
+    """
+    if zstandard is None:
+        raise RuntimeError("zstandard o'rnatilmagan")
+
+    snapshots = TestSnapshot.objects.filter(test_id=test_id, student_id=student_id)
+    if max_id is not None:
+        snapshots = snapshots.filter(id__lte=max_id)
+    if analysed_only:
+        snapshots = snapshots.filter(face_count__isnull=False)
+    snapshots = list(snapshots.order_by('timestamp', 'id'))
+    if not snapshots:
+        return 0
+
+    archive = SnapshotArchive.objects.filter(test_id=test_id, student_id=student_id).first()
+    frames = _existing_frames(archive) if archive else []
+
+    compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+    packed = []
+    for snap in snapshots:
+        try:
+            with default_storage.open(snap.image.name, 'rb') as f:
+                data = f.read()
+        except (OSError, ValueError):
+            # file lost, nothing to keep
+            packed.append(snap)
+            continue
+        frames.append((snap.timestamp, snap.phash, snap.face_count, snap.face_flag, compressor.compress(data)))
+        packed.append(snap)
+    frames.sort(key=lambda frame: frame[0])
+
+    body = bytearray()
+    index = []
+    for timestamp, phash, face_count, face_flag, blob in frames:
+        index.append([timestamp.isoformat(), len(body), len(blob), phash, face_count, face_flag])
+        body += blob
+    index_offset = len(body)
+    body += json.dumps(index, separators=(',', ':')).encode()
+    body += struct.pack('>Q', index_offset) + MAGIC
+
+    old_name = archive.archive.name if archive else None
+    if archive is None:
+        archive = SnapshotArchive(test_id=test_id, student_id=student_id)
+    name = archive.archive.field.generate_filename(archive, f"{test_id}_{student_id}.zsa")
+    archive.archive.name = default_storage.save(name, ContentFile(bytes(body)))
+    archive.frames = index
+    archive.frame_count = len(index)
+
+    image_names = [snap.image.name for snap in packed if snap.image]
+    with transaction.atomic():
+        archive.save()
+        TestSnapshot.objects.filter(id__in=[snap.id for snap in packed]).delete()
+        # its image file is one of the packed frames
+        LatestSnapshot.objects.filter(test_id=test_id, student_id=student_id).delete()
+
+    def _cleanup():
+        for image_name in image_names + ([old_name] if old_name else []):
+            default_storage.delete(image_name)
+    transaction.on_commit(_cleanup)
+
+    return len(packed)
+
+
+def read_frame(archive, index):
+    """JPEG bytes of frame `index` of an archive. Raises IndexError if out of range."""
+    if index < 0:
+        raise IndexError(index)
+    offset, length = archive.frames[index][1:3]
+    with default_storage.open(archive.archive.name, 'rb') as f:
+        f.seek(offset)
+        blob = f.read(length)
+    return zstandard.ZstdDecompressor().decompress(blob)
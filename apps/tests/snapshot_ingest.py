@@ -0,0 +1,162 @@
+"""
+Proctoring snapshot ingestion.
+
+The snapshot endpoint only inserts the uploaded JPEG into the spool table
+(SpooledSnapshot, one small INSERT) and acknowledges. The snapshot_writer
+command drains the spool in batches: it decodes each frame with Pillow,
+skips frames that look the same as the student's previous one (perceptual
+dHash), writes the rest to media storage and inserts the TestSnapshot rows
+with bulk_create. The per-student LatestSnapshot row (live proctoring grid)
+is upserted in the same pass, and the batch's spool rows are deleted in the
+same transaction.
+
+The spool is in the database, so the writer can run as its own process or
+container (Procfile `snapshots:`) without a disk shared with the web
+workers. Batches are claimed with SELECT .. FOR UPDATE SKIP LOCKED, so
+several writers don't take the same frames; duplicate detection keeps its
+state per process, so one writer per deployment drops the most duplicates.
+"""
+import io
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from .models import TestSnapshot, LatestSnapshot, SpooledSnapshot
+
+# Frames above this size are rejected (the page sends ~300x200 JPEGs)
+MAX_SNAPSHOT_BYTES = 512 * 1024
+
+
+def spool_snapshot(test_id, student_id, data):
+    """Store a raw upload for the writer. Returns False if the frame is rejected."""
+    if not data or len(data) > MAX_SNAPSHOT_BYTES:
+        return False
+    SpooledSnapshot.objects.create(test_id=test_id, student_id=student_id, data=data)
+    return True
+
+
+def dhash(image, size=8):
+    """64-bit difference hash of a PIL image as 16 hex chars."""
+    pixels = list(image.convert('L').resize((size + 1, size), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:016x}"
+
+
+def hash_distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+class SnapshotWriter:
+    """
+    Drains the spool. Keeps the last stored hash per (test, student) in
+    memory, so duplicate detection costs one query per student per process.
+    """
+
+    def __init__(self, duplicate_distance=None):
+        if duplicate_distance is None:
+            duplicate_distance = getattr(settings, 'SNAPSHOT_DUPLICATE_DISTANCE', 5)
+        self.duplicate_distance = duplicate_distance
+        self.last_hashes = {}
+
+    def _last_hash(self, test_id, student_id):
+        key = (test_id, student_id)
+        if key not in self.last_hashes:
+            self.last_hashes[key] = (
+                LatestSnapshot.objects.filter(test_id=test_id, student_id=student_id)
+                .exclude(phash='')
+                .values_list('phash', flat=True)
+                .first()
+            )
+        return self.last_hashes[key]
+
+    def process_batch(self, limit=200):
+        """
+        Process up to `limit` spooled frames. Returns (stored, dropped).
+        The batch's hashes are remembered only once it is committed, and
+        the files it wrote are removed again if it fails.
+        """
+        snapshots = []
+        hashes = {}  # (test_id, student_id) -> hash of the last frame stored by this batch
+        seen = {}  # (test_id, student_id) -> time of the newest frame, duplicates included
+        dropped = 0
+
+        try:
+            with transaction.atomic():
+                spooled = list(
+                    SpooledSnapshot.objects.select_for_update(skip_locked=True)
+                    .order_by('id')
+                    .values_list('id', 'test_id', 'student_id', 'data', 'received_at')[:limit]
+                )
+                for spool_id, test_id, student_id, data, taken_at in spooled:
+                    data = bytes(data)
+                    try:
+                        image = Image.open(io.BytesIO(data))
+                        image.load()
+                    except (OSError, ValueError):
+                        # corrupt upload
+                        dropped += 1
+                        continue
+
+                    key = (test_id, student_id)
+                    seen[key] = taken_at
+
+                    phash = dhash(image)
+                    last = hashes[key] if key in hashes else self._last_hash(test_id, student_id)
+                    if last and hash_distance(last, phash) <= self.duplicate_distance:
+                        dropped += 1
+                        continue
+                    hashes[key] = phash
+
+                    snapshot = TestSnapshot(test_id=test_id, student_id=student_id, phash=phash, timestamp=taken_at)
+                    name = f"{int(taken_at.timestamp() * 1000)}_{test_id}_{student_id}_{uuid.uuid4().hex[:8]}.jpg"
+                    stored_name = snapshot.image.field.generate_filename(snapshot, name)
+                    snapshot.image.name = default_storage.save(stored_name, ContentFile(data))
+                    snapshots.append(snapshot)
+
+                if snapshots:
+                    TestSnapshot.objects.bulk_create(snapshots)
+                self._update_latest(snapshots, seen)
+                if spooled:
+                    SpooledSnapshot.objects.filter(id__in=[row[0] for row in spooled]).delete()
+        except Exception:
+            # the spool rows are back for the next run; don't leave their files behind
+            for snapshot in snapshots:
+                default_storage.delete(snapshot.image.name)
+            raise
+
+        self.last_hashes.update(hashes)
+        return len(snapshots), dropped
+
+    def _update_latest(self, snapshots, seen):
+        """Upsert LatestSnapshot: new frames replace the image, duplicates only bump seen_at."""
+        newest = {}
+        for snap in snapshots:  # spool order = capture order
+            newest[(snap.test_id, snap.student_id)] = snap
+
+        changed = [
+            LatestSnapshot(test_id=snap.test_id, student_id=snap.student_id, image=snap.image.name,
+                           phash=snap.phash, captured_at=snap.timestamp, seen_at=seen[key])
+            for key, snap in newest.items()
+        ]
+        unchanged = [
+            LatestSnapshot(test_id=test_id, student_id=student_id, seen_at=seen_at)
+            for (test_id, student_id), seen_at in seen.items() if (test_id, student_id) not in newest
+        ]
+        if changed:
+            LatestSnapshot.objects.bulk_create(
+                changed, update_conflicts=True, unique_fields=['student', 'test'],
+                update_fields=['image', 'phash', 'captured_at', 'seen_at'],
+            )
+        if unchanged:
+            LatestSnapshot.objects.bulk_create(
+                unchanged, update_conflicts=True, unique_fields=['student', 'test'],
+                update_fields=['seen_at'],
+            )
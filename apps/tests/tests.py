@@ -1,3 +1,624 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.groups.models import Group
+from apps.students.models import Student
+from apps.subjects.models import Subject
+from apps.tests.models import Test, Question, TestAssignment
+
+User = get_user_model()
+
+
+class ExamTestCase(TestCase):
+    """Common fixture: one active test with a question pool assigned to a student's group."""
+    pool_size = 30
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.group = Group.objects.create(name="G-1", course=1, direction="CS", education_form="kunduzgi")
+        self.user = User.objects.create_user(username="student", password="password123", role="student")
+        self.student = Student.objects.create(
+            user=self.user, student_id="S-1", full_name="Test Student", group=self.group,
+            course=1, direction="CS", education_form="kunduzgi", phone="123"
+        )
+        self.subject = Subject.objects.create(name="Fizika", code="FIZ", courses="1", directions="CS")
+        now = timezone.now()
+        self.test = Test.objects.create(
+            title="Oraliq", subject=self.subject, duration=30,
+            start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=1), status='active'
+        )
+        TestAssignment.objects.create(test=self.test, group=self.group)
+        Question.objects.bulk_create([
+            Question(test=self.test, question_text=f"Savol {i}", option_a="a", option_b="b",
+                     option_c="c", option_d="d", correct_answer='A', order=i)
+            for i in range(self.pool_size)
+        ])
+        self.client.force_authenticate(user=self.user)
+
+    def start(self, **extra):
+        response = self.client.get(f'/api/tests/{self.test.id}/start/', **extra)
+        if response.status_code == status.HTTP_200_OK and not response.get('Content-Encoding'):
+            response.data = response.json()
+        return response
+
+
+class StartTestPayloadTest(ExamTestCase):
+    def test_payload_hides_correct_answer(self):
+        response = self.start()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['title'], "Oraliq")
+        self.assertNotIn('assignments', response.data)
+        for question in response.data['questions']:
+            self.assertNotIn('correct_answer', question)
+
+    def test_payload_is_rebuilt_after_question_change(self):
+        self.start()
+        question = self.test.questions.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            question.question_text = "Yangi matn"
+            question.save()
+
+        from apps.tests.exam_cache import get_exam_payload, slice_questions
+        payload = get_exam_payload(self.test.id)
+        self.assertEqual(slice_questions(payload, [question.id])[0]['question_text'], "Yangi matn")
+
+
+class QuestionSelectionTest(ExamTestCase):
+    def test_selection_size_follows_questions_count(self):
+        self.test.questions_count = 10
+        self.test.save()
+        response = self.start()
+        self.assertEqual(len(response.data['questions']), 10)
+
+    def test_resume_returns_same_questions(self):
+        first = [q['id'] for q in self.start().data['questions']]
+        second = [q['id'] for q in self.start().data['questions']]
+        self.assertEqual(first, second)
+
+    def test_stratified_selection_covers_pool(self):
+        from apps.tests.exam_cache import select_question_ids
+        pool = list(range(10000))
+        selected = select_question_ids(pool, 25)
+        self.assertEqual(len(set(selected)), 25)
+        # one question from every 400-question stratum
+        self.assertEqual(sorted(q // 400 for q in selected), list(range(25)))
+
+
+class SubmitTestGradingTest(ExamTestCase):
+    def submit(self, answers):
+        return self.client.post(f'/api/tests/{self.test.id}/submit/', {'answers': answers}, format='json')
+
+    def test_grading_uses_answer_key(self):
+        questions = self.start().data['questions']
+        answers = {str(q['id']): 'A' for q in questions[:10]}
+        answers.update({str(q['id']): 'B' for q in questions[10:20]})
+        response = self.submit(answers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['score'], 20)
+        self.assertEqual(response.data['status'], 'failed')
+
+        from apps.results.models import TestResult
+        result = TestResult.objects.get(student=self.student, test=self.test)
+        self.assertEqual(result.answers.count(), 20)
+        self.assertEqual(result.answers.filter(is_correct=True).count(), 10)
+
+    def test_query_count_does_not_grow_with_answers(self):
+        questions = self.start().data['questions']
+        answers = {str(q['id']): 'A' for q in questions}
+        from apps.tests.exam_cache import get_answer_key
+        get_answer_key(self.test.id)  # warm cache like a running exam
+        # + the grade summary refresh (read the subject's results, upsert)
+        with self.assertNumQueries(9):
+            self.submit(answers)
+
+    def test_answers_outside_selection_are_ignored(self):
+        self.test.questions_count = 5
+        self.test.save()
+        selected = {q['id'] for q in self.start().data['questions']}
+        other = self.test.questions.exclude(id__in=selected).values_list('id', flat=True)
+        response = self.submit({str(q_id): 'A' for q_id in other})
+        self.assertEqual(response.data['score'], 0)
+
+    def test_max_score_follows_selected_questions(self):
+        # 10 questions x 2 points: max 20, passing 30/50 scales to 12/20
+        self.test.questions_count = 10
+        self.test.save()
+        questions = self.start().data['questions']
+        response = self.submit({str(q['id']): 'A' for q in questions[:6]})
+        self.assertEqual((response.data['score'], response.data['status']), (12, 'passed'))
+
+        from apps.results.models import TestResult
+        result = TestResult.objects.get(student=self.student, test=self.test)
+        self.assertEqual((result.max_score, result.percentage), (20, 60))
+
+    def test_max_score_uses_question_scores(self):
+        self.test.questions_count = 5
+        self.test.save()
+        questions = self.start().data['questions']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test.questions.filter(id=questions[0]['id']).update(score=10)
+            from apps.tests.exam_cache import bump_content_version
+            bump_content_version(self.test.id)
+        response = self.submit({str(questions[0]['id']): 'A'})
+        self.assertEqual((response.data['score'], response.data['status']), (10, 'failed'))
+
+        from apps.results.models import TestResult
+        result = TestResult.objects.get(student=self.student, test=self.test)
+        self.assertEqual((result.max_score, result.percentage), (18, 10 / 18 * 100))
+
+
+class ProgressCounterTest(ExamTestCase):
+    def progress(self):
+        from apps.results.progress import get_progress
+        return get_progress(self.test.id)['totals']
+
+    def test_counters_follow_attempt_transitions(self):
+        self.assertEqual(self.progress()['not_started'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            questions = self.start().data['questions']
+        self.assertEqual(self.progress()['in_progress'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/tests/{self.test.id}/submit/',
+                             {'answers': {str(q['id']): 'A' for q in questions}}, format='json')
+        totals = self.progress()
+        self.assertEqual((totals['in_progress'], totals['passed'], totals['not_started']), (0, 1, 0))
+
+        # counters survive a cache flush via reconcile
+        cache.clear()
+        self.assertEqual(self.progress()['passed'], 1)
+
+
+class AnswerAutosaveTest(ExamTestCase):
+    def save(self, answers):
+        return self.client.post(f'/api/tests/{self.test.id}/answers/', {'answers': answers}, format='json')
+
+    def test_autosave_is_idempotent(self):
+        questions = self.start().data['questions']
+        batch = {str(q['id']): 'A' for q in questions[:5]}
+        self.assertEqual(self.save(batch).data['saved'], 5)
+        self.assertEqual(self.save(batch).data['saved'], 0)
+
+        batch[str(questions[0]['id'])] = 'C'
+        self.assertEqual(self.save(batch).data['saved'], 1)
+
+        saved = self.client.get(f'/api/tests/{self.test.id}/answers/').data['answers']
+        self.assertEqual(saved[str(questions[0]['id'])], 'C')
+        self.assertEqual(len(saved), 5)
+
+    def test_submit_grades_autosaved_answers(self):
+        questions = self.start().data['questions']
+        self.save({str(q['id']): 'A' for q in questions[:10]})
+        response = self.client.post(
+            f'/api/tests/{self.test.id}/submit/', {'answers': {str(questions[10]['id']): 'A'}}, format='json'
+        )
+        self.assertEqual(response.data['score'], 22)
+
+    def test_autosave_is_rejected_while_paused_or_over(self):
+        questions = self.start().data['questions']
+        batch = {str(questions[0]['id']): 'A'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test.status = 'paused'
+            self.test.save()
+        self.assertEqual(self.save(batch).status_code, status.HTTP_409_CONFLICT)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test.status = 'active'
+            self.test.end_date = timezone.now() - timedelta(minutes=1)
+            self.test.save()
+        self.assertEqual(self.save(batch).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.client.get(f'/api/tests/{self.test.id}/answers/').data['answers'], {})
+
+
+class AsyncGradingTest(ExamTestCase):
+    def test_submission_is_queued_and_graded_by_worker(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from apps.results.models import TestResult
+
+        questions = self.start().data['questions']
+        answers = {str(q['id']): 'A' for q in questions[:5]}
+        with self.settings(ASYNC_GRADING=True):
+            response = self.client.post(f'/api/tests/{self.test.id}/submit/', {'answers': answers}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        receipt = response.data['receipt']
+
+        poll = self.client.get(f'/api/tests/{self.test.id}/grading/', {'receipt': receipt})
+        self.assertEqual(poll.data['status'], 'pending')
+        self.assertEqual(TestResult.objects.get(student=self.student).status, 'submitted')
+
+        call_command('grading_worker', once=True, stdout=StringIO())
+
+        poll = self.client.get(f'/api/tests/{self.test.id}/grading/', {'receipt': receipt})
+        self.assertEqual(poll.data['score'], 10)
+        self.assertEqual(poll.data['status'], 'failed')
+
+
+class AdmissionControlTest(ExamTestCase):
+    def test_over_capacity_start_gets_wait_ticket(self):
+        from unittest import mock
+
+        other = User.objects.create_user(username="student2", password="password123", role="student")
+        Student.objects.create(
+            user=other, student_id="S-2", full_name="Second Student", group=self.group,
+            course=1, direction="CS", education_form="kunduzgi", phone="123"
+        )
+        with self.settings(EXAM_ADMISSION={'GLOBAL_RATE': 0, 'PER_TEST_RATE': 1}), \
+                mock.patch('apps.tests.admission.time.time', return_value=1000.0):
+            self.assertEqual(self.start().status_code, status.HTTP_200_OK)
+
+            self.client.force_authenticate(user=other)
+            response = self.start()
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(response['Retry-After'], '1')
+
+            # already admitted students (resume) are not queued
+            self.client.force_authenticate(user=self.user)
+            self.assertEqual(self.start().status_code, status.HTTP_200_OK)
+
+            from apps.tests.admission import get_admission_stats
+            self.assertEqual(get_admission_stats([self.test.id])[self.test.id], {'admitted': 1, 'waiting': 1})
+
+
+    def test_rejected_starts_take_no_tokens(self):
+        from unittest import mock
+        from apps.results.models import TestResult
+        from apps.tests.admission import admit, get_admission_stats
+
+        TestResult.objects.create(student=self.student, test=self.test, score=40, max_score=50,
+                                  percentage=80, status='passed', started_at=timezone.now())
+        with self.settings(EXAM_ADMISSION={'GLOBAL_RATE': 2, 'PER_TEST_RATE': 1}), \
+                mock.patch('apps.tests.admission.time.time', return_value=1000.0):
+            # already finished: refused before admission, nothing counted
+            self.assertEqual(self.start().status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(get_admission_stats([self.test.id])[self.test.id], {'admitted': 0, 'waiting': 0})
+
+            # a start refused by its own test's bucket leaves the global token for another test
+            self.assertIsNone(admit(self.test.id, 101))
+            self.assertTrue(admit(self.test.id, 102))
+            self.assertIsNone(admit(self.test.id + 1, 103))
+
+class ConditionalStartTest(ExamTestCase):
+    def test_reload_with_etag_is_not_modified(self):
+        first = self.start()
+        etag = first['ETag']
+        self.assertTrue(etag.startswith('"'))
+
+        with self.assertNumQueries(0):
+            second = self.start(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_paused_test_does_not_revalidate(self):
+        etag = self.start()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test.status = 'paused'
+            self.test.save()
+        response = self.start(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_etag_changes_with_content_version(self):
+        etag = self.start()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test.title = "Yangi nom"
+            self.test.save()
+        response = self.start(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_gzip_body_is_served_when_accepted(self):
+        import gzip
+        import json
+        response = self.start(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(response.content))
+        self.assertEqual(len(data['questions']), 25)
+
+
+class RuntimeStateTest(ExamTestCase):
+    def test_mass_pause_reaches_state_and_blocks_start(self):
+        self.assertFalse(self.client.get(f'/api/tests/{self.test.id}/state/').data['paused'])
+
+        admin = User.objects.create_user(username="admin", password="password123", is_staff=True)
+        self.client.force_authenticate(user=admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/monitoring/control/', {'action': 'pause_all'}, format='json')
+        self.client.force_authenticate(user=self.user)
+
+        with self.assertNumQueries(0):
+            state = self.client.get(f'/api/tests/{self.test.id}/state/').data
+        self.assertTrue(state['paused'])
+        self.assertIsNotNone(state['paused_at'])
+        self.assertEqual(self.start().status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_paused_time_extends_the_end(self):
+        from unittest import mock
+        end_date = self.test.end_date
+        admin = User.objects.create_user(username="admin", password="password123", is_staff=True)
+        self.client.force_authenticate(user=admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/monitoring/control/', {'action': 'pause_all'}, format='json')
+        self.client.force_authenticate(user=self.user)
+
+        later = timezone.now() + timedelta(minutes=10)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            state = self.client.get(f'/api/tests/{self.test.id}/state/').data
+            self.assertGreaterEqual(state['end_date'], end_date + timedelta(minutes=9))
+
+            self.client.force_authenticate(user=admin)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post('/api/monitoring/control/', {'action': 'resume_all'}, format='json')
+        self.test.refresh_from_db()
+        self.assertIsNone(self.test.paused_at)
+        self.assertGreaterEqual(self.test.end_date, end_date + timedelta(minutes=9))
+
+    def test_runtime_record_expires(self):
+        import time
+        from unittest import mock
+        from apps.tests.runtime import get_runtime
+        self.assertEqual(get_runtime(self.test.id)['status'], 'active')
+        # changed behind this process' back (another worker with its own cache)
+        Test.objects.filter(pk=self.test.id).update(status='completed')
+        self.assertEqual(get_runtime(self.test.id)['status'], 'active')
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=time.time() + 60):
+            self.assertEqual(get_runtime(self.test.id)['status'], 'completed')
+
+    def test_mass_control_keeps_compiled_payload(self):
+        from apps.tests.exam_cache import get_content_version
+        version = get_content_version(self.test.id)
+        admin = User.objects.create_user(username="admin", password="password123", is_staff=True)
+        self.client.force_authenticate(user=admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/monitoring/control/', {'action': 'pause_all'}, format='json')
+            self.client.post('/api/monitoring/control/', {'action': 'resume_all'}, format='json')
+            self.client.post('/api/monitoring/control/', {'action': 'extend_time', 'minutes': 5}, format='json')
+        self.assertEqual(get_content_version(self.test.id), version)
+
+    def test_state_is_only_served_to_assigned_groups(self):
+        other_group = Group.objects.create(name="G-2", course=1, direction="CS", education_form="kunduzgi")
+        other = User.objects.create_user(username="student2", password="password123", role="student")
+        Student.objects.create(
+            user=other, student_id="S-2", full_name="Other Student", group=other_group,
+            course=1, direction="CS", education_form="kunduzgi", phone="456"
+        )
+        self.client.force_authenticate(user=other)
+        response = self.client.get(f'/api/tests/{self.test.id}/state/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_group_update_reaches_runtime_record(self):
+        self.assertEqual(self.start().status_code, status.HTTP_200_OK)  # runtime record cached
+        other_group = Group.objects.create(name="G-2", course=1, direction="CS", education_form="kunduzgi")
+        other = User.objects.create_user(username="student2", password="password123", role="student")
+        Student.objects.create(
+            user=other, student_id="S-2", full_name="Other Student", group=other_group,
+            course=1, direction="CS", education_form="kunduzgi", phone="456"
+        )
+
+        admin = User.objects.create_user(username="admin", password="password123", role="admin", is_staff=True)
+        self.client.force_authenticate(user=admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/tests/{self.test.id}/update-groups/',
+                                        {'group_ids': [self.group.id, other_group.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # only a bulk_create ran (no post_save): the view itself refreshes the record
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.start().status_code, status.HTTP_200_OK)
+
+
+class SnapshotIngestTest(ExamTestCase):
+    def setUp(self):
+        super().setUp()
+        import tempfile
+        from django.test import override_settings
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=self.media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def upload(self, color):
+        import io
+        from PIL import Image, ImageDraw
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        image = Image.new('RGB', (64, 48), 'white')
+        ImageDraw.Draw(image).rectangle((32, 0, 63, 47), fill=color)
+        buf = io.BytesIO()
+        image.save(buf, format='JPEG')
+        frame = SimpleUploadedFile('snap.jpg', buf.getvalue(), content_type='image/jpeg')
+        return self.client.post(f'/api/tests/{self.test.id}/snapshot/', {'image': frame}, format='multipart')
+
+    def test_frames_are_spooled_and_duplicates_dropped(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from apps.tests.models import TestSnapshot, SpooledSnapshot
+
+        self.start()
+        self.assertEqual(self.upload('black').status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.upload('black').status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(TestSnapshot.objects.exists())
+        self.assertEqual(SpooledSnapshot.objects.count(), 2)
+
+        call_command('snapshot_writer', once=True, stdout=StringIO())
+        self.assertEqual(TestSnapshot.objects.filter(test=self.test, student=self.student).count(), 1)
+        self.assertFalse(SpooledSnapshot.objects.exists())
+
+        # the student left the frame: a real change is stored
+        self.upload('white')
+        call_command('snapshot_writer', once=True, stdout=StringIO())
+        self.assertEqual(TestSnapshot.objects.count(), 2)
+        self.assertTrue(all(s.phash for s in TestSnapshot.objects.all()))
+
+    def test_failed_batch_leaves_no_files_or_hashes(self):
+        import os
+        from unittest import mock
+        from apps.tests.models import TestSnapshot, SpooledSnapshot
+        from apps.tests.snapshot_ingest import SnapshotWriter
+
+        self.start()
+        self.upload('black')
+        writer = SnapshotWriter()
+        with mock.patch.object(writer, '_update_latest', side_effect=RuntimeError("db down")):
+            with self.assertRaises(RuntimeError):
+                writer.process_batch()
+        self.assertEqual(SpooledSnapshot.objects.count(), 1)
+        self.assertEqual(writer.last_hashes, {(self.test.id, self.student.id): None})
+        self.assertEqual([files for _, _, files in os.walk(self.media.name) if files], [])
+
+        # the retried frame isn't taken for a duplicate of itself
+        self.assertEqual(writer.process_batch(), (1, 0))
+        self.assertEqual(TestSnapshot.objects.count(), 1)
+
+    def test_compaction_packs_frames_into_archive(self):
+        from io import StringIO
+        from unittest import mock
+        from django.core.files.storage import default_storage
+        from django.core.management import call_command
+        from apps.tests import face_analysis
+        from apps.tests.models import TestSnapshot, SnapshotArchive
+
+        self.start()
+        self.upload('black')
+        self.upload('white')
+        call_command('snapshot_writer', once=True, stdout=StringIO())
+        originals = [default_storage.open(s.image.name).read() for s in TestSnapshot.objects.order_by('timestamp', 'id')]
+
+        self.test.status = 'completed'
+        self.test.save()
+        # the face analysis hasn't seen the frames yet: nothing is packed
+        call_command('compact_snapshots', stdout=StringIO())
+        self.assertEqual(TestSnapshot.objects.count(), 2)
+        self.assertFalse(SnapshotArchive.objects.exists())
+
+        with self.settings(FACE_ANALYSIS={'SETTLE_AFTER': 0}), \
+                mock.patch.object(face_analysis, 'analyse_frame', return_value=(1, 120.0, 40.0)):
+            face_analysis.FaceAnalyzer(workers=0).process_batch()
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('compact_snapshots', stdout=StringIO())
+
+        self.assertFalse(TestSnapshot.objects.exists())
+        archive = SnapshotArchive.objects.get(test=self.test, student=self.student)
+        self.assertEqual(archive.frame_count, 2)
+
+        admin = User.objects.create_user(username="admin", password="password123", role="admin", is_staff=True)
+        self.client.force_authenticate(user=admin)
+        listing = self.client.get('/api/monitoring/snapshots/archives/', {'test': self.test.id}).json()
+        self.assertEqual([(f['face_count'], f['face_flag']) for f in listing[0]['frames']], [(1, ''), (1, '')])
+        response = self.client.get(f'/api/monitoring/snapshots/archives/{archive.id}/frames/1/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, originals[1])
+        response = self.client.get(f'/api/monitoring/snapshots/archives/{archive.id}/frames/2/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_compaction_packs_last_attempt_once_uploads_stop(self):
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from apps.tests import face_analysis
+        from apps.tests.models import TestSnapshot, SnapshotArchive
+
+        self.start()
+        self.upload('black')
+        call_command('snapshot_writer', once=True, stdout=StringIO())
+        self.test.status = 'completed'
+        self.test.save()
+
+        # the checkpoint stops at the last frame of the day: no later upload moves it on
+        with mock.patch.object(face_analysis, 'analyse_frame', return_value=(1, 120.0, 40.0)):
+            face_analysis.FaceAnalyzer(workers=0).process_batch()
+        self.assertFalse(TestSnapshot.objects.filter(face_count__isnull=True).exists())
+
+        # analysed, but the frame is too recent to be sure nothing else is coming
+        call_command('compact_snapshots', stdout=StringIO())
+        self.assertFalse(SnapshotArchive.objects.exists())
+
+        TestSnapshot.objects.update(timestamp=timezone.now() - timedelta(hours=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('compact_snapshots', stdout=StringIO())
+        self.assertFalse(TestSnapshot.objects.exists())
+        self.assertEqual(SnapshotArchive.objects.get(test=self.test, student=self.student).frame_count, 1)
+
+    def test_face_analysis_flags_frames_and_resumes(self):
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from apps.monitoring.models import ViolationEvent
+        from apps.tests import face_analysis
+        from apps.tests.models import TestSnapshot
+
+        self.start()
+        self.upload('black')
+        self.upload('white')
+        call_command('snapshot_writer', once=True, stdout=StringIO())
+
+        # opencv itself isn't exercised here: (faces, brightness, contrast) per frame
+        with mock.patch.object(face_analysis, 'analyse_frame', return_value=(0, 120.0, 40.0)):
+            analyzer = face_analysis.FaceAnalyzer(workers=0)
+            self.assertEqual(analyzer.process_batch(), (2, 2))
+            self.assertEqual(analyzer.process_batch(), (0, 0))  # checkpoint moved past them
+
+        self.assertEqual(set(TestSnapshot.objects.values_list('face_flag', flat=True)), {'no_face'})
+        event = ViolationEvent.objects.get(test=self.test, student=self.student)
+        self.assertEqual((event.violation_type, event.count), ('face', 2))
+        self.assertEqual(face_analysis.classify(1, 10.0, 3.0), 'covered')
+
+        # a frame committed late, below the checkpoint, is still picked up
+        late = TestSnapshot.objects.order_by('id').first()
+        TestSnapshot.objects.filter(id=late.id).update(face_count=None, face_flag='')
+        with mock.patch.object(face_analysis, 'analyse_frame', return_value=(1, 120.0, 40.0)):
+            self.assertEqual(analyzer.process_batch(), (1, 0))
+        late.refresh_from_db()
+        self.assertEqual((late.face_count, late.face_flag), (1, ''))
+
+    def test_face_detector_runs_on_real_frames(self):
+        import unittest
+        from apps.tests import face_analysis
+        if face_analysis.cv2 is None:
+            raise unittest.SkipTest("opencv is not installed")
+        import cv2
+        import numpy as np
+
+        def jpeg(pixels):
+            return cv2.imencode('.jpg', pixels)[1].tobytes()
+
+        # taped-over camera: black frame
+        faces, brightness, contrast = face_analysis.analyse_frame(jpeg(np.zeros((240, 320), np.uint8)))
+        self.assertEqual(face_analysis.classify(faces, brightness, contrast), 'covered')
+
+        # an empty room: bright, textured, no face (wider than MAX_WIDTH, so it is scaled down too)
+        rng = np.random.default_rng(0)
+        room = cv2.GaussianBlur(rng.integers(60, 200, (300, 480), dtype=np.uint8), (9, 9), 0)
+        faces, brightness, contrast = face_analysis.analyse_frame(jpeg(room))
+        self.assertEqual(faces, 0)
+        self.assertEqual(face_analysis.classify(faces, brightness, contrast, flat_level=5), 'no_face')
+        self.assertIsNone(face_analysis.analyse_frame(b'not a jpeg'))
+
+    def test_live_grid_reads_latest_snapshot(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from apps.tests.models import LatestSnapshot
+
+        self.start()
+        self.upload('black')
+        call_command('snapshot_writer', once=True, stdout=StringIO())
+        first = LatestSnapshot.objects.get(test=self.test, student=self.student)
+
+        # a duplicate frame keeps the image but refreshes seen_at
+        self.upload('black')
+        call_command('snapshot_writer', once=True, stdout=StringIO())
+        latest = LatestSnapshot.objects.get(test=self.test, student=self.student)
+        self.assertEqual(latest.image.name, first.image.name)
+        self.assertGreaterEqual(latest.seen_at, first.seen_at)
 
-# Create your tests here.
+        admin = User.objects.create_user(username="admin", password="password123", role="admin", is_staff=True)
+        self.client.force_authenticate(user=admin)
+        response = self.client.get('/api/monitoring/live/', {'group': self.group.id})
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['student_id'], "S-1")
+        self.assertEqual(self.client.get('/api/monitoring/live/', {'group': 0}).data['count'], 0)
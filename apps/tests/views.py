@@ -2,14 +2,23 @@ from rest_framework import viewsets, permissions, status, decorators, filters, p
 from rest_framework.response import Response
 from django.utils import timezone
 from django.shortcuts import render, redirect
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.renderers import JSONRenderer
+from rest_framework.exceptions import NotFound
+import logging
+
 import openpyxl
 
 from .models import Test, Question
 from .serializers import TestSerializer, QuestionSerializer
 from .excel_import import import_questions_from_excel
+from . import exam_cache
+from .exam_cache import get_exam_payload, bump_content_version, slice_questions, select_question_ids
+from .runtime import refresh_runtime
 from apps.results.models import TestResult, StudentAnswer
 
+logger = logging.getLogger(__name__)
+
 class CustomPagination(pagination.PageNumberPagination):
     page_size = 20
     page_size_query_param = 'page_size'
@@ -24,7 +33,7 @@ class TestViewSet(viewsets.ModelViewSet):
         def has_permission(self, request, view):
             # Allow students to view list, details, and perform taking-test actions
             if request.user.is_authenticated and request.user.role == 'student':
-                if view.action in ['list', 'retrieve', 'start_test', 'submit_test', 'snapshot']:
+                if view.action in ['list', 'retrieve', 'start_test', 'submit_test', 'save_answers', 'grading_status', 'snapshot', 'runtime_state']:
                     return True
                 return False
             # For others, fall back to standard Granular Permission (ModuleAccess check)
@@ -170,6 +179,9 @@ class TestViewSet(viewsets.ModelViewSet):
         for gid in to_create:
             new_assignments.append(TestAssignment(test=test, group_id=gid))
         TestAssignment.objects.bulk_create(new_assignments)
+        # bulk_create does not send post_save
+        bump_content_version(test.id)
+        refresh_runtime(test.id)  # group_ids of the runtime record
         
         # Log details
         log_detail = f"Qo'shildi: {len(to_create)} ta, O'chirildi: {len(to_delete)} ta"
@@ -234,6 +246,8 @@ class TestViewSet(viewsets.ModelViewSet):
                 questions.append(Question(test=test, **q_data))
             
             Question.objects.bulk_create(questions)
+            # bulk_create does not send post_save
+            bump_content_version(test.id)
             
             self._log_action('savollar_import', test)
             
@@ -243,21 +257,30 @@ class TestViewSet(viewsets.ModelViewSet):
 
     @decorators.action(detail=True, methods=['post'], url_path='snapshot')
     def snapshot(self, request, pk=None):
-        test = self.get_object()
-        student = request.user.student_profile
         image = request.FILES.get('image')
-        
+
         if not image:
             return Response({'error': 'No image provided'}, status=400)
-            
-        from .models import TestSnapshot
-        TestSnapshot.objects.create(test=test, student=student, image=image)
-        
-        # Update user last_activity for "Online" status
-        request.user.last_activity = timezone.now()
-        request.user.save()
-        
-        return Response({'status': 'saved'})
+
+        # The open attempt is cached by start_test, so the hot path skips
+        # get_object(); the writer (snapshot_writer command) does the rest.
+        attempt = exam_cache.get_attempt(pk, request.user.id)
+        if attempt and attempt.get('student_id'):
+            test_id, student_id = int(pk), attempt['student_id']
+        else:
+            test = self.get_object()
+            student = getattr(request.user, 'student_profile', None)
+            if student is None:
+                return Response({'error': 'Talaba profili topilmadi'}, status=status.HTTP_400_BAD_REQUEST)
+            test_id, student_id = test.id, student.id
+
+        from .snapshot_ingest import spool_snapshot
+        if not spool_snapshot(test_id, student_id, image.read()):
+            return Response({'error': 'Rasm hajmi juda katta'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # "Online" status comes from the heartbeat ActivityMiddleware records
+
+        return Response({'status': 'queued'}, status=status.HTTP_202_ACCEPTED)
 
     @decorators.action(detail=True, methods=['post'], url_path='archive')
     def archive_test(self, request, pk=None):
@@ -275,44 +298,110 @@ class TestViewSet(viewsets.ModelViewSet):
         self._log_action('update', test, extra_details="Arxivdan chiqarildi")
         return Response({'status': 'success', 'message': 'Test arxivdan chiqarildi'})
 
+    def get_exam_state(self, pk, group_id):
+        """
+        Runtime record (apps/tests/runtime.py) of a test assigned to the
+        student's group. Exam endpoints use it instead of get_object().
+        """
+        from .runtime import get_runtime
+        try:
+            state = get_runtime(int(pk))
+        except (TypeError, ValueError):
+            raise NotFound()
+        if state is None or group_id not in state['group_ids']:
+            raise NotFound()
+        return state
+
+    def exam_is_running(self, pk):
+        """Active and within its dates, by the cached runtime record."""
+        from .runtime import get_runtime, is_running
+        try:
+            state = get_runtime(int(pk))
+        except (TypeError, ValueError):
+            return False
+        return state is not None and is_running(state)
+
+    @decorators.action(detail=True, methods=['get'], url_path='state')
+    def runtime_state(self, request, pk=None):
+        """Cheap poll for the exam page: status, end time, pauses (cache only)."""
+        from .runtime import client_state
+        # the group of an open attempt is cached by start_test
+        attempt = exam_cache.get_attempt(pk, request.user.id)
+        group_id = attempt.get('group_id') if attempt else None
+        if group_id is None:
+            student = getattr(request.user, 'student_profile', None)
+            if student is None:
+                raise NotFound()
+            group_id = student.group_id
+        return Response(client_state(self.get_exam_state(pk, group_id)))
+
     @decorators.action(detail=True, methods=['get'], url_path='start')
 
     def start_test(self, request, pk=None):
-        print(f"DEBUG: start_test called for test {pk} by user {request.user}")
-        test = self.get_object()
+        logger.debug("start_test: test %s, user %s", pk, request.user.id)
+
+        # Conditional reload of an open attempt: answered from the cache only,
+        # and only while the test is running - otherwise the full path below
+        # reports the pause or the closed test
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and self.exam_is_running(pk):
+            etag = exam_cache.get_attempt_etag(pk, request.user.id)
+            if etag and etag in [tag.strip() for tag in if_none_match.split(',')]:
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                response['Cache-Control'] = 'private, no-cache'
+                response['Vary'] = 'Accept-Encoding, Authorization'
+                return response
+
         try:
             student = request.user.student_profile
         except:
-             print("DEBUG: User has no student profile")
              return Response({'error': 'Talaba profili topilmadi'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Status, dates and groups come from the cached runtime record
+        exam = self.get_exam_state(pk, student.group_id)
+        test_id = exam['test_id']
+        if exam['status'] == 'paused':
+            return Response({'error': "Test vaqtincha to'xtatilgan. Iltimos kuting."}, status=status.HTTP_400_BAD_REQUEST)
+        if exam['status'] != 'active':
+            raise NotFound()
         
         # Check if already taken
         # Check if already taken and NOT allowed to retake
         # Allow entry if status is 'in_progress' (resume)
-        active_results = TestResult.objects.filter(student=student, test=test, can_retake=False).exclude(status='in_progress')
+        active_results = TestResult.objects.filter(student=student, test_id=test_id, can_retake=False).exclude(status='in_progress')
         if active_results.exists():
-             print(f"DEBUG: Active results exist: {active_results}")
              return Response({'error': 'Siz bu testni topshirgansiz.'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Check mobile access
-        user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
-        is_mobile = 'mobile' in user_agent or 'android' in user_agent or 'iphone' in user_agent
-        
-        if is_mobile and not test.allow_mobile_access:
-             print(f"DEBUG: Mobile access denied for test {test.id}")
-             return Response({'error': 'Ushbu testni telefonda ishlashga ruxsat berilmagan.'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Check start/end dates
         from django.utils import timezone
         now = timezone.now()
         
-        if now < test.start_date:
-            print(f"DEBUG: Early start. Now: {now}, Start: {test.start_date}")
-            return Response({'error': f"Test hali boshlanmagan. Boshlanish vaqti: {test.start_date.strftime('%d.%m.%Y %H:%M')}"}, status=status.HTTP_400_BAD_REQUEST)
+        if now < exam['start_date']:
+            return Response({'error': f"Test hali boshlanmagan. Boshlanish vaqti: {exam['start_date'].strftime('%d.%m.%Y %H:%M')}"}, status=status.HTTP_400_BAD_REQUEST)
             
-        if now > test.end_date:
-            print(f"DEBUG: Late start. Now: {now}, End: {test.end_date}")
+        if now > exam['end_date']:
             return Response({'error': "Test vaqti tugagan."}, status=status.HTTP_400_BAD_REQUEST)
+
+        payload = get_exam_payload(test_id)
+
+        # Check mobile access
+        user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
+        is_mobile = 'mobile' in user_agent or 'android' in user_agent or 'iphone' in user_agent
+        
+        if is_mobile and not payload['test']['allow_mobile_access']:
+             return Response({'error': 'Ushbu testni telefonda ishlashga ruxsat berilmagan.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Admission control: shed the start-of-exam herd with a wait ticket.
+        # Only valid starts get here, so rejected ones don't use up tokens.
+        from .admission import admit
+        retry_after = admit(test_id, request.user.id)
+        if retry_after:
+            return Response(
+                {'error': "Navbatdasiz, iltimos kuting.", 'retry_after': retry_after},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(retry_after)}
+            )
         
         # Initialize or Get In-Progress Result
         # We need to distinguish between a new attempt and a resume (if we support resume)
@@ -320,31 +409,35 @@ class TestViewSet(viewsets.ModelViewSet):
         # User requirement implies simplistic flow. 
         # Let's create a result if no active one exists.
         
+
+        questions_count = payload['test']['questions_count']
         result, created = TestResult.objects.get_or_create(
             student=student,
-            test=test,
+            test_id=test_id,
             status='in_progress',
             defaults={
                 'started_at': timezone.now(),
                 'score': 0,
                 'max_score': 0,
                 'percentage': 0,
-                'can_retake': False
+                'can_retake': False,
+                'question_ids': select_question_ids(payload['question_ids'], questions_count),
             }
         )
         
-        # If found existing 'in_progress', we keep it (resume logic implicitly)
-        # But we must ensure we don't overwrite 'started_at' if it exists.
-        
-        # Randomize unique questions
-        all_questions = list(test.questions.all())
-        import random
-        random.shuffle(all_questions)
-        selected_questions = all_questions[:25]
+        if created:
+            from apps.results.progress import record_transition
+            record_transition(test_id, student.group_id, None, 'in_progress')
+
+        # If found existing 'in_progress', we keep it (resume logic implicitly):
+        # the same questions are rebuilt from the stored selection.
+        if not result.question_ids:
+            # Attempt started before selections were stored
+            result.question_ids = select_question_ids(payload['question_ids'], questions_count)
+            result.save(update_fields=['question_ids', 'updated_at'])
         
-        # Serialize
-        test_data = TestSerializer(test).data
-        test_data['questions'] = QuestionSerializer(selected_questions, many=True).data
+        test_data = dict(payload['test'])
+        test_data['questions'] = slice_questions(payload, result.question_ids)
 
         # Camera Logic
         camera_required = False
@@ -360,76 +453,132 @@ class TestViewSet(viewsets.ModelViewSet):
             camera_required = (val == 'true')
             
         test_data['is_camera_required'] = camera_required
-        
-        return Response(test_data)
+
+        # Strong ETag: content version + this attempt's selection
+        etag = exam_cache.attempt_etag(payload['version'], result.question_ids, camera_required)
+        exam_cache.remember_attempt(test_id, request.user.id, payload['version'], etag,
+                                    student_id=student.id, group_id=student.group_id)
+
+        body, encoding = exam_cache.encode_body(
+            etag, JSONRenderer().render(test_data), request.META.get('HTTP_ACCEPT_ENCODING')
+        )
+        response = HttpResponse(body, content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        response['Vary'] = 'Accept-Encoding, Authorization'
+        return response
 
     @decorators.action(detail=True, methods=['post'], url_path='submit')
     def submit_test(self, request, pk=None):
-        test = self.get_object()
         student = request.user.student_profile
+        # No status check: an open attempt can be handed in during a pause too
+        exam = self.get_exam_state(pk, student.group_id)
+        test_id = exam['test_id']
         
         # Find the active session
         try:
-            result = TestResult.objects.get(student=student, test=test, status='in_progress')
+            result = TestResult.objects.get(student=student, test_id=test_id, status='in_progress')
         except TestResult.DoesNotExist:
              # Fallback: If no in_progress found (maybe legacy or error), check if already passed?
              # Or just return error.
              # If student hacked request without start_test?
              # Let's clean up: If they have a completed test, say done.
-             if TestResult.objects.filter(student=student, test=test).exclude(status='in_progress').exists():
+             if TestResult.objects.filter(student=student, test_id=test_id).exclude(status='in_progress').exists():
                   return Response({'error': 'Siz bu testni topshirgansiz.'}, status=status.HTTP_400_BAD_REQUEST)
              
              # If never started? Create new? 
              # Better to enforce start_test.
              return Response({'error': 'Test boshlanmagan. Iltimos qaytadan urining.'}, status=400)
 
+        from django.conf import settings
+        from apps.results.grading import finalize_attempt, enqueue_grading
+
         answers_data = request.data.get('answers', {})
-        score = 0
-        MAX_SCORE_FIXED = 50
-        POINTS_PER_QUESTION = 2
-        
-        # Update existing result
-        result.completed_at = timezone.now()
-        
-        student_answers = []
-        
-        for q_id, selected_key in answers_data.items():
-            try:
-                question = Question.objects.get(id=q_id, test=test)
-            except Question.DoesNotExist:
-                continue
-
-            is_correct = False
-            if selected_key == question.correct_answer:
-                score += POINTS_PER_QUESTION
-                is_correct = True
-            
-            student_answers.append(StudentAnswer(
-                test_result=result,
-                question=question,
-                selected_answer=selected_key,
-                is_correct=is_correct
-            ))
-            
-        StudentAnswer.objects.bulk_create(student_answers)
-        
-        if score > MAX_SCORE_FIXED: score = MAX_SCORE_FIXED
-        
-        percentage = (score / MAX_SCORE_FIXED) * 100
-        status_val = 'passed' if score >= test.passing_score else 'failed'
-        
-        result.score = score
-        result.max_score = MAX_SCORE_FIXED
-        result.percentage = percentage
-        result.status = status_val
-        result.save()
+        if not isinstance(answers_data, dict):
+            return Response({'error': "Javoblar noto'g'ri formatda."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Reloads must not get a 304 for a closed attempt
+        exam_cache.forget_attempt(test_id, request.user.id)
+
+        if getattr(settings, 'ASYNC_GRADING', False):
+            # Accept now, grade in the grading_worker process
+            job = enqueue_grading(result, answers_data)
+            return Response({
+                'status': 'queued',
+                'receipt': str(job.receipt),
+                'message': "Javoblaringiz qabul qilindi. Natija tekshirilmoqda..."
+            }, status=status.HTTP_202_ACCEPTED)
+
+        # Graded in memory against the cached answer key, written in one transaction
+        result = finalize_attempt(result, answers_data, exam['passing_score'])
         
         return Response({
-            'status': status_val,
-            'score': score,
-            'percentage': round(percentage, 1),
-            'max_score': MAX_SCORE_FIXED,
-            'message': "Tabriklaymiz, siz testdan o'tdingiz!" if status_val == 'passed' else "Afsuski, siz testdan o'ta olmadingiz."
+            'status': result.status,
+            'score': result.score,
+            'percentage': round(result.percentage, 1),
+            'max_score': result.max_score,
+            'message': "Tabriklaymiz, siz testdan o'tdingiz!" if result.status == 'passed' else "Afsuski, siz testdan o'ta olmadingiz."
+        })
+
+    @decorators.action(detail=True, methods=['get', 'post'], url_path='answers')
+    def save_answers(self, request, pk=None):
+        """
+        Autosave for the take-test page.
+        GET returns the saved answers (used when resuming), POST upserts a
+        batch of changed answers {question_id: letter}.
+        """
+        from apps.results.grading import save_answers
+        from .runtime import is_running
+
+        result = TestResult.objects.filter(
+            student__user=request.user, test_id=pk, status='in_progress'
+        ).select_related('student').only('id', 'test_id', 'question_ids', 'student__group_id').first()
+        if result is None:
+            return Response({'error': 'Test boshlanmagan. Iltimos qaytadan urining.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if request.method == 'GET':
+            saved = StudentAnswer.objects.filter(test_result_id=result.id).values_list('question_id', 'selected_answer')
+            return Response({'answers': {str(q_id): key for q_id, key in saved}})
+
+        # No answers while the test is paused or over (the final submit still is accepted)
+        exam = self.get_exam_state(pk, result.student.group_id)
+        if not is_running(exam):
+            message = "Test vaqtincha to'xtatilgan." if exam['status'] == 'paused' else "Test vaqti tugagan."
+            return Response({'error': message}, status=status.HTTP_409_CONFLICT)
+
+        answers_data = request.data.get('answers', {})
+        if not isinstance(answers_data, dict):
+            return Response({'error': "Javoblar noto'g'ri formatda."}, status=status.HTTP_400_BAD_REQUEST)
+
+        saved_count = save_answers(result, answers_data)
+        return Response({'status': 'saved', 'saved': saved_count})
+
+    @decorators.action(detail=True, methods=['get'], url_path='grading')
+    def grading_status(self, request, pk=None):
+        """Polled by the take-test page after an asynchronous submit (?receipt=...)."""
+        from django.core.exceptions import ValidationError
+        from apps.results.models import GradingJob
+
+        receipt = request.query_params.get('receipt')
+        try:
+            job = GradingJob.objects.select_related('test_result').get(
+                receipt=receipt, test_result__test_id=pk, test_result__student__user=request.user
+            )
+        except (GradingJob.DoesNotExist, ValidationError):
+            return Response({'error': 'Topilmadi'}, status=status.HTTP_404_NOT_FOUND)
+
+        if job.status != 'done':
+            return Response({'status': job.status})
+
+        result = job.test_result
+        return Response({
+            'status': result.status,
+            'score': result.score,
+            'percentage': round(result.percentage, 1),
+            'max_score': result.max_score,
+            'message': "Tabriklaymiz, siz testdan o'tdingiz!" if result.status == 'passed' else "Afsuski, siz testdan o'ta olmadingiz."
         })
 
     @decorators.action(detail=False, methods=['get'], url_path='sample-questions')
@@ -3,6 +3,9 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Served by the `stream` process (Procfile) for the monitoring SSE endpoint
+(apps/monitoring/stream.py); the rest of the site runs on config.wsgi.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -70,6 +70,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'apps.monitoring.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -136,6 +137,68 @@ else:
 # }
 
 
+# Cache
+# Redis is shared by all gunicorn workers; LocMemCache is per-process (development only)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Compiled exam payloads (apps/tests/exam_cache.py), seconds
+EXAM_PAYLOAD_TTL = int(os.environ.get('EXAM_PAYLOAD_TTL', 6 * 60 * 60))
+
+# Runtime record of a running exam (apps/tests/runtime.py), seconds before it is re-read from the database
+EXAM_RUNTIME_TTL = int(os.environ.get('EXAM_RUNTIME_TTL', 15))
+
+# Start-of-exam admission control (apps/tests/admission.py), starts per second; 0 = unlimited
+EXAM_ADMISSION = {
+    'GLOBAL_RATE': int(os.environ.get('EXAM_ADMISSION_GLOBAL_RATE', 100)),
+    'PER_TEST_RATE': int(os.environ.get('EXAM_ADMISSION_PER_TEST_RATE', 50)),
+    'MAX_WAIT': 60,
+}
+
+# Presence heartbeats (apps/accounts/presence.py), seconds
+PRESENCE = {
+    'WRITE_INTERVAL': 15,
+    'FLUSH_INTERVAL': 60,  # flush_presence command
+    # heartbeats live in the cache only if every process shares it; otherwise last_activity is written directly
+    'STORE': 'cache' if os.environ.get('REDIS_URL') else 'db',
+}
+
+# Monitoring dashboard SSE (apps/monitoring/stream.py), seconds between pushes
+MONITORING_STREAM_TICK = 3
+# Where the page opens the stream: served by the ASGI `stream` process (Procfile)
+MONITORING_STREAM_URL = os.environ.get('MONITORING_STREAM_URL', '/api/monitoring/stream/')
+MONITORING_STREAM_TICKET_AGE = 30  # seconds a stream ticket is valid (one connection)
+MONITORING_STATS_TTL = 5  # dashboard stats cache shared by all admin sessions
+VIOLATION_DEDUPE_WINDOW = 30  # seconds; repeats of a violation type within it are merged
+PROGRESS_RECONCILE_INTERVAL = 600  # live progress counters are rebuilt from TestResult at least this often
+
+# Asynchronous grading: submit returns 202 and `manage.py grading_worker` grades
+ASYNC_GRADING = os.environ.get('ASYNC_GRADING', 'False') == 'True'
+GRADING_MAX_ATTEMPTS = 5
+GRADING_JOB_STALE_AFTER = 300  # seconds
+
+# Background report exports (`manage.py export_worker`), artifacts reused while the data is unchanged
+EXPORT_MAX_ATTEMPTS = 3
+EXPORT_RETRY_DELAY = 30  # seconds before the first retry of a failed build, doubled per attempt
+EXPORT_JOB_STALE_AFTER = 1800  # seconds
+EXPORT_RETENTION_DAYS = 7
+
+# Grade scale overrides per report ('jamlanma', 'vedmost'); defaults in apps/results/reports.py
+GRADE_SCALES = {}
+FEED_SAFETY_LAG = 60  # seconds; the results feed holds back rows newer than this (late commits, feed.py)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -178,6 +241,26 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Proctoring snapshots are spooled in the database (SpooledSnapshot) and stored by the snapshot_writer command
+SNAPSHOT_DUPLICATE_DISTANCE = 5  # max dHash bit difference for a frame to count as unchanged
+
+# Request metrics (/metrics): per-worker files merged on scrape
+METRICS_DIR = os.environ.get('METRICS_DIR', '')  # empty = <tmp>/web2_metrics
+METRICS_FLUSH_INTERVAL = 10  # seconds between writes of a worker's totals
+METRICS_EXCLUDE_VIEWS = ('monitoring.monitoring_stream',)  # long-lived SSE connections aren't timed
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # Bearer token for the scraper; required unless DEBUG
+
+# analyze_snapshots: Haar cascade face check of stored snapshots
+FACE_ANALYSIS = {
+    'ENABLED': True,  # False if the faces process isn't deployed (compaction then doesn't wait for it)
+    'WORKERS': None,  # process pool size, None = CPU count
+    'MIN_FACE': 40,  # px, smallest face searched for in a ~300x200 frame
+    'DARK_LEVEL': 25,  # mean brightness below this = camera covered
+    'FLAT_LEVEL': 10,  # brightness std below this = camera covered (flat picture)
+    'RESCAN_WINDOW': 2000,  # ids behind the checkpoint re-checked for late-committed frames
+    'SETTLE_AFTER': 600,  # seconds since an attempt's last frame before compaction packs it
+}
+
 # CSRF Trusted Origins for Render & Railway
 CSRF_TRUSTED_ORIGINS = []
 if RENDER_EXTERNAL_HOSTNAME:
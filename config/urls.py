@@ -12,11 +12,14 @@ from apps.students.views import student_list_view, StudentViewSet
 from apps.groups.views import group_list_view, GroupViewSet
 from apps.subjects.views import subject_list_view, SubjectViewSet
 from apps.tests.views import test_list_view, TestViewSet, take_test_view, edit_test_view, QuestionViewSet, archived_tests_view
-from apps.results.views import result_list_view, TestResultViewSet, JamlanmaQaytnomaView, export_docx_view
+from apps.results.views import (
+    result_list_view, TestResultViewSet, JamlanmaQaytnomaView, export_docx_view,
+    ExportJobView, ExportJobStatusView, ExportJobDownloadView, ResultFeedView,
+)
 
 from apps.directions.views import direction_list_view, DirectionViewSet
 from apps.accounts.views import CustomTokenObtainPairView
-from apps.monitoring.views import monitoring_page_view
+from apps.monitoring.views import monitoring_page_view, metrics_view
 from apps.logs.views import log_system_view
 
 from rest_framework_simplejwt.views import (
@@ -63,9 +66,14 @@ urlpatterns = [
     path('tests/take/<int:test_id>/', take_test_view, name='take_test_page'),
     path('take/<int:test_id>/', take_test_view, name='take_test_shortcut'),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     
     # API endpoints - specific paths MUST come before router include
     path('api/results/export_docx/', export_docx_view, name='export_docx'),
+    path('api/results/feed/', ResultFeedView.as_view(), name='results-feed'),
+    path('api/results/exports/', ExportJobView.as_view(), name='export-jobs'),
+    path('api/results/exports/<uuid:receipt>/', ExportJobStatusView.as_view(), name='export-job'),
+    path('api/results/exports/<uuid:receipt>/download/', ExportJobDownloadView.as_view(), name='export-job-download'),
     path('api/', include(router.urls)),
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
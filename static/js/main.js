@@ -1,2 +1,34 @@
 // Main JS file
 console.log('UTT System loaded');
+
+// Background report export: queue a job (or reuse an identical finished one),
+// poll its progress and download the file when it is ready.
+// Give up when no export worker has picked the job up within this time.
+const EXPORT_START_TIMEOUT = 2 * 60 * 1000;
+
+async function runExportJob(kind, params, onProgress) {
+    const headers = { Authorization: `Bearer ${localStorage.getItem('access_token')}` };
+    let job = (await axios.post('/api/results/exports/', { kind, params }, { headers })).data;
+    const queuedAt = Date.now();
+
+    while (job.status === 'pending' || job.status === 'processing') {
+        if (job.status === 'pending' && !job.attempts && Date.now() - queuedAt > EXPORT_START_TIMEOUT) {
+            throw new Error("Eksport xizmati javob bermayapti. Keyinroq urinib ko'ring yoki administratorga murojaat qiling.");
+        }
+        if (onProgress) onProgress(job.progress);
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        job = (await axios.get(`/api/results/exports/${job.receipt}/`, { headers })).data;
+    }
+    if (job.status !== 'done') {
+        throw new Error(job.error || 'Eksport xatosi');
+    }
+
+    const response = await axios.get(job.download_url, { headers, responseType: 'blob' });
+    const match = /filename\*?=(?:UTF-8'')?"?([^";]+)"?/i.exec(response.headers['content-disposition'] || '');
+    const link = document.createElement('a');
+    link.href = window.URL.createObjectURL(new Blob([response.data]));
+    link.setAttribute('download', match ? decodeURIComponent(match[1]) : 'export');
+    document.body.appendChild(link);
+    link.click();
+    link.remove();
+}